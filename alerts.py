@@ -1,12 +1,95 @@
 import smtplib
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from twilio.rest import Client
 import os
 from datetime import datetime
 
+CHANNEL_NAMES = {'sms': 'SMS', 'whatsapp': 'WhatsApp', 'email': 'Email'}
+
+class SMTPConnectionPool:
+    """Keeps logged-in SMTP sessions open and reuses them across messages.
+
+    connect is a callable returning a ready (logged-in) smtplib connection.
+    Sessions idle for longer than max_idle are checked with NOOP before
+    reuse, and a send that fails because the server dropped the connection is
+    retried once on a fresh session.
+    """
+
+    def __init__(self, connect, size=2, max_idle=60.0):
+        self.connect = connect
+        self.max_idle = max_idle
+        self.slots = BoundedSemaphore(size)
+        self.idle = queue.LifoQueue()
+        self.connects = 0
+
+    def send_message(self, msg, to_addrs):
+        """Send one message and return the dict of refused recipients."""
+        with self.slots:
+            server = self._checkout()
+            try:
+                refused = server.send_message(msg, to_addrs=to_addrs)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # Only a dropped session is retried; every SMTPException is an OSError too,
+                # and resending after a refusal would deliver the message twice
+                self._close(server)
+                server = self._open()
+                try:
+                    refused = server.send_message(msg, to_addrs=to_addrs)
+                except Exception:
+                    self._close(server)
+                    raise
+            except Exception:
+                self._close(server)
+                raise
+            self.idle.put((server, time.monotonic()))
+            return refused
+
+    def close(self):
+        while True:
+            try:
+                server, _ = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(server, quit=True)
+
+    def _checkout(self):
+        try:
+            server, last_used = self.idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+        if time.monotonic() - last_used > self.max_idle:
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except Exception:
+                pass
+            self._close(server)
+            return self._open()
+        return server
+
+    def _open(self):
+        self.connects += 1
+        return self.connect()
+
+    def _close(self, server, quit=False):
+        try:
+            if quit:
+                server.quit()
+            else:
+                server.close()
+        except Exception:
+            pass
+
 class AlertSystem:
-    def __init__(self, app=None):
+    def __init__(self, app=None, twilio_client=None, smtp_factory=None):
+        # twilio_client and smtp_factory can be swapped for fakes in tests
+        self.twilio_client = twilio_client
+        self.smtp_factory = smtp_factory
         self.app = app
         if app is not None:
             self.init_app(app)
@@ -14,12 +97,18 @@ class AlertSystem:
     def init_app(self, app):
         self.app = app
         # Initialize Twilio client
-        self.twilio_client = Client(
-            app.config.get('TWILIO_ACCOUNT_SID'),
-            app.config.get('TWILIO_AUTH_TOKEN')
-        )
+        if self.twilio_client is None:
+            self.twilio_client = Client(
+                app.config.get('TWILIO_ACCOUNT_SID'),
+                app.config.get('TWILIO_AUTH_TOKEN')
+            )
         self.twilio_phone = app.config.get('TWILIO_PHONE_NUMBER')
         self.twilio_whatsapp = app.config.get('TWILIO_WHATSAPP_NUMBER')
+        # Bounded pool for the Twilio REST calls shared by every caller
+        self.twilio_executor = ThreadPoolExecutor(
+            max_workers=app.config.get('TWILIO_MAX_WORKERS', 4),
+            thread_name_prefix='twilio'
+        )
         
         # Email settings
         self.mail_server = app.config.get('MAIL_SERVER')
@@ -29,92 +118,141 @@ class AlertSystem:
         self.mail_use_tls = app.config.get('MAIL_USE_TLS', False)
         self.mail_use_ssl = app.config.get('MAIL_USE_SSL', True)
         self.mail_default_sender = app.config.get('MAIL_DEFAULT_SENDER')
+        self.smtp_pool = SMTPConnectionPool(
+            self.smtp_factory or self.connect_smtp,
+            size=app.config.get('MAIL_POOL_SIZE', 2),
+            max_idle=app.config.get('MAIL_MAX_IDLE', 60.0)
+        )
+    
+    def connect_smtp(self):
+        if self.mail_use_ssl:
+            server = smtplib.SMTP_SSL(self.mail_server, self.mail_port, timeout=30)
+        else:
+            server = smtplib.SMTP(self.mail_server, self.mail_port, timeout=30)
+            if self.mail_use_tls:
+                server.starttls()
+        
+        if self.mail_username:
+            server.login(self.mail_username, self.mail_password)
+        return server
     
     def send_sms(self, to_number, message):
-        try:
-            message = self.twilio_client.messages.create(
-                body=message,
-                from_=self.twilio_phone,
-                to=to_number
-            )
-            return True, message.sid
-        except Exception as e:
-            return False, str(e)
+        return self.twilio_executor.submit(self._create_message, message, self.twilio_phone, to_number).result()
     
     def send_whatsapp(self, to_number, message):
+        # Format WhatsApp number with 'whatsapp:' prefix
+        from_whatsapp = f"whatsapp:{self.twilio_whatsapp}"
+        to_whatsapp = f"whatsapp:{to_number}"
+        return self.twilio_executor.submit(self._create_message, message, from_whatsapp, to_whatsapp).result()
+    
+    def _create_message(self, body, from_, to):
         try:
-            # Format WhatsApp number with 'whatsapp:' prefix
-            from_whatsapp = f"whatsapp:{self.twilio_whatsapp}"
-            to_whatsapp = f"whatsapp:{to_number}"
-            
             message = self.twilio_client.messages.create(
-                body=message,
-                from_=from_whatsapp,
-                to=to_whatsapp
+                body=body,
+                from_=from_,
+                to=to
             )
             return True, message.sid
         except Exception as e:
             return False, str(e)
     
     def send_email(self, to_email, subject, message):
+        return self.send_email_batch([to_email], subject, message)[to_email]
+    
+    def send_email_batch(self, to_emails, subject, message):
+        """Send one email to several recipients over a pooled connection.
+
+        Recipients are not shown to each other. Returns a dict mapping each
+        address to (success, details).
+        """
         try:
             msg = MIMEMultipart()
             msg['From'] = self.mail_default_sender
-            msg['To'] = to_email
+            msg['To'] = to_emails[0] if len(to_emails) == 1 else 'undisclosed-recipients:;'
             msg['Subject'] = subject
             
             msg.attach(MIMEText(message, 'plain'))
             
-            if self.mail_use_ssl:
-                server = smtplib.SMTP_SSL(self.mail_server, self.mail_port)
-            else:
-                server = smtplib.SMTP(self.mail_server, self.mail_port)
-                if self.mail_use_tls:
-                    server.starttls()
-            
-            server.login(self.mail_username, self.mail_password)
-            server.send_message(msg)
-            server.quit()
-            
-            return True, "Email sent successfully"
+            refused = self.smtp_pool.send_message(msg, to_emails)
+        except smtplib.SMTPRecipientsRefused as e:
+            refused = e.recipients
         except Exception as e:
-            return False, str(e)
+            return {email: (False, str(e)) for email in to_emails}
+        
+        return {
+            email: (False, str(refused[email])) if email in refused else (True, "Email sent successfully")
+            for email in to_emails
+        }
     
-    def send_fall_alert(self, user, fall_detection, emergency_contacts):
+    def build_fall_message(self, user, fall_detection, reminder=0):
         timestamp = fall_detection.timestamp.strftime("%Y-%m-%d %H:%M:%S")
         location = fall_detection.location or "Unknown location"
         
         message = f"🚨 Fall Alert! A fall was detected for {user.username} at {timestamp}. Location: {location}. Please check on them."
+        subject = f"🚨 Fall Alert for {user.username}"
+        if reminder:
+            # Escalation of an incident nobody has acknowledged yet
+            message = f"Reminder {reminder}, still unacknowledged: {message}"
+            subject = f"{subject} (reminder {reminder})"
+        return subject, message
+    
+    def contact_channels(self, contact):
+        """Return the (channel, recipient) pairs a contact should be alerted on."""
+        channels = []
+        if contact.alert_channel in ['sms', 'all'] and contact.phone_number:
+            channels.append(('sms', contact.phone_number))
+        if contact.alert_channel in ['whatsapp', 'all'] and contact.phone_number:
+            channels.append(('whatsapp', contact.phone_number))
+        if contact.alert_channel in ['email', 'all'] and contact.email:
+            channels.append(('email', contact.email))
+        return channels
+    
+    def deliver(self, channel, recipient, message, subject=None):
+        if channel == 'sms':
+            return self.send_sms(recipient, message)
+        if channel == 'whatsapp':
+            return self.send_whatsapp(recipient, message)
+        if channel == 'email':
+            return self.send_email(recipient, subject, message)
+        return False, f"Unknown alert channel: {channel}"
+    
+    def send_fall_alert(self, user, fall_detection, emergency_contacts):
+        subject, message = self.build_fall_message(user, fall_detection)
         
-        results = []
-        
+        # Texts go out in parallel on the Twilio pool, emails share one message
+        pending = []
+        emails = []
         for contact in emergency_contacts:
-            if contact.alert_channel in ['sms', 'all'] and contact.phone_number:
-                success, details = self.send_sms(contact.phone_number, message)
-                results.append({
-                    'contact': contact.name,
-                    'method': 'SMS',
-                    'success': success,
-                    'details': details
-                })
-                
-            if contact.alert_channel in ['whatsapp', 'all'] and contact.phone_number:
-                success, details = self.send_whatsapp(contact.phone_number, message)
-                results.append({
-                    'contact': contact.name,
-                    'method': 'WhatsApp',
-                    'success': success,
-                    'details': details
-                })
-                
-            if contact.alert_channel in ['email', 'all'] and contact.email:
-                subject = f"🚨 Fall Alert for {user.username}"
-                success, details = self.send_email(contact.email, subject, message)
+            for channel, recipient in self.contact_channels(contact):
+                if channel == 'email':
+                    emails.append((contact, recipient))
+                else:
+                    from_ = self.twilio_phone
+                    to = recipient
+                    if channel == 'whatsapp':
+                        from_, to = f"whatsapp:{self.twilio_whatsapp}", f"whatsapp:{recipient}"
+                    future = self.twilio_executor.submit(self._create_message, message, from_, to)
+                    pending.append((contact, channel, future))
+        
+        results = []
+        if emails:
+            email_results = self.send_email_batch([email for _, email in emails], subject, message)
+            for contact, email in emails:
+                success, details = email_results[email]
                 results.append({
                     'contact': contact.name,
-                    'method': 'Email',
+                    'method': CHANNEL_NAMES['email'],
                     'success': success,
                     'details': details
                 })
+        
+        for contact, channel, future in pending:
+            success, details = future.result()
+            results.append({
+                'contact': contact.name,
+                'method': CHANNEL_NAMES[channel],
+                'success': success,
+                'details': details
+            })
                 
-        return results
\ No newline at end of file
+        return results
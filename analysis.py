@@ -0,0 +1,225 @@
+import gzip
+import json
+import os
+import queue
+import time
+import cv2
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import Thread, Lock, Event
+from models import db, VideoAnalysis, VideoFallEvent
+from video import VideoProcessor
+
+class VideoAnalyzer:
+    """Runs offline fall analysis jobs over recorded videos, much faster than real time.
+
+    A decode thread reads ahead into a bounded queue, grabbing without
+    decoding the frames that stride skips. Frames go to the shared
+    InferenceEngine a batch at a time, and nothing sleeps, so a job runs as
+    fast as decoding and inference allow. Tracking and fall timing use
+    video time, so falls are confirmed exactly as live monitoring would.
+    Each job writes a gzipped JSON results file (pose timeline and falls)
+    plus VideoAnalysis / VideoFallEvent rows.
+    """
+
+    def __init__(self, engine, app=None, results_dir='analysis_results', batch_size=8, max_jobs=1,
+                 progress_interval=2.0, confidence_threshold=0.5):
+        self.engine = engine
+        self.results_dir = results_dir
+        self.batch_size = batch_size
+        self.max_jobs = max_jobs
+        self.progress_interval = progress_interval  # seconds between progress writes to the database
+        self.confidence_threshold = confidence_threshold
+        self.lock = Lock()
+        self.jobs = {}  # analysis id -> live progress
+        self.executor = None
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.results_dir = app.config.get('ANALYSIS_RESULTS_DIR', self.results_dir)
+        self.batch_size = app.config.get('ANALYSIS_BATCH_SIZE', self.batch_size)
+        self.max_jobs = app.config.get('ANALYSIS_MAX_JOBS', self.max_jobs)
+
+    def submit(self, user_id, video_path, stride=1):
+        """Queue a video for analysis; returns the VideoAnalysis row. Needs an app context."""
+        analysis = VideoAnalysis(user_id=user_id, filename=os.path.basename(video_path), stride=stride)
+        db.session.add(analysis)
+        db.session.commit()
+
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_jobs, thread_name_prefix='analysis')
+            self.jobs[analysis.id] = {'status': 'queued', 'frames_done': 0, 'frames_total': None,
+                                      'falls': 0, 'speed': None}
+        self.executor.submit(self._run_job, analysis.id, video_path, stride)
+        return analysis
+
+    def progress(self, analysis_id):
+        """Live progress of a job started by this process, or None."""
+        with self.lock:
+            job = self.jobs.get(analysis_id)
+            return dict(job) if job is not None else None
+
+    def _update(self, analysis_id, **changes):
+        with self.lock:
+            self.jobs[analysis_id].update(changes)
+
+    def _run_job(self, analysis_id, video_path, stride):
+        with self.app.app_context():
+            try:
+                self._analyze(analysis_id, video_path, stride)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error analysing {video_path}: {e}")
+                analysis = db.session.get(VideoAnalysis, analysis_id)
+                analysis.status = 'failed'
+                analysis.error = str(e)
+                analysis.finished_at = datetime.utcnow()
+                db.session.commit()
+                self._update(analysis_id, status='failed', error=str(e))
+            finally:
+                db.session.remove()
+
+    def _analyze(self, analysis_id, video_path, stride):
+        analysis = db.session.get(VideoAnalysis, analysis_id)
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError(f'Cannot open video {os.path.basename(video_path)}')
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frames_total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+
+        analysis.status = 'running'
+        analysis.started_at = datetime.utcnow()
+        analysis.frames_total = frames_total
+        db.session.commit()
+        self._update(analysis_id, status='running', frames_total=frames_total)
+
+        frames = queue.Queue(maxsize=self.batch_size * 4)
+        stop = Event()
+        reader = Thread(target=self._decode, args=(cap, stride, frames, stop), name='analysis-decode', daemon=True)
+        reader.start()
+        try:
+            timeline, falls, frames_done, elapsed = self._consume(analysis, fps, frames)
+        finally:
+            # Also when inference failed: let the reader stop and release the video
+            stop.set()
+            while True:
+                try:
+                    frames.get_nowait()
+                except queue.Empty:
+                    break
+            reader.join()
+
+        results_path = self._write_results(analysis_id, {
+            'video': analysis.filename,
+            'fps': fps,
+            'stride': stride,
+            'frames': frames_done,
+            'duration': round(frames_done / fps, 3),
+            'analysis_seconds': round(elapsed, 3),
+            'timeline_fields': ['time', 'person_id', 'pose'],
+            'timeline': timeline,
+            'fall_fields': ['time', 'person_id'],
+            'falls': falls
+        })
+
+        for video_time, person_id in falls:
+            db.session.add(VideoFallEvent(analysis_id=analysis_id, video_time=video_time, person_id=person_id))
+        analysis.status = 'done'
+        analysis.frames_done = frames_done
+        analysis.frames_total = frames_total or frames_done
+        analysis.video_duration = frames_done / fps
+        analysis.fall_count = len(falls)
+        analysis.results_path = results_path
+        analysis.finished_at = datetime.utcnow()
+        db.session.commit()
+        self._update(analysis_id, status='done', frames_done=frames_done,
+                     frames_total=analysis.frames_total, falls=len(falls))
+
+    def _consume(self, analysis, fps, frames):
+        # Returns (timeline, falls, frames_done, elapsed seconds).
+        # Fresh tracker and fall detector per video, driven by video time
+        processor = VideoProcessor(self.engine, None, confidence_threshold=self.confidence_threshold)
+        timeline = []  # [time, person_id, pose] whenever someone's pose changes
+        falls = []  # [time, person_id] when someone is newly confirmed fallen
+        poses = {}
+        fallen = set()
+        frames_done = 0
+        frames_read = 0
+        started = time.perf_counter()
+        last_report = started
+
+        finished = False
+        while not finished:
+            batch = []
+            while len(batch) < self.batch_size:
+                index, frame = frames.get()
+                if frame is None:
+                    finished = True
+                    frames_read = index
+                    break
+                batch.append((index, frame))
+
+            futures = [self.engine.submit(frame) for _, frame in batch]
+            for (index, _), future in zip(batch, futures):
+                result = future.result()[0]
+                video_time = index / fps
+                people = processor.track_people(result, now=video_time)
+                for person in people:
+                    if poses.get(person['id']) != person['pose']:
+                        poses[person['id']] = person['pose']
+                        timeline.append([round(video_time, 3), person['id'], person['pose']])
+                now_fallen = {person['id'] for person in people if person['fallen']}
+                for person_id in sorted(now_fallen - fallen):
+                    falls.append([round(video_time, 3), person_id])
+                fallen = now_fallen
+            frames_done = frames_read if finished else batch[-1][0] + 1
+
+            elapsed = time.perf_counter() - started
+            self._update(analysis.id, frames_done=frames_done, falls=len(falls),
+                         speed=round(frames_done / fps / elapsed, 2) if elapsed else None)
+            if time.perf_counter() - last_report >= self.progress_interval:
+                last_report = time.perf_counter()
+                analysis.frames_done = frames_done
+                analysis.fall_count = len(falls)
+                db.session.commit()
+
+        return timeline, falls, frames_done, time.perf_counter() - started
+
+    def _decode(self, cap, stride, frames, stop):
+        index = 0
+        try:
+            while not stop.is_set():
+                if index % stride:
+                    # Skipped frames are only grabbed, never decoded
+                    if not cap.grab():
+                        break
+                else:
+                    success, frame = cap.read()
+                    if not success:
+                        break
+                    self._put(frames, (index, frame), stop)
+                index += 1
+        finally:
+            cap.release()
+            self._put(frames, (index, None), stop)  # end of video, after index frames
+
+    @staticmethod
+    def _put(frames, item, stop):
+        # Gives up once the job has stopped reading, instead of blocking on a full queue forever
+        while not stop.is_set():
+            try:
+                frames.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+
+    def _write_results(self, analysis_id, results):
+        os.makedirs(self.results_dir, exist_ok=True)
+        path = os.path.join(self.results_dir, f'analysis_{analysis_id}.json.gz')
+        with gzip.open(path, 'wt', encoding='utf-8') as results_file:
+            json.dump(results, results_file, separators=(',', ':'))
+        return path
@@ -0,0 +1,358 @@
+"""Model backends for CPU inference, and the tools to build and check them.
+
+The model runs as the PyTorch weights (MODEL_PATH), or as a graph
+exported for ONNX Runtime or OpenVINO, optionally quantized to INT8:
+
+    python backends.py export --format onnx
+    python backends.py export --format openvino --int8 --samples samples/fall.mp4
+    python backends.py parity --format openvino --int8 --samples samples/fall.mp4
+
+then set MODEL_BACKEND (and MODEL_INT8) in main.py. INT8 calibration and
+the parity check run on sample frames from a video or a directory of
+images; export runs the parity check itself when given --samples.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+import cv2
+import numpy as np
+from pathlib import Path
+from tracker import PersonTracker
+
+KINDS = ('pytorch', 'onnx', 'openvino')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+class ModelBackend:
+    """Which runtime serves the model, at what input size and with how many threads.
+
+    Exported graphs sit next to the weights and are named after them
+    (ok.onnx, ok_int8.onnx, ok_openvino_model/, ok_int8_openvino_model/),
+    each with a JSON file beside it (ok.onnx.json) recording the task of
+    the weights, since ultralytics cannot tell detect from pose by a path.
+    They are exported with dynamic shapes, so frames are still batched and
+    ROI crops still run at their smaller size; imgsz is the input size for
+    full frames. threads caps the CPU threads of one model copy, which
+    matters when several inference workers share a box.
+    """
+
+    def __init__(self, kind='pytorch', weights='ok.pt', imgsz=640, threads=None, int8=False):
+        if kind not in KINDS:
+            raise ValueError(f'Unknown model backend {kind}')
+        if int8 and kind == 'pytorch':
+            raise ValueError('INT8 needs an exported backend (onnx or openvino)')
+        self.kind = kind
+        self.weights = weights
+        self.imgsz = imgsz
+        self.threads = threads
+        self.int8 = int8
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['MODEL_BACKEND'], config['MODEL_PATH'], config['MODEL_IMGSZ'],
+                   config['MODEL_THREADS'], config['MODEL_INT8'])
+
+    @property
+    def path(self):
+        """What YOLO() loads: the weights themselves, or the exported graph."""
+        if self.kind == 'pytorch':
+            return self.weights
+        stem = os.path.splitext(self.weights)[0] + ('_int8' if self.int8 else '')
+        return f'{stem}.onnx' if self.kind == 'onnx' else f'{stem}_openvino_model'
+
+    @property
+    def info_path(self):
+        """Where export() records what the exported graph was made from."""
+        return f'{self.path}.json'
+
+    def task(self):
+        """The task of the weights (detect, pose...), as recorded at export time."""
+        if self.kind == 'pytorch' or not os.path.exists(self.info_path):
+            # Exported before the task was recorded: ask the weights
+            from ultralytics import YOLO
+            return YOLO(self.weights).task
+        with open(self.info_path) as info:
+            return json.load(info)['task']
+
+    def __str__(self):
+        return f"{self.kind}{' int8' if self.int8 else ''} ({self.path}, imgsz {self.imgsz})"
+
+    def load(self):
+        from ultralytics import YOLO
+        import torch
+
+        if self.threads:
+            torch.set_num_threads(self.threads)  # the PyTorch model, and pre/post-processing for every backend
+        if self.kind == 'pytorch':
+            return YOLO(self.path)
+
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"{self.path} not found, create it with 'python backends.py export "
+                                    f"--format {self.kind}{' --int8' if self.int8 else ''}'")
+        model = YOLO(self.path, task=self.task())
+        # The runtime session is only created by the first call
+        model(np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8), imgsz=self.imgsz, verbose=False)
+        if self.threads:
+            self._limit_threads(model)
+        return model
+
+    def _limit_threads(self, model):
+        # ultralytics creates the runtime without a thread setting, so recreate it with one
+        runtime = model.predictor.model
+        runtime = getattr(runtime, 'backend', runtime)  # newer ultralytics wraps each runtime
+        try:
+            if self.kind == 'onnx':
+                import onnxruntime
+                options = onnxruntime.SessionOptions()
+                options.intra_op_num_threads = self.threads
+                options.inter_op_num_threads = 1
+                runtime.session = onnxruntime.InferenceSession(self.path, options,
+                                                               providers=runtime.session.get_providers())
+            else:
+                import openvino as ov
+                core = ov.Core()
+                graph = core.read_model(next(Path(self.path).glob('*.xml')))
+                runtime.ov_compiled_model = core.compile_model(graph, 'CPU', {
+                    'PERFORMANCE_HINT': 'LATENCY',
+                    'INFERENCE_NUM_THREADS': self.threads
+                })
+        except AttributeError as e:
+            print(f"Could not limit {self.kind} to {self.threads} threads with this ultralytics version: {e}")
+
+def export(backend, samples=()):
+    """Build backend.path from backend.weights. INT8 calibrates on the sample frames."""
+    from ultralytics import YOLO
+
+    if backend.kind == 'pytorch':
+        raise ValueError('The pytorch backend runs the weights as they are')
+    if backend.int8 and not len(samples):
+        raise ValueError('INT8 quantization needs sample frames to calibrate on')
+
+    model = YOLO(backend.weights)
+    head = f'model.{len(model.model.model) - 1}'  # box and keypoint decoding; stays in float
+    exported = model.export(format=backend.kind, imgsz=backend.imgsz, dynamic=True)
+    if not backend.int8:
+        if os.path.abspath(exported) != os.path.abspath(backend.path):
+            shutil.move(exported, backend.path)
+    else:
+        inputs = [_preprocess(frame, backend.imgsz) for frame in samples]
+        if backend.kind == 'onnx':
+            _quantize_onnx(exported, backend.path, inputs, head)
+        else:
+            _quantize_openvino(exported, backend.path, inputs, head)
+
+    with open(backend.info_path, 'w') as info:
+        json.dump({'weights': backend.weights, 'task': model.task, 'imgsz': backend.imgsz,
+                   'int8': backend.int8}, info, indent=2)
+    return backend.path
+
+def _quantize_onnx(source, output, inputs, head):
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    graph = onnx.load(source)
+    input_name = graph.graph.input[0].name
+
+    class SampleReader(CalibrationDataReader):
+        def __init__(self):
+            self.inputs = iter(inputs)
+
+        def get_next(self):
+            tensor = next(self.inputs, None)
+            return None if tensor is None else {input_name: tensor}
+
+    prepared = output + '.prep'
+    quant_pre_process(source, prepared)
+    quantize_static(prepared, output, SampleReader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                    nodes_to_exclude=[node.name for node in graph.graph.node
+                                      if f'/{head}/' in node.name and node.op_type != 'Conv'])
+    os.remove(prepared)
+
+    # ultralytics reads the task, class names and stride from the graph's metadata
+    quantized = onnx.load(output)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(graph.metadata_props)
+    onnx.save(quantized, output)
+
+def _quantize_openvino(source, output, inputs, head):
+    import nncf
+    import openvino as ov
+
+    xml = next(Path(source).glob('*.xml'))
+    graph = ov.Core().read_model(xml)
+    quantized = nncf.quantize(graph, nncf.Dataset(inputs), preset=nncf.QuantizationPreset.MIXED,
+                              subset_size=len(inputs), ignored_scope=nncf.IgnoredScope(
+                                  patterns=[f'.*{head}/.*/{op}' for op in ('Add', 'Sub', 'Mul', 'Div')] + ['.*/dfl.*'],
+                                  types=['Sigmoid'], validate=False))
+    os.makedirs(output, exist_ok=True)
+    ov.save_model(quantized, os.path.join(output, xml.name))
+    shutil.copy(os.path.join(source, 'metadata.yaml'), output)
+
+def _preprocess(frame, imgsz):
+    # Letterboxed like ultralytics does for a square input: RGB, CHW, 0-1
+    height, width = frame.shape[:2]
+    scale = imgsz / max(height, width)
+    resized = cv2.resize(frame, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top = (imgsz - resized.shape[0]) // 2
+    left = (imgsz - resized.shape[1]) // 2
+    canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    return np.ascontiguousarray(canvas[:, :, ::-1].transpose(2, 0, 1))[None].astype(np.float32) / 255
+
+def load_samples(path, count=64):
+    """Up to count frames, spread evenly over a video or taken from a directory of images."""
+    if os.path.isdir(path):
+        names = sorted(name for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS))
+        names = names[::max(1, len(names) // count)][:count]
+        frames = (cv2.imread(os.path.join(path, name)) for name in names)
+        return [frame for frame in frames if frame is not None]
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f'Could not open {path}')
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or count
+    wanted = set(np.linspace(0, total - 1, min(count, total)).astype(int).tolist())
+    frames = []
+    index = 0
+    while len(frames) < len(wanted) and cap.grab():
+        if index in wanted:
+            ok, frame = cap.retrieve()
+            if ok:
+                frames.append(frame)
+        index += 1
+    cap.release()
+    return frames
+
+def check_parity(reference, candidate, frames, conf=0.5, iou=0.5, min_agreement=0.95, max_keypoint_error=0.05):
+    """Compare the detections of candidate against reference on the same frames.
+
+    Detections are paired greedily by IoU. Recall and precision say how
+    many people each backend finds that the other does not, class
+    agreement how often a paired person gets the same class (person or
+    fall), and keypoint error is the mean keypoint distance as a fraction
+    of the person's height.
+    """
+    models = [(reference, reference.load()), (candidate, candidate.load())]
+    for backend, model in models:
+        _detect(model, frames[0], backend.imgsz, conf)  # warm up before timing
+
+    seconds = [0.0, 0.0]
+    counts = [0, 0]
+    ious = []
+    same_class = 0
+    keypoint_errors = []
+    for frame in frames:
+        detections = []
+        for index, (backend, model) in enumerate(models):
+            started = time.perf_counter()
+            detections.append(_detect(model, frame, backend.imgsz, conf))
+            seconds[index] += time.perf_counter() - started
+            counts[index] += len(detections[index][0])
+
+        (ref_boxes, ref_classes, ref_keypoints), (boxes, classes, keypoints) = detections
+        for i, j, overlap in _match(ref_boxes, boxes, iou):
+            ious.append(overlap)
+            same_class += int(ref_classes[i] == classes[j])
+            if ref_keypoints is not None and keypoints is not None:
+                visible = (ref_keypoints[i, :, 2] > 0.5) & (keypoints[j, :, 2] > 0.5)
+                height = ref_boxes[i, 3] - ref_boxes[i, 1]
+                if visible.any() and height > 0:
+                    distance = np.linalg.norm(ref_keypoints[i, visible, :2] - keypoints[j, visible, :2], axis=1)
+                    keypoint_errors.append(float(distance.mean() / height))
+
+    matched = len(ious)
+    report = {
+        'reference': str(reference),
+        'candidate': str(candidate),
+        'frames': len(frames),
+        'reference_detections': counts[0],
+        'candidate_detections': counts[1],
+        'matched': matched,
+        'recall': round(matched / counts[0], 4) if counts[0] else None,
+        'precision': round(matched / counts[1], 4) if counts[1] else None,
+        'mean_iou': round(float(np.mean(ious)), 4) if ious else None,
+        'class_agreement': round(same_class / matched, 4) if matched else None,
+        'keypoint_error': round(float(np.mean(keypoint_errors)), 4) if keypoint_errors else None,
+        'reference_ms': round(seconds[0] / len(frames) * 1000, 2),
+        'candidate_ms': round(seconds[1] / len(frames) * 1000, 2),
+        'speedup': round(seconds[0] / seconds[1], 2) if seconds[1] else None
+    }
+    if counts[0] == counts[1] == 0:
+        agreed = True  # nobody found by either is agreement too
+    else:
+        agreed = all(report[key] is not None and report[key] >= min_agreement
+                     for key in ('recall', 'precision', 'class_agreement'))
+    report['passed'] = agreed and (report['keypoint_error'] is None or report['keypoint_error'] <= max_keypoint_error)
+    return report
+
+def _detect(model, frame, imgsz, conf):
+    result = model(frame, imgsz=imgsz, conf=conf, verbose=False)[0]
+    keypoints = result.keypoints.data.cpu().numpy() if result.keypoints is not None else None
+    return result.boxes.xyxy.cpu().numpy(), result.boxes.cls.cpu().numpy().astype(int), keypoints
+
+def _match(boxes_a, boxes_b, threshold):
+    # Greedy: the best remaining overlap first
+    if not len(boxes_a) or not len(boxes_b):
+        return []
+    overlaps = PersonTracker.iou(boxes_a, boxes_b)
+    pairs = []
+    while True:
+        i, j = np.unravel_index(np.argmax(overlaps), overlaps.shape)
+        if overlaps[i, j] < threshold:
+            return pairs
+        pairs.append((i, j, float(overlaps[i, j])))
+        overlaps[i, :] = -1
+        overlaps[:, j] = -1
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['export', 'parity'])
+    parser.add_argument('--format', choices=['onnx', 'openvino'], required=True)
+    parser.add_argument('--weights', default='ok.pt', help='PyTorch weights to export and compare against')
+    parser.add_argument('--int8', action='store_true', help='quantize to INT8, calibrated on --samples')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--threads', type=int, help='CPU threads per model while checking parity')
+    parser.add_argument('--samples', help='video or directory of images to calibrate and check parity on')
+    parser.add_argument('--max-samples', type=int, default=64)
+    parser.add_argument('--conf', type=float, default=0.5, help='confidence threshold, as in VideoProcessor')
+    parser.add_argument('--min-agreement', type=float, default=0.95,
+                        help='lowest recall, precision and class agreement that passes')
+    parser.add_argument('--max-keypoint-error', type=float, default=0.05,
+                        help='largest mean keypoint error, as a fraction of person height, that passes')
+    parser.add_argument('--output', help='also write the parity report to this JSON file')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ['CUDA_VISIBLE_DEVICES'] = ''  # these backends are for CPU servers; measure them there
+
+    backend = ModelBackend(args.format, args.weights, args.imgsz, args.threads, args.int8)
+    samples = load_samples(args.samples, args.max_samples) if args.samples else []
+    if args.samples and not samples:
+        sys.exit(f'No frames found in {args.samples}')
+
+    if args.command == 'export':
+        print(f'Exporting {args.weights} to {backend}...')
+        print(f'Wrote {export(backend, samples)}')
+        if not samples:
+            return
+    elif not samples:
+        sys.exit('The parity check needs --samples')
+
+    reference = ModelBackend('pytorch', args.weights, args.imgsz, args.threads)
+    print(f'Comparing {backend} with {reference} on {len(samples)} frames...')
+    report = check_parity(reference, backend, samples, conf=args.conf, min_agreement=args.min_agreement,
+                          max_keypoint_error=args.max_keypoint_error)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    if not report['passed']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
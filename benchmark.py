@@ -0,0 +1,517 @@
+"""Offline benchmarks for the detection pipeline.
+
+Runs on CPU with synthetic frames (or recorded clips), synthetic keypoint
+sets and stubbed alert channels, and writes the results of a run to one
+JSON file so runs can be compared over time:
+
+    python benchmark.py --cameras 1 4 16 --duration 10 --output bench.json
+    python benchmark.py --model ok.pt --clip samples/fall.mp4
+    python benchmark.py --model ok.pt --backend openvino --int8 --threads 2
+
+Without --model, detections come from a synthetic engine, so the numbers
+cover everything around the model: tracking, pose classification,
+drawing and JPEG encoding.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import torch
+from concurrent.futures import Future
+from datetime import datetime
+from threading import Thread, Event, Lock
+from ultralytics.engine.results import Results
+from sources import FrameSource, Pacer
+
+# Standing person in a unit box, COCO keypoint order
+STANDING_KEYPOINTS = np.array([
+    [0.50, 0.08], [0.47, 0.06], [0.53, 0.06], [0.44, 0.07], [0.56, 0.07],
+    [0.38, 0.20], [0.62, 0.20], [0.33, 0.35], [0.67, 0.35], [0.32, 0.48],
+    [0.68, 0.48], [0.42, 0.52], [0.58, 0.52], [0.42, 0.72], [0.58, 0.72],
+    [0.42, 0.95], [0.58, 0.95]
+])
+NAMES = {0: 'person', 1: 'fall'}
+
+def max_rss_mb():
+    # High-water mark of the whole process; ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def summarize(samples):
+    """Latency percentiles in milliseconds for a list of durations in seconds."""
+    if not samples:
+        return {'count': 0}
+    values = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        'count': len(values),
+        'mean_ms': round(float(values.mean()), 3),
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'max_ms': round(float(values.max()), 3)
+    }
+
+class LatencyRecorder:
+    """Collects call durations per stage name from any number of threads."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.samples = {}
+
+    def record(self, stage, elapsed):
+        with self.lock:
+            self.samples.setdefault(stage, []).append(elapsed)
+
+    def wrap(self, obj, method, stage):
+        # Time every call of obj.method, on this instance only
+        original = getattr(obj, method)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - started)
+
+        setattr(obj, method, timed)
+
+    def summary(self):
+        with self.lock:
+            return {stage: summarize(samples) for stage, samples in self.samples.items()}
+
+def person_keypoints(box, lying=False, noise=0.0, rng=None):
+    """(17, 3) keypoints for one person filling box; lying people are rotated 90 degrees."""
+    x1, y1, x2, y2 = box
+    points = STANDING_KEYPOINTS[:, ::-1] if lying else STANDING_KEYPOINTS
+    if noise and rng is not None:
+        points = points + rng.normal(0, noise, points.shape)
+    keypoints = np.empty((17, 3), dtype=np.float32)
+    keypoints[:, 0] = x1 + points[:, 0] * (x2 - x1)
+    keypoints[:, 1] = y1 + points[:, 1] * (y2 - y1)
+    keypoints[:, 2] = 0.9
+    return keypoints
+
+def synthetic_keypoint_sets(count, rng):
+    """Mix of standing, lying and partly missing skeletons, shape (count, 17, 3)."""
+    sets = np.empty((count, 17, 3), dtype=np.float32)
+    for i in range(count):
+        kind = i % 3
+        box = (100, 50, 220, 400) if kind != 1 else (50, 300, 400, 420)
+        sets[i] = person_keypoints(box, lying=kind == 1, noise=0.02, rng=rng)
+        if kind == 2 and i % 6 == 2:
+            sets[i, 11:13] = 0  # hips missing: UNKNOWN
+    return sets
+
+class SyntheticEngine:
+    """Stands in for InferenceEngine, returning walking people, one of whom keeps falling.
+
+    Builds real ultralytics Results, so tracking, pose classification and
+    drawing run exactly as they would on model output.
+    """
+
+    def __init__(self, people=2, cycle=300):
+        self.names = NAMES
+        self.people = people
+        self.cycle = cycle  # calls per walk-fall cycle; the first person lies for the second half
+        self.calls = 0
+        self.lock = Lock()
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def submit(self, frame, imgsz=None):
+        with self.lock:
+            self.calls += 1
+            step = self.calls
+        height, width = frame.shape[:2]
+        boxes, keypoints = [], []
+        for person in range(self.people):
+            lying = person == 0 and step % self.cycle >= self.cycle // 2
+            box_width, box_height = (width * 0.4, height * 0.2) if lying else (width * 0.15, height * 0.6)
+            # Walkers cross the frame; a fallen person stays put so the tracker keeps their ID
+            x1 = 10.0 if lying else (person * width / self.people + step * 2) % max(1.0, width - box_width)
+            y1 = height - box_height - 10
+            box = (x1, y1, x1 + box_width, y1 + box_height)
+            boxes.append([*box, 0.9, 1 if lying else 0])
+            keypoints.append(person_keypoints(box, lying=lying))
+        future = Future()
+        future.set_result([Results(
+            frame,
+            path='',
+            names=self.names,
+            boxes=torch.tensor(boxes, dtype=torch.float32),
+            keypoints=torch.from_numpy(np.stack(keypoints))
+        )])
+        return future
+
+    def infer(self, frame, imgsz=None, timeout=None):
+        return self.submit(frame, imgsz).result(timeout=timeout)
+
+def make_engine(args):
+    if args.model is None:
+        return SyntheticEngine(people=args.people)
+    from backends import ModelBackend
+    from inference import InferenceEngine
+    backend = ModelBackend(args.backend, args.model, args.imgsz, args.threads, args.int8)
+    return InferenceEngine(backend, max_batch_size=args.batch_size)
+
+class SyntheticSource(FrameSource):
+    """Frames with moving content at target_fps (None: flat out), so the encoder never sees a repeat."""
+
+    def __init__(self, width, height, target_fps=None, variants=30, seed=0):
+        rng = np.random.default_rng(seed)
+        # A gradient with mild sensor noise compresses like a real room, unlike pure noise
+        gradient = np.linspace(40, 200, width, dtype=np.float32)[np.newaxis, :, np.newaxis]
+        base = np.clip(gradient + rng.normal(0, 8, (height, width, 3)), 0, 255).astype(np.uint8)
+        self.pacer = Pacer(target_fps)
+        self.frames = []
+        for i in range(variants):
+            frame = base.copy()
+            x = i * (width - 80) // variants
+            frame[height // 3:height // 3 + 80, x:x + 80] = (0, 0, 255)
+            self.frames.append(frame)
+        self.index = 0
+
+    def get_frame(self):
+        time.sleep(self.pacer.delay())
+        self.index += 1
+        # A fresh buffer per frame, like a decoder would return
+        return self.frames[self.index % len(self.frames)].copy()
+
+def make_source(args, camera_index):
+    if args.clip:
+        from sources import StreamSource
+        return StreamSource(args.clip[camera_index % len(args.clip)], target_fps=args.camera_fps or None,
+                            loop=True, live=False)
+    return SyntheticSource(args.width, args.height, target_fps=args.camera_fps or None, seed=camera_index)
+
+def bench_pose(args):
+    from fall_detector import FallDetector
+    rng = np.random.default_rng(0)
+    detector = FallDetector()
+    keypoint_sets = synthetic_keypoint_sets(args.pose_samples, rng)
+    results = {}
+
+    samples = []
+    started = time.perf_counter()
+    for keypoints in keypoint_sets:
+        call_started = time.perf_counter()
+        detector.determine_pose(keypoints)
+        samples.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    results['single'] = dict(summarize(samples), people_per_sec=round(len(keypoint_sets) / elapsed, 1))
+
+    for batch_size in (4, 16, 64):
+        samples = []
+        started = time.perf_counter()
+        for offset in range(0, len(keypoint_sets) - batch_size + 1, batch_size):
+            call_started = time.perf_counter()
+            detector.determine_pose_batch(keypoint_sets[offset:offset + batch_size])
+            samples.append(time.perf_counter() - call_started)
+        elapsed = time.perf_counter() - started
+        results[f'batch_{batch_size}'] = dict(
+            summarize(samples), people_per_sec=round(len(samples) * batch_size / elapsed, 1))
+    return results
+
+def bench_encode(args):
+    from encoder import FrameEncoder, DEFAULT_PROFILES
+    results = {}
+    for width, height in ((640, 480), (1280, 720)):
+        source = SyntheticSource(width, height)
+        frames = [source.get_frame() for _ in range(len(source.frames))]
+        for name in DEFAULT_PROFILES:
+            encoder = FrameEncoder(DEFAULT_PROFILES)
+            samples, sizes = [], []
+            for i in range(args.encode_frames):
+                started = time.perf_counter()
+                chunks = encoder.encode(frames[i % len(frames)], [name])
+                samples.append(time.perf_counter() - started)
+                sizes.extend(len(chunk) for chunk in chunks.values())
+            results[f'{width}x{height}_{name}'] = dict(
+                summarize(samples),
+                frames_per_sec=round(len(samples) / sum(samples), 1),
+                avg_bytes=int(np.mean(sizes)) if sizes else 0)
+    return results
+
+def bench_pipeline(args, cameras):
+    """Run camera pipelines flat out for args.duration seconds with viewers attached."""
+    from encoder import DEFAULT_PROFILES
+    from events import EventBus
+    from pipeline import CameraPipeline
+    from video import VideoProcessor
+
+    engine = make_engine(args)
+    recorder = LatencyRecorder()
+    event_bus = EventBus()
+    falls = []
+    event_bus.subscribe('fall_detected', lambda payload: falls.append(payload['camera_id']))
+
+    pipelines, viewers = [], []
+    stop = Event()
+    delivered = {'chunks': 0, 'bytes': 0}
+    delivered_lock = Lock()
+
+    def watch(pipeline, slot):
+        while not stop.is_set():
+            chunk = slot.get(timeout=0.5)
+            if chunk is not None:
+                with delivered_lock:
+                    delivered['chunks'] += 1
+                    delivered['bytes'] += len(chunk)
+
+    rss_before = max_rss_mb()
+    for camera_id in range(cameras):
+        source = make_source(args, camera_id)
+        processor = VideoProcessor(engine, None, event_bus=event_bus)
+        recorder.wrap(source, 'get_frame', 'capture')
+        recorder.wrap(processor, 'infer', 'inference')
+        recorder.wrap(processor, 'track_people', 'tracking_and_pose')
+        recorder.wrap(processor, 'annotate', 'draw')
+        recorder.wrap(processor, 'process_frame', 'infer_stage')
+        pipeline = CameraPipeline(camera_id, source, processor, profiles=DEFAULT_PROFILES)
+        recorder.wrap(pipeline.encoder, 'encode', 'encode')
+        pipelines.append(pipeline)
+        for profile in ('full', 'thumb'):
+            slot = pipeline.subscribe(profile)
+            viewers.append(Thread(target=watch, args=(pipeline, slot), daemon=True))
+
+    started = time.perf_counter()
+    for pipeline in pipelines:
+        pipeline.start()
+    for viewer in viewers:
+        viewer.start()
+    time.sleep(args.duration)
+    elapsed = time.perf_counter() - started
+    stats = [pipeline.get_stats() for pipeline in pipelines]
+    stop.set()
+    for pipeline in pipelines:
+        pipeline.stop()
+    for viewer in viewers:
+        viewer.join()
+
+    inferred = [camera['infer']['processed'] for camera in stats]
+    return {
+        'cameras': cameras,
+        'seconds': round(elapsed, 2),
+        'fps_total': round(sum(inferred) / elapsed, 2),
+        'fps_per_camera': round(sum(inferred) / elapsed / cameras, 2),
+        'fps_min_camera': round(min(inferred) / elapsed, 2),
+        'frames_captured': sum(camera['capture']['processed'] for camera in stats),
+        'frames_inferred': sum(inferred),
+        'frames_encoded': sum(camera['encode']['processed'] for camera in stats),
+        'dropped': {stage: sum(camera[stage]['dropped'] for camera in stats)
+                    for stage in CameraPipeline.STAGES},
+        'errors': {stage: sum(camera[stage]['errors'] for camera in stats)
+                   for stage in CameraPipeline.STAGES},
+        'viewer_chunks': delivered['chunks'],
+        'viewer_mbytes': round(delivered['bytes'] / 1e6, 2),
+        'fall_events': len(falls),
+        'latency': recorder.summary(),
+        'max_rss_mb': max_rss_mb(),
+        'max_rss_growth_mb': round(max_rss_mb() - rss_before, 1)
+    }
+
+class StubTwilio:
+    """Records when each SMS/WhatsApp message would have been sent."""
+
+    def __init__(self, on_send):
+        self.messages = self
+        self.on_send = on_send
+        self.sent = 0
+
+    def create(self, body, from_, to):
+        self.on_send()
+        self.sent += 1
+        return type('Message', (), {'sid': f'SM{self.sent}'})()
+
+class StubSMTP:
+    def __init__(self, on_send):
+        self.on_send = on_send
+
+    def send_message(self, msg, to_addrs=None):
+        for _ in to_addrs:
+            self.on_send()
+        return {}
+
+    def noop(self):
+        return (250, b'OK')
+
+    def close(self):
+        pass
+
+    def quit(self):
+        pass
+
+def bench_alerts(args):
+    """Latency from a fall being submitted to its alerts reaching the (stubbed) channels.
+
+    Follows the production path: write batcher -> outbox rows in the same
+    commit -> dispatcher woken after the commit -> channel send.
+    """
+    from flask import Flask
+    from alerts import AlertSystem
+    from dispatcher import AlertDispatcher
+    from models import db, User, EmergencyContact, FallDetection
+    from storage import WriteBehindBatcher, configure_sqlite
+
+    workdir = tempfile.mkdtemp(prefix='fall-bench-')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    configure_sqlite(app)
+
+    lock = Lock()
+    arrivals = []
+    arrived = Event()
+    expected = {'count': 0}
+
+    def on_send():
+        with lock:
+            arrivals.append(time.perf_counter())
+            if len(arrivals) >= expected['count']:
+                arrived.set()
+
+    alert_system = AlertSystem(app, twilio_client=StubTwilio(on_send), smtp_factory=lambda: StubSMTP(on_send))
+    dispatcher = AlertDispatcher(alert_system, app)
+    batcher = WriteBehindBatcher(app)
+
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com')
+        user.set_password('bench')
+        db.session.add(user)
+        db.session.flush()
+        for i in range(args.alert_contacts):
+            db.session.add(EmergencyContact(user_id=user.id, name=f'Contact {i}',
+                                            phone_number=f'+1555000{i:04d}', email=f'contact{i}@example.com',
+                                            alert_channel='all'))
+        db.session.commit()
+        user_id = user.id
+
+    def store(user_id):
+        user = db.session.get(User, user_id)
+        fall_detection = FallDetection(user_id=user.id, location='Bench', severity='High')
+        db.session.add(fall_detection)
+        return len(dispatcher.enqueue_fall_alert(user, fall_detection, user.emergency_contacts, commit=False))
+
+    first, last = [], []
+    channels_per_fall = args.alert_contacts * 3
+    try:
+        for _ in range(args.alert_trials):
+            with lock:
+                arrivals.clear()
+                expected['count'] = channels_per_fall
+                arrived.clear()
+            started = time.perf_counter()
+            future = batcher.submit(store, user_id)
+            future.add_done_callback(lambda future: dispatcher.wake(future.result()))
+            if not arrived.wait(10):
+                raise RuntimeError('Alerts did not arrive within 10s')
+            with lock:
+                first.append(arrivals[0] - started)
+                last.append(arrivals[-1] - started)
+    finally:
+        dispatcher.stop()
+        batcher.stop()
+        alert_system.twilio_executor.shutdown()
+
+    return {
+        'trials': args.alert_trials,
+        'alerts_per_fall': channels_per_fall,
+        'first_alert': summarize(first),
+        'all_alerts': summarize(last)
+    }
+
+def run_metadata(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'started_at': datetime.utcnow().isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'torch_threads': torch.get_num_threads(),
+        'model': args.model or 'synthetic',
+        'backend': args.backend if args.model else None,
+        'frame_size': None if args.clip else [args.width, args.height],
+        'clips': args.clip,
+        'args': vars(args)
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suite', nargs='+', default=['pose', 'encode', 'pipeline', 'alerts'],
+                        choices=['pose', 'encode', 'pipeline', 'alerts'])
+    parser.add_argument('--cameras', nargs='+', type=int, default=[1, 4],
+                        help='camera counts to run the pipeline benchmark with')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per pipeline run')
+    parser.add_argument('--model', help='YOLO weights; synthetic detections when omitted')
+    parser.add_argument('--batch-size', type=int, default=4, help='inference micro-batch size with --model')
+    parser.add_argument('--backend', choices=['pytorch', 'onnx', 'openvino'], default='pytorch',
+                        help='runtime for --model; exported graphs come from backends.py export')
+    parser.add_argument('--int8', action='store_true', help='use the INT8 export of --backend')
+    parser.add_argument('--imgsz', type=int, default=640, help='model input size for full frames')
+    parser.add_argument('--threads', type=int, help='CPU threads for the model')
+    parser.add_argument('--clip', action='append', help='recorded clip to use instead of synthetic frames; repeat for more')
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--camera-fps', type=float, default=15.0,
+                        help='frames per second each camera delivers; 0 for as fast as possible')
+    parser.add_argument('--people', type=int, default=2, help='people per synthetic frame')
+    parser.add_argument('--pose-samples', type=int, default=6000)
+    parser.add_argument('--encode-frames', type=int, default=300)
+    parser.add_argument('--alert-trials', type=int, default=50)
+    parser.add_argument('--alert-contacts', type=int, default=2)
+    parser.add_argument('--gpu', action='store_true', help='allow CUDA; by default the run is CPU only')
+    parser.add_argument('--output', default='benchmark_results.json')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.gpu:
+        os.environ['CUDA_VISIBLE_DEVICES'] = ''
+
+    report = {'meta': run_metadata(args), 'results': {}}
+    results = report['results']
+    if 'pose' in args.suite:
+        print('Benchmarking pose classification...')
+        results['pose'] = bench_pose(args)
+    if 'encode' in args.suite:
+        print('Benchmarking JPEG encoding...')
+        results['encode'] = bench_encode(args)
+    if 'pipeline' in args.suite:
+        results['pipeline'] = {}
+        for cameras in args.cameras:
+            print(f'Benchmarking pipeline with {cameras} camera(s) for {args.duration:.0f}s...')
+            run = bench_pipeline(args, cameras)
+            results['pipeline'][str(cameras)] = run
+            print(f"  {run['fps_total']} fps total, {run['fps_per_camera']} per camera, "
+                  f"infer p95 {run['latency'].get('infer_stage', {}).get('p95_ms')} ms")
+    if 'alerts' in args.suite:
+        print('Benchmarking alert latency...')
+        results['alerts'] = bench_alerts(args)
+        print(f"  all alerts p95 {results['alerts']['all_alerts']['p95_ms']} ms")
+    report['meta']['max_rss_mb'] = max_rss_mb()
+
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
+    print(f'Wrote {args.output}')
+
+if __name__ == '__main__':
+    main()
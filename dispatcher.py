@@ -0,0 +1,242 @@
+import queue
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Thread, Event, Lock
+from models import db, AlertOutbox, AlertAttempt
+from metrics import registry
+
+ALERT_DELIVERY_SECONDS = registry.histogram('alert_delivery_seconds', 'Time for one send call to a channel',
+                                            ['channel'], stage='alerts')
+ALERT_LATENCY_SECONDS = registry.histogram('alert_latency_seconds',
+                                           'Time from queueing an alert to its successful delivery',
+                                           ['channel'], stage='alerts')
+ALERTS = registry.counter('alerts_total', 'Alert delivery attempts by outcome (sent, retry, failed)',
+                          ['channel', 'result'], stage='alerts')
+ALERTS_RATE_LIMITED = registry.counter('alerts_rate_limited_total', 'Alerts held back by the channel rate limit',
+                                       ['channel'], stage='alerts')
+
+class AlertDispatcher:
+    """Delivers fall alerts in the background from a durable outbox table.
+
+    Enqueuing only writes AlertOutbox rows, so callers return immediately.
+    A dispatcher thread claims due rows and hands them to a thread pool that
+    sends across contacts and channels concurrently. Every attempt is logged
+    as an AlertAttempt, and failures are retried with exponential backoff.
+    All database writes happen on the dispatcher thread. The number of
+    pending rows is counted once at start and then kept up to date here, so
+    reading it never touches the database.
+    """
+
+    def __init__(self, alert_system, app=None, max_workers=8, max_attempts=5,
+                 base_delay=5.0, max_delay=300.0, poll_interval=1.0, rate_limiter=None):
+        self.alert_system = alert_system
+        self.rate_limiter = rate_limiter  # optional ChannelRateLimiter
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay  # seconds before the first retry
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.results = queue.Queue()
+        self.wake_event = Event()
+        self.start_lock = Lock()
+        self.should_stop = False
+        self.in_flight = 0
+        self.pending = 0  # outbox rows waiting to be sent
+        self.pending_lock = Lock()
+        self.executor = None
+        self.dispatch_thread = None
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_workers = app.config.get('ALERT_MAX_WORKERS', self.max_workers)
+        self.max_attempts = app.config.get('ALERT_MAX_ATTEMPTS', self.max_attempts)
+        self.base_delay = app.config.get('ALERT_RETRY_BASE_DELAY', self.base_delay)
+        self.max_delay = app.config.get('ALERT_RETRY_MAX_DELAY', self.max_delay)
+
+    def start(self):
+        if self.dispatch_thread and self.dispatch_thread.is_alive():
+            return
+        with self.start_lock:
+            # wake() calls this from whichever request or camera thread queued an alert
+            if self.dispatch_thread and self.dispatch_thread.is_alive():
+                return
+            self.should_stop = False
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='alert')
+            self.dispatch_thread = Thread(target=self._run, name='alert-dispatcher', daemon=True)
+            self.dispatch_thread.start()
+
+    def stop(self):
+        self.should_stop = True
+        self.wake_event.set()
+        if self.dispatch_thread:
+            self.dispatch_thread.join()
+            self.dispatch_thread = None
+        if self.executor:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def enqueue_fall_alert(self, user, fall_detection, contacts, commit=True, reminder=0):
+        """Add outbox rows for every contact and channel; returns the rows.
+
+        With commit=False the caller commits and then calls wake().
+        """
+        db.session.flush()  # fills in the detection's id and timestamp
+        subject, message = self.alert_system.build_fall_message(user, fall_detection, reminder)
+        rows = []
+        for contact in contacts:
+            for channel, recipient in self.alert_system.contact_channels(contact):
+                row = AlertOutbox(
+                    fall_detection=fall_detection,
+                    contact_id=contact.id,
+                    channel=channel,
+                    recipient=recipient,
+                    subject=subject if channel == 'email' else None,
+                    message=message,
+                    next_attempt_at=datetime.utcnow()
+                )
+                db.session.add(row)
+                rows.append(row)
+        if commit:
+            db.session.commit()
+            self.wake(len(rows))
+        return rows
+
+    def wake(self, queued=0):
+        """Deliver newly committed alerts; queued is how many rows the caller just committed."""
+        self.start()
+        self._count_pending(queued)
+        self.wake_event.set()
+
+    def _count_pending(self, change):
+        with self.pending_lock:
+            self.pending += change
+
+    def retry_delay(self, attempts):
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)  # jitter so retries do not arrive together
+
+    def _run(self):
+        with self.app.app_context():
+            self._recover_interrupted()
+            while not self.should_stop:
+                self.wake_event.clear()
+                try:
+                    self._record_results()
+                    self._claim_due()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error dispatching alerts: {e}")
+                self.wake_event.wait(self.poll_interval)
+            self._record_results()
+            db.session.remove()
+
+    def _recover_interrupted(self):
+        # Rows left 'sending' by a crash or restart are sent again
+        AlertOutbox.query.filter_by(status='sending').update({'status': 'pending'})
+        db.session.commit()
+        with self.pending_lock:
+            self.pending = AlertOutbox.query.filter_by(status='pending').count()
+
+    def _claim_due(self):
+        capacity = self.max_workers * 2 - self.in_flight
+        if capacity <= 0:
+            return
+        rows = (AlertOutbox.query
+                .filter(AlertOutbox.status == 'pending', AlertOutbox.next_attempt_at <= datetime.utcnow())
+                .order_by(AlertOutbox.id)
+                .limit(capacity)
+                .all())
+        if not rows:
+            return
+
+        # Emails carrying the same alert go out as one message to all recipients
+        jobs = {}
+        for row in rows:
+            if self.rate_limiter is not None:
+                allowed, wait = self.rate_limiter.try_acquire(row.channel)
+                if not allowed:
+                    # Over the channel's limit: leave it queued, it is not a failed attempt
+                    ALERTS_RATE_LIMITED.labels(row.channel).inc()
+                    row.next_attempt_at = datetime.utcnow() + timedelta(seconds=wait)
+                    continue
+            row.status = 'sending'
+            row.attempts = (row.attempts or 0) + 1
+            if row.channel == 'email':
+                key = ('email', row.fall_detection_id, row.subject, row.message)
+            else:
+                key = (row.channel, row.id)
+            job = jobs.setdefault(key, {'channel': row.channel, 'message': row.message,
+                                        'subject': row.subject, 'recipients': []})
+            job['recipients'].append((row.id, row.recipient))
+        db.session.commit()
+        self._count_pending(-sum(len(job['recipients']) for job in jobs.values()))
+
+        for job in jobs.values():
+            self.in_flight += len(job['recipients'])
+            self.executor.submit(self._deliver, job['channel'], job['recipients'], job['message'], job['subject'])
+
+    def _deliver(self, channel, recipients, message, subject):
+        attempted_at = datetime.utcnow()
+        started = time.perf_counter()
+        try:
+            if channel == 'email':
+                batch = self.alert_system.send_email_batch([email for _, email in recipients], subject, message)
+                outcomes = [batch[email] for _, email in recipients]
+            else:
+                outcomes = [self.alert_system.deliver(channel, recipient, message, subject)
+                            for _, recipient in recipients]
+        except Exception as e:
+            outcomes = [(False, str(e))] * len(recipients)
+        elapsed = time.perf_counter() - started
+        ALERT_DELIVERY_SECONDS.labels(channel).observe(elapsed)
+        duration_ms = elapsed * 1000
+        for (outbox_id, _), (success, details) in zip(recipients, outcomes):
+            self.results.put((outbox_id, success, details, duration_ms, attempted_at))
+        self.wake_event.set()
+
+    def _record_results(self):
+        recorded = False
+        retried = 0
+        while True:
+            try:
+                outbox_id, success, details, duration_ms, attempted_at = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.in_flight -= 1
+            row = db.session.get(AlertOutbox, outbox_id)
+            if row is None:
+                continue
+            db.session.add(AlertAttempt(
+                outbox_id=outbox_id,
+                attempted_at=attempted_at,
+                success=success,
+                details=str(details),
+                duration_ms=duration_ms
+            ))
+            if success:
+                row.status = 'sent'
+                row.last_error = None
+                ALERTS.labels(row.channel, 'sent').inc()
+                if row.created_at is not None:
+                    ALERT_LATENCY_SECONDS.labels(row.channel).observe(
+                        (datetime.utcnow() - row.created_at).total_seconds())
+            elif row.attempts >= self.max_attempts:
+                ALERTS.labels(row.channel, 'failed').inc()
+                row.status = 'failed'
+                row.last_error = str(details)
+                print(f"Giving up on {row.channel} alert to {row.recipient} after {row.attempts} attempts: {details}")
+            else:
+                ALERTS.labels(row.channel, 'retry').inc()
+                row.status = 'pending'
+                row.last_error = str(details)
+                row.next_attempt_at = datetime.utcnow() + timedelta(seconds=self.retry_delay(row.attempts))
+                retried += 1
+            recorded = True
+        if recorded:
+            db.session.commit()
+            self._count_pending(retried)
@@ -0,0 +1,88 @@
+import cv2
+import numpy as np
+
+class EncodeProfile:
+    """JPEG settings for one kind of viewer; max_width=None keeps the frame size."""
+
+    def __init__(self, quality=80, max_width=None):
+        self.quality = quality
+        self.max_width = max_width
+
+    def __repr__(self):
+        return f'<EncodeProfile quality={self.quality} max_width={self.max_width}>'
+
+# The camera grid only needs small thumbnails; a single enlarged camera uses 'full'
+DEFAULT_PROFILES = {
+    'full': EncodeProfile(quality=85),
+    'thumb': EncodeProfile(quality=60, max_width=320)
+}
+
+# Profile that forwards the camera's own JPEGs untouched; detections travel separately
+PASSTHROUGH_PROFILE = 'original'
+
+MULTIPART_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n'
+
+def multipart_chunk(jpeg):
+    """One multipart/x-mixed-replace part, built with a single copy of the JPEG."""
+    return b''.join((MULTIPART_HEADER % memoryview(jpeg).nbytes, jpeg, b'\r\n'))
+
+class FrameEncoder:
+    """Encodes one camera's frames into multipart chunks per profile.
+
+    Each profile's chunk is encoded once and shared by all its viewers.
+    Frames identical to the previous one are not encoded again, and the
+    resize buffers are reused from frame to frame. Frames are not copied,
+    so callers must not modify a frame after passing it in.
+    """
+
+    def __init__(self, profiles=None):
+        self.profiles = profiles or DEFAULT_PROFILES
+        self.last_frame = None
+        self.version = 0
+        self.encoded_versions = {}  # profile name -> frame version last encoded
+        self.resize_buffers = {}
+        self.encoded = 0
+        self.reused = 0  # encodes avoided because the frame had not changed
+
+    def encode(self, frame, profile_names):
+        """Return {profile name: chunk} for the profiles whose output changed."""
+        if not self._same_as_last(frame):
+            self.version += 1
+
+        chunks = {}
+        for name in profile_names:
+            if self.encoded_versions.get(name) == self.version:
+                self.reused += 1
+                continue
+            chunks[name] = self._encode(frame, name)
+            self.encoded_versions[name] = self.version
+            self.encoded += 1
+        return chunks
+
+    def _same_as_last(self, frame):
+        # Pipeline stages hand over a new array per frame (decoded or annotated), so holding a
+        # reference is enough. Changed frames almost always differ in a 1/64 sample of pixels;
+        # only when that matches is the whole frame compared.
+        last, self.last_frame = self.last_frame, frame
+        return (last is not None and last.shape == frame.shape
+                and np.array_equal(last[::8, ::8], frame[::8, ::8]) and np.array_equal(last, frame))
+
+    def _encode(self, frame, name):
+        profile = self.profiles[name]
+        image = frame
+        height, width = frame.shape[:2]
+        if profile.max_width and width > profile.max_width:
+            size = (profile.max_width, round(height * profile.max_width / width))
+            buffer = self.resize_buffers.get(name)
+            if buffer is None or buffer.shape[:2] != (size[1], size[0]) or buffer.dtype != frame.dtype:
+                buffer = np.empty((size[1], size[0]) + frame.shape[2:], dtype=frame.dtype)
+                self.resize_buffers[name] = buffer
+            image = cv2.resize(frame, size, dst=buffer, interpolation=cv2.INTER_AREA)
+
+        success, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, profile.quality])
+        if not success:
+            raise ValueError(f'JPEG encoding failed for profile {name}')
+        return multipart_chunk(jpeg.data)
+
+    def get_stats(self):
+        return {'encoded': self.encoded, 'reused': self.reused}
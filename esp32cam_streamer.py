@@ -1,25 +1,8 @@
-import cv2
+from sources import SnapshotSource
 
-class ESP32CamStreamer:
-    def __init__(self, esp32_cam_url):
-        self.esp32_cam_url = esp32_cam_url.rstrip('/')  # Ensure no trailing slash
-        self.cap = None
-
-    def start(self):
-        if self.cap is None or not self.cap.isOpened():
-            self.cap = cv2.VideoCapture(self.esp32_cam_url)
-
-    def stop(self):
-        if self.cap and self.cap.isOpened():
-            self.cap.release()
-            self.cap = None
+class ESP32CamStreamer(SnapshotSource):
+    """Snapshot source for the esp32_stream firmware, which serves one JPEG per GET /."""
 
-    def get_frame(self):
-        if self.cap is None or not self.cap.isOpened():
-            self.start()
-
-        if self.cap:
-            success, frame = self.cap.read()
-            if success:
-                return frame
-        return None
+    def __init__(self, esp32_cam_url, target_fps=10.0, timeout=5.0):
+        self.esp32_cam_url = esp32_cam_url.rstrip('/')  # Ensure no trailing slash
+        super().__init__(f"{self.esp32_cam_url}/", target_fps=target_fps, timeout=timeout)
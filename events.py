@@ -0,0 +1,95 @@
+import queue
+import requests
+from threading import Thread, Lock
+
+class EventBus:
+    """In-process publish/subscribe between the detectors and the web tier.
+
+    Detectors publish events (e.g. 'fall_detected') and never wait on the
+    handlers: events are delivered on the bus's own thread, unless the bus
+    is created with asynchronous=False.
+    """
+
+    def __init__(self, asynchronous=True):
+        self.asynchronous = asynchronous
+        self.handlers = {}
+        self.lock = Lock()
+        self.events = queue.Queue()
+        self.worker_thread = None
+
+    def subscribe(self, topic, handler):
+        with self.lock:
+            self.handlers.setdefault(topic, []).append(handler)
+
+    def unsubscribe(self, topic, handler):
+        with self.lock:
+            if handler in self.handlers.get(topic, []):
+                self.handlers[topic].remove(handler)
+
+    def publish(self, topic, payload):
+        if not self.asynchronous:
+            self.dispatch(topic, payload)
+            return
+        self.start()
+        self.events.put((topic, payload))
+
+    def dispatch(self, topic, payload):
+        with self.lock:
+            handlers = list(self.handlers.get(topic, []))
+        for handler in handlers:
+            try:
+                handler(payload)
+            except Exception as e:
+                print(f"Error handling {topic} event in {getattr(handler, '__name__', handler)}: {e}")
+
+    def start(self):
+        if self.worker_thread and self.worker_thread.is_alive():
+            return
+        with self.lock:
+            if self.worker_thread and self.worker_thread.is_alive():
+                return
+            self.worker_thread = Thread(target=self._run, name='event-bus', daemon=True)
+            self.worker_thread.start()
+
+    def stop(self):
+        if self.worker_thread:
+            self.events.put(None)
+            self.worker_thread.join()
+            self.worker_thread = None
+
+    def _run(self):
+        while True:
+            event = self.events.get()
+            if event is None:
+                break
+            self.dispatch(*event)
+
+class HttpAlertBridge:
+    """Forwards fall events to a remote web tier's /send_alert endpoint.
+
+    Only needed when detection runs in a separate deployment from the web
+    server; subscribe it to 'fall_detected' on the detector's bus.
+    """
+
+    def __init__(self, base_url, timeout=5.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def __call__(self, event):
+        try:
+            response = self.session.post(
+                f"{self.base_url}/send_alert/{event['user_id']}",
+                data={
+                    'location': event['location'],
+                    'severity': event['severity'],
+                    'camera_id': event['camera_id']
+                },
+                timeout=self.timeout
+            )
+            if response.status_code == 200:
+                print(f"Alert forwarded for camera {event['camera_id']}")
+            else:
+                print(f"Failed to forward alert: {response.status_code}")
+        except Exception as e:
+            print(f"Error forwarding fall alert: {e}")
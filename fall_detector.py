@@ -1,29 +1,85 @@
 import numpy as np
 import time
 
+# Temporal states of a tracked person
+STANDING = "STANDING"
+FALLING = "FALLING"
+LYING = "LYING"
+RECOVERED = "RECOVERED"
+
+class PoseHistory:
+    """Fixed-size ring buffer of (timestamp, is_lying) observations for one person."""
+
+    def __init__(self, size):
+        self.times = np.zeros(size)
+        self.lying = np.zeros(size, dtype=bool)
+        self.index = 0
+        self.count = 0
+        self.state = STANDING
+        self.state_since = None
+        self.last_seen = None
+
+    def add(self, timestamp, is_lying):
+        self.times[self.index] = timestamp
+        self.lying[self.index] = is_lying
+        self.index = (self.index + 1) % len(self.times)
+        self.count = min(self.count + 1, len(self.times))
+
+    def lying_ratio(self, since):
+        """Share of observations at or after `since` that were lying, or None if there are none."""
+        times = self.times[:self.count]
+        recent = times >= since
+        total = np.count_nonzero(recent)
+        if total == 0:
+            return None
+        return np.count_nonzero(self.lying[:self.count] & recent) / total
+
 class FallDetector:
-    def __init__(self, fall_threshold=45, fall_duration=2.0, sit_threshold=50, chair_height_ratio=0.6):
+    def __init__(self, fall_threshold=45, fall_duration=2.0, sit_threshold=50, chair_height_ratio=0.6,
+                 recovery_duration=2.0, enter_ratio=0.6, exit_ratio=0.3, history_size=128,
+                 track_ttl=10.0, max_tracks=64):
         self.fall_threshold = fall_threshold
         self.fall_duration = fall_duration
         self.sit_threshold = sit_threshold
         self.chair_height_ratio = chair_height_ratio
+
+        # Temporal state machine: STANDING -> FALLING -> LYING -> RECOVERED
+        self.recovery_duration = recovery_duration  # seconds upright before a fall is over
+        self.enter_ratio = enter_ratio  # share of lying observations needed to confirm a fall
+        self.exit_ratio = exit_ratio  # share below which a person is considered up again
+        self.history_size = history_size  # observations kept per person
+        self.track_ttl = track_ttl  # seconds before an unseen person is forgotten
+        self.max_tracks = max_tracks
         self.person_trackers = {}
+        self.last_expiry = None
 
     def determine_pose(self, keypoints):
-    # Extract keypoints
-        left_shoulder = np.array(keypoints[5])
-        right_shoulder = np.array(keypoints[6])
-        left_hip = np.array(keypoints[11])
-        right_hip = np.array(keypoints[12])
-        left_knee = np.array(keypoints[13])
-        right_knee = np.array(keypoints[14])
-        left_ankle = np.array(keypoints[15])
-        right_ankle = np.array(keypoints[16])
-    
-    # Validate keypoints: if any critical keypoints are missing (i.e., all zero)
-        for point in [left_shoulder, right_shoulder, left_hip, right_hip, left_ankle, right_ankle]:
-            if np.all(point == 0):
-                return "UNKNOWN"
+        # Single person: run the vectorized path on a batch of one so both agree exactly
+        labels, _ = self.determine_pose_batch(np.asarray(keypoints)[np.newaxis])
+        return str(labels[0])
+
+    def determine_pose_batch(self, keypoints):
+        """Classify every person in one pass.
+
+        keypoints is an (N, 17, 2) or (N, 17, 3) array; a third channel
+        (confidence) is ignored. Returns (labels, features) where labels is an
+        array of N pose names and features maps 'torso_angle', 'knee_angle',
+        'hip_height_ratio' and 'horizontal_ratio' to arrays of length N (NaN
+        for UNKNOWN rows).
+        """
+        keypoints = np.asarray(keypoints, dtype=np.float64)
+        if keypoints.ndim != 3 or keypoints.shape[1] != 17 or keypoints.shape[2] not in (2, 3):
+            raise ValueError(f"Expected keypoints of shape (N, 17, 2) or (N, 17, 3), got {keypoints.shape}")
+        points = keypoints[:, :, :2]
+
+        left_shoulder, right_shoulder = points[:, 5], points[:, 6]
+        left_hip, right_hip = points[:, 11], points[:, 12]
+        left_knee, right_knee = points[:, 13], points[:, 14]
+        left_ankle, right_ankle = points[:, 15], points[:, 16]
+
+        # A person is UNKNOWN if any critical keypoint is missing (i.e., all zero)
+        critical = points[:, [5, 6, 11, 12, 15, 16]]
+        missing = np.all(critical == 0, axis=2).any(axis=1)
 
         # Calculate midpoints
         shoulder_mid = (left_shoulder + right_shoulder) / 2
@@ -35,56 +91,128 @@ class FallDetector:
         torso_vector = shoulder_mid - hip_mid
         thigh_vector = knee_mid - hip_mid
         lower_leg_vector = ankle_mid - knee_mid
-        vertical_vector = np.array([0, -1])  # pointing up in image coordinates
+        shoulder_to_ankle_vec = shoulder_mid - ankle_mid
 
-        # Calculate angles
-        torso_angle = self.calculate_angle(torso_vector, vertical_vector)
-        knee_angle = self.calculate_angle(thigh_vector, lower_leg_vector)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Angle to the vertical (0, -1), pointing up in image coordinates
+            torso_angle = np.degrees(np.arccos(-torso_vector[:, 1] / self._norm(torso_vector)))
+            knee_angle = np.degrees(np.arccos(
+                np.sum(thigh_vector * lower_leg_vector, axis=1) /
+                (self._norm(thigh_vector) * self._norm(lower_leg_vector))))
 
-        # Calculate ratios
-        total_height = np.linalg.norm(shoulder_mid - ankle_mid)
-        hip_height = np.linalg.norm(hip_mid - ankle_mid)
-        hip_height_ratio = hip_height / total_height if total_height != 0 else 0
+            # Calculate ratios
+            total_height = self._norm(shoulder_to_ankle_vec)
+            hip_height = self._norm(hip_mid - ankle_mid)
+            hip_height_ratio = np.where(total_height != 0, hip_height / total_height, 0.0)
+            horizontal_ratio = np.abs(shoulder_to_ankle_vec[:, 0]) / total_height
 
-        # Additional horizontal check
-        shoulder_to_ankle_vec = shoulder_mid - ankle_mid
-        horizontal_ratio = abs(shoulder_to_ankle_vec[0]) / np.linalg.norm(shoulder_to_ankle_vec)
+        # Ankle-hip distance for confirming lying (same as hip height)
+        ankle_hip_dist = hip_height
 
-        # Additional ankle-hip distance for confirming lying
-        ankle_hip_dist = np.linalg.norm(ankle_mid - hip_mid)
+        # Determine pose; NaN features compare False, as in the per-person checks
+        lying_branch = (torso_angle >= self.fall_threshold) & (horizontal_ratio > 0.5)
+        sitting_branch = torso_angle >= self.sit_threshold
+        labels = np.select(
+            [
+                missing,
+                lying_branch & (ankle_hip_dist < 0.2 * total_height),
+                lying_branch,
+                sitting_branch & (hip_height_ratio <= self.chair_height_ratio),
+                sitting_branch,
+                knee_angle < 100,
+            ],
+            ["UNKNOWN", "LYING", "STANDING", "SITTING_CHAIR", "SITTING_FLOOR", "SQUATTING"],
+            default="STANDING"
+        )
 
-        # Determine pose
-        if torso_angle >= self.fall_threshold and horizontal_ratio > 0.5:
-            if ankle_hip_dist < 0.2 * total_height:
-                return "LYING"
-    
-        elif torso_angle >= self.sit_threshold:
-            if hip_height_ratio <= self.chair_height_ratio:
-                return "SITTING_CHAIR"
-            else:
-                return "SITTING_FLOOR"
-    
-        elif knee_angle < 100:
-            return "SQUATTING"  # Optional category
+        features = {
+            'torso_angle': torso_angle,
+            'knee_angle': knee_angle,
+            'hip_height_ratio': hip_height_ratio,
+            'horizontal_ratio': horizontal_ratio,
+        }
+        for name in features:
+            features[name] = np.where(missing, np.nan, features[name])
 
-        return "STANDING"
+        return labels, features
 
+    @staticmethod
+    def _norm(vectors):
+        return np.sqrt(vectors[:, 0] * vectors[:, 0] + vectors[:, 1] * vectors[:, 1])
 
     def calculate_angle(self, vector1, vector2):
         angle = np.arccos(np.dot(vector1, vector2) / 
                           (np.linalg.norm(vector1) * np.linalg.norm(vector2)))
         return np.degrees(angle)
 
-    def detect_fall(self, person_id, pose):
-        if person_id not in self.person_trackers:
-            self.person_trackers[person_id] = {'lying_start_time': None}
+    def detect_fall(self, person_id, pose, timestamp=None):
+        """Record a pose for a person and return True while they are confirmed fallen."""
+        return self.update(person_id, pose, timestamp) == LYING
+
+    def update(self, person_id, pose, timestamp=None):
+        """Feed one pose observation and return the person's debounced state.
+
+        timestamp is a monotonic clock reading or a frame timestamp in seconds;
+        wall-clock time is never used so clock corrections cannot cause jumps.
+        """
+        now = time.monotonic() if timestamp is None else timestamp
+        self.expire(now)
+
+        history = self.person_trackers.get(person_id)
+        if history is None:
+            if len(self.person_trackers) >= self.max_tracks:
+                oldest = min(self.person_trackers, key=lambda pid: self.person_trackers[pid].last_seen)
+                self.forget(oldest)
+            history = PoseHistory(self.history_size)
+            history.state_since = now
+            self.person_trackers[person_id] = history
+        history.last_seen = now
+
+        # Missing keypoints say nothing about lying or standing
+        if pose == "UNKNOWN":
+            return history.state
+        is_lying = pose == "LYING"
+        history.add(now, is_lying)
+
+        state = history.state
+        if state in (STANDING, RECOVERED):
+            if is_lying:
+                self._transition(history, FALLING, now)
+        elif state == FALLING:
+            ratio = history.lying_ratio(max(history.state_since, now - self.fall_duration))
+            if ratio is not None and ratio < self.exit_ratio:
+                self._transition(history, STANDING, now)
+            elif now - history.state_since >= self.fall_duration:
+                ratio = history.lying_ratio(now - self.fall_duration)
+                if ratio is not None and ratio >= self.enter_ratio:
+                    self._transition(history, LYING, now)
+        elif state == LYING:
+            # Only judge recovery once a full window has passed since the fall was confirmed
+            if now - history.state_since >= self.recovery_duration:
+                ratio = history.lying_ratio(now - self.recovery_duration)
+                if ratio is not None and ratio < self.exit_ratio:
+                    self._transition(history, RECOVERED, now)
+
+        return history.state
+
+    def _transition(self, history, state, now):
+        history.state = state
+        history.state_since = now
+
+    def get_state(self, person_id):
+        history = self.person_trackers.get(person_id)
+        return history.state if history else None
 
-        if pose == "LYING":
-            if self.person_trackers[person_id]['lying_start_time'] is None:
-                self.person_trackers[person_id]['lying_start_time'] = time.time()
-            elif time.time() - self.person_trackers[person_id]['lying_start_time'] >= self.fall_duration:
-                return True
-        else:
-            self.person_trackers[person_id]['lying_start_time'] = None
+    def expire(self, now):
+        # Drop people not seen for track_ttl, checked at most once a second
+        if self.last_expiry is not None and now - self.last_expiry < 1.0:
+            return
+        self.last_expiry = now
+        stale = [pid for pid, history in self.person_trackers.items()
+                 if now - history.last_seen > self.track_ttl]
+        for pid in stale:
+            self.forget(pid)
 
-        return False
\ No newline at end of file
+    def forget(self, person_id):
+        # Called when the tracker drops a person so state does not pile up
+        self.person_trackers.pop(person_id, None)
@@ -0,0 +1,223 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Thread, Event, Lock
+from sqlalchemy import and_, or_
+from models import db, Incident
+
+ACTIVE = ('open', 'acknowledged')  # incidents that still absorb new falls
+
+class TokenBucket:
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period  # tokens added per second
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """Take a token; returns (allowed, seconds until one is available)."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, 0.0
+        return False, (1 - self.tokens) / self.rate
+
+class ChannelRateLimiter:
+    """Caps outgoing alerts per channel, e.g. {'sms': (20, 60)} for 20 a minute."""
+
+    def __init__(self, limits):
+        self.lock = Lock()
+        self.buckets = {channel: TokenBucket(capacity, period)
+                        for channel, (capacity, period) in limits.items()}
+
+    def try_acquire(self, channel):
+        bucket = self.buckets.get(channel)
+        if bucket is None:
+            return True, 0.0
+        with self.lock:
+            return bucket.try_acquire()
+
+class IncidentManager:
+    """Collapses repeated falls into incidents and re-alerts unacknowledged ones.
+
+    Falls for the same (user, camera) within `window` seconds of the previous
+    one belong to the same incident and do not alert again, acknowledged
+    or not. While an incident is unacknowledged, on_escalate is called
+    after each of escalation_intervals in turn. Camera ids are compared as
+    strings, whether they come from a detector (an int) or a form. Active
+    incidents are cached in memory (at most max_cached) and persisted in the
+    Incident table, so a restart neither loses nor repeats them.
+    """
+
+    def __init__(self, app=None, window=300, escalation_intervals=(120, 300, 900),
+                 max_cached=256, poll_interval=5.0):
+        self.window = window
+        self.escalation_intervals = list(escalation_intervals)
+        self.max_cached = max_cached
+        self.poll_interval = poll_interval
+        self.lock = Lock()
+        self.cache = OrderedDict()  # (user_id, camera_id) -> (incident id, last event time)
+        self.on_escalate = None
+        self.wake_event = Event()
+        self.should_stop = False
+        self.escalation_thread = None
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.window = app.config.get('INCIDENT_WINDOW', self.window)
+        self.escalation_intervals = list(app.config.get('INCIDENT_ESCALATION_INTERVALS', self.escalation_intervals))
+
+    def record_fall(self, user_id, camera_id, now=None):
+        """Record a fall event; returns (incident, is_new).
+
+        Needs an app context. Only flushes: the caller commits, so the
+        incident can share a transaction with the fall it records.
+        """
+        now = now or datetime.utcnow()
+        key = self.key(user_id, camera_id)
+        with self.lock:
+            incident = self._find_open(key, now)
+            if incident is not None:
+                incident.event_count += 1
+                incident.last_event_at = now
+                self._remember(key, incident.id, now)
+                return incident, False
+
+            incident = Incident(
+                user_id=user_id,
+                camera_id=key[1],
+                opened_at=now,
+                last_event_at=now,
+                next_escalation_at=self._next_escalation(0, now)
+            )
+            db.session.add(incident)
+            db.session.flush()
+            self._remember(key, incident.id, now)
+            return incident, True
+
+    @staticmethod
+    def key(user_id, camera_id):
+        return user_id, str(camera_id)
+
+    def attach_detection(self, incident, fall_detection):
+        incident.fall_detection_id = fall_detection.id
+
+    def acknowledge(self, incident, user_id):
+        incident.status = 'acknowledged'
+        incident.acknowledged_at = datetime.utcnow()
+        incident.acknowledged_by = user_id
+        incident.next_escalation_at = None
+        db.session.commit()
+
+    def _find_open(self, key, now):
+        cached = self.cache.get(key)
+        if cached is not None:
+            incident_id, last_event_at = cached
+            if now - last_event_at > timedelta(seconds=self.window):
+                # Quiet for a whole window: the next fall starts a new incident
+                self._close(incident_id)
+                del self.cache[key]
+                return None
+            self.cache.move_to_end(key)
+            incident = db.session.get(Incident, incident_id)
+            # A rolled back incident's id may have been reused, so check the key too
+            if (incident is not None and incident.status in ACTIVE
+                    and (incident.user_id, incident.camera_id) == key):
+                return incident
+            del self.cache[key]
+
+        # Not cached (e.g. after a restart): look for a recent active incident
+        incident = (Incident.query
+                    .filter(Incident.user_id == key[0], Incident.camera_id == key[1],
+                            Incident.status.in_(ACTIVE))
+                    .order_by(Incident.last_event_at.desc())
+                    .first())
+        if incident is None:
+            return None
+        if now - incident.last_event_at > timedelta(seconds=self.window):
+            self._close(incident.id)
+            return None
+        return incident
+
+    def _close(self, incident_id):
+        Incident.query.filter(Incident.id == incident_id, Incident.status.in_(ACTIVE)).update({
+            'status': 'closed',
+            'next_escalation_at': None
+        }, synchronize_session=False)
+
+    def _remember(self, key, incident_id, now):
+        self.cache[key] = (incident_id, now)
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.max_cached:
+            self.cache.popitem(last=False)  # still in the database if needed again
+
+    def _next_escalation(self, level, now):
+        if level >= len(self.escalation_intervals):
+            return None
+        return now + timedelta(seconds=self.escalation_intervals[level])
+
+    def start(self, on_escalate):
+        """Run escalations in the background; on_escalate(incident) runs in an app context."""
+        self.on_escalate = on_escalate
+        if self.escalation_thread and self.escalation_thread.is_alive():
+            return
+        self.should_stop = False
+        self.escalation_thread = Thread(target=self._run, name='incident-escalation', daemon=True)
+        self.escalation_thread.start()
+
+    def stop(self):
+        self.should_stop = True
+        self.wake_event.set()
+        if self.escalation_thread:
+            self.escalation_thread.join()
+            self.escalation_thread = None
+
+    def _run(self):
+        with self.app.app_context():
+            while not self.should_stop:
+                try:
+                    self.escalate_due()
+                    self.close_expired()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error escalating incidents: {e}")
+                self.wake_event.wait(self.poll_interval)
+
+    def escalate_due(self, now=None):
+        now = now or datetime.utcnow()
+        due = (Incident.query
+               .filter(Incident.status == 'open', Incident.next_escalation_at <= now)
+               .all())
+        for incident in due:
+            incident.escalation_level += 1
+            incident.next_escalation_at = self._next_escalation(incident.escalation_level, now)
+            db.session.commit()
+            if self.on_escalate is not None:
+                self.on_escalate(incident)
+
+    def close_expired(self, now=None):
+        """Close incidents quiet for a whole window, so they do not wait for a next fall.
+
+        Unacknowledged incidents stay open until their last reminder has gone out.
+        """
+        now = now or datetime.utcnow()
+        cutoff = now - timedelta(seconds=self.window)
+        with self.lock:
+            closed = (Incident.query
+                      .filter(Incident.last_event_at < cutoff,
+                              or_(Incident.status == 'acknowledged',
+                                  and_(Incident.status == 'open', Incident.next_escalation_at.is_(None))))
+                      .update({'status': 'closed'}, synchronize_session=False))
+            db.session.commit()
+            for key, (_, last_event_at) in list(self.cache.items()):
+                if last_event_at < cutoff:
+                    del self.cache[key]
+        return closed
@@ -0,0 +1,135 @@
+import queue
+import time
+from concurrent.futures import Future
+import numpy as np
+from threading import Thread, Lock
+from backends import ModelBackend
+
+class InferenceEngine:
+    """Single shared YOLO model that serves every camera thread in micro-batches.
+
+    The model is loaded on first use, or ahead of time by warmup(), so
+    creating the engine (and importing the web app) does not pay for
+    torch and the weights.
+    """
+
+    def __init__(self, model, max_batch_size=4, max_wait=0.02):
+        # A ModelBackend, or the path of PyTorch weights
+        self.backend = model if isinstance(model, ModelBackend) else ModelBackend(weights=model)
+        self.model = None
+        self.load_lock = Lock()
+        self.lock = Lock()
+        self.load_seconds = None
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait  # seconds to wait for a batch to fill up
+        self.requests = queue.Queue()
+        self.should_stop = False
+        self.worker_thread = None
+
+    @property
+    def names(self):
+        return self.load().names
+
+    def load(self):
+        """Load the model if it is not loaded yet, and return it."""
+        if self.model is None:
+            with self.load_lock:
+                if self.model is None:
+                    started = time.perf_counter()
+                    model = self.backend.load()  # imports torch, which alone takes seconds
+                    self.load_seconds = time.perf_counter() - started
+                    self.model = model
+        return self.model
+
+    def warmup(self):
+        """Load the model and run one blank frame through it, so the first camera frame is not slow."""
+        imgsz = self.backend.imgsz
+        # Through the queue, so only the worker thread ever calls the model, even if cameras start meanwhile
+        self.submit(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), imgsz).result()
+
+    def start(self):
+        if self.worker_thread and self.worker_thread.is_alive():
+            return
+        with self.lock:
+            # Every camera thread calls this through submit(); the model must only get one caller
+            if self.worker_thread and self.worker_thread.is_alive():
+                return
+            self.should_stop = False
+            self.worker_thread = Thread(target=self._run, name='inference', daemon=True)
+            self.worker_thread.start()
+
+    def stop(self):
+        self.should_stop = True
+        if self.worker_thread:
+            self.worker_thread.join()
+            self.worker_thread = None
+
+        # Fail anything still waiting so no camera thread blocks forever
+        while True:
+            try:
+                _, _, future = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            future.set_exception(RuntimeError('Inference engine stopped'))
+
+    def submit(self, frame, imgsz=None):
+        """Queue a frame for inference and return a Future for its results.
+
+        imgsz overrides the model input size, e.g. for small crops.
+        """
+        self.start()
+        future = Future()
+        self.requests.put((frame, imgsz, future))
+        return future
+
+    def infer(self, frame, imgsz=None, timeout=None):
+        # Same shape as calling the YOLO model directly on a single frame
+        return self.submit(frame, imgsz).result(timeout=timeout)
+
+    def get_stats(self):
+        return {
+            'queued': self.requests.qsize(),
+            'backend': str(self.backend),
+            'loaded': self.model is not None,
+            'load_seconds': self.load_seconds
+        }
+
+    def _run(self):
+        while not self.should_stop:
+            try:
+                first = self.requests.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        # Frames can only share a model call when they share an input size
+        groups = {}
+        for frame, imgsz, future in batch:
+            groups.setdefault(imgsz or self.backend.imgsz, []).append((frame, future))
+
+        for imgsz, requests in groups.items():
+            frames = [frame for frame, _ in requests]
+            try:
+                results = self.load()(frames, imgsz=imgsz, verbose=False)
+            except Exception as e:
+                print(f"Error running inference batch of {len(frames)}: {e}")
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+
+            # Results come back in submission order, one per frame
+            for (_, future), result in zip(requests, results):
+                future.set_result([result])
@@ -1,24 +1,58 @@
-from flask import Flask, render_template, Response, request, jsonify, send_from_directory, redirect, url_for, flash
+from startup import StartupReport
+startup = StartupReport()  # first, so the imports below are timed
+
+from flask import Flask, render_template, Response, request, jsonify, send_from_directory, send_file, redirect, url_for, flash, abort, stream_with_context
 import os
 import queue
+import concurrent.futures
 from esp32cam_streamer import ESP32CamStreamer
+from sources import AsyncSnapshotPoller
 from video import VideoProcessor, VideoStreamer, FileVideoStreamer
+from pipeline import CameraPipeline
+from encoder import EncodeProfile, PASSTHROUGH_PROFILE
+from inference import InferenceEngine
+from backends import ModelBackend
+from workers import ProcessInferenceEngine
+from scheduler import InferenceScheduler
+from roi import RegionPlanner
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.urls import url_parse
-from models import db, User, EmergencyContact, FallDetection
+from werkzeug.utils import secure_filename
+from models import db, User, EmergencyContact, FallDetection, AlertOutbox, Incident, VideoAnalysis
 from forms import LoginForm, RegistrationForm, EmergencyContactForm, UserProfileForm
 from alerts import AlertSystem
-import plotly.express as px
-import pandas as pd
+from dispatcher import AlertDispatcher
+from events import EventBus, HttpAlertBridge
+from incidents import IncidentManager, ChannelRateLimiter
+from storage import WriteBehindBatcher, configure_sqlite, ensure_columns, ensure_indexes, DEFAULT_SQLITE_PRAGMAS
+import rollups
+from paging import Keyset
+from analysis import VideoAnalyzer
+from metrics import registry as metrics_registry
+from profiler import SamplingProfiler
 from datetime import datetime, timedelta
+from threading import Thread
 import json
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
 # Add Flask-SocketIO import
 from flask_socketio import SocketIO, emit, join_room, leave_room
 
+startup.checkpoint('imports')
+
 app = Flask(__name__, template_folder='templates')
 app.config['SECRET_KEY'] = 'your-secret-key-here'  # Change this to a secure random key
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///fall_detection.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Pragmas for every SQLite connection (WAL etc.), see storage.DEFAULT_SQLITE_PRAGMAS
+app.config['SQLITE_PRAGMAS'] = dict(DEFAULT_SQLITE_PRAGMAS)
+# Fall records from all cameras are committed together in batches
+app.config['WRITE_BATCH_SIZE'] = 64
+app.config['WRITE_BATCH_DELAY'] = 0.05  # seconds to wait for a batch to fill
+
+# Listing page sizes; the JSON APIs return at most API_MAX_LIMIT rows per call
+app.config['PAGE_SIZE'] = 25
+app.config['API_MAX_LIMIT'] = 5000
 
 # Email configuration
 app.config['MAIL_SERVER'] = 'smtp.gmail.com'
@@ -28,21 +62,120 @@ app.config['MAIL_PASSWORD'] = 'your-app-password'  # Change this
 app.config['MAIL_USE_TLS'] = False
 app.config['MAIL_USE_SSL'] = True
 app.config['MAIL_DEFAULT_SENDER'] = 'your-email@gmail.com'  # Change this
+app.config['MAIL_POOL_SIZE'] = 2  # SMTP sessions kept open between alerts
+app.config['MAIL_MAX_IDLE'] = 60.0  # seconds before an idle session is checked with NOOP
 
 # Twilio configuration
 app.config['TWILIO_ACCOUNT_SID'] = 'your-twilio-sid'  # Change this
 app.config['TWILIO_AUTH_TOKEN'] = 'your-twilio-token'  # Change this
 app.config['TWILIO_PHONE_NUMBER'] = '+1234567890'  # Change this
 app.config['TWILIO_WHATSAPP_NUMBER'] = '+1234567890'  # Change this
+app.config['TWILIO_MAX_WORKERS'] = 4  # concurrent Twilio REST calls
+
+# Background alert delivery
+app.config['ALERT_MAX_WORKERS'] = 8
+app.config['ALERT_MAX_ATTEMPTS'] = 5
+app.config['ALERT_RETRY_BASE_DELAY'] = 5.0  # seconds, doubled on every retry
+app.config['ALERT_RETRY_MAX_DELAY'] = 300.0
+# Most alerts sent per channel: (count, seconds)
+app.config['ALERT_RATE_LIMITS'] = {'sms': (20, 60), 'whatsapp': (20, 60), 'email': (50, 60)}
+
+# Falls on one camera within INCIDENT_WINDOW seconds of each other are one incident
+app.config['INCIDENT_WINDOW'] = 300
+# Seconds between reminders while an incident is unacknowledged
+app.config['INCIDENT_ESCALATION_INTERVALS'] = [120, 300, 900]
+
+# Resident monitored by each camera (falls on unlisted cameras go to CAMERA_DEFAULT_USER)
+app.config['CAMERA_USERS'] = {}
+app.config['CAMERA_DEFAULT_USER'] = 1
+# Set to the web tier's base URL when detection runs in a separate deployment
+app.config['ALERT_BRIDGE_URL'] = None
+
+# Inference configuration (one model shared by every camera)
+app.config['MODEL_PATH'] = 'ok.pt'
+# 'pytorch' runs MODEL_PATH as is; 'onnx' and 'openvino' run graphs exported next to it
+# with "python backends.py export", which serve more cameras per CPU
+app.config['MODEL_BACKEND'] = 'pytorch'
+app.config['MODEL_INT8'] = False  # check a quantized export with "python backends.py parity" first
+app.config['MODEL_IMGSZ'] = 640  # input size for full frames
+app.config['MODEL_THREADS'] = None  # CPU threads per model copy; None lets the runtime use every core
+app.config['INFERENCE_MAX_BATCH_SIZE'] = 4
+app.config['INFERENCE_MAX_WAIT'] = 0.02  # seconds
+# Load the model in the background at startup instead of on the first camera frame
+app.config['INFERENCE_WARMUP'] = True
+# Run the model in this many worker processes (0 keeps it on a thread in this process).
+# Frames reach them through a shared-memory ring of INFERENCE_RING_SLOTS slots.
+app.config['INFERENCE_WORKERS'] = 0
+app.config['INFERENCE_RING_SLOTS'] = 32
+app.config['INFERENCE_SLOT_BYTES'] = 1920 * 1080 * 3  # largest frame passed without pickling
+# Motion gating: static rooms drop to INFERENCE_MIN_FPS, motion restores full rate
+app.config['INFERENCE_MIN_FPS'] = 1.0
+app.config['INFERENCE_MAX_FPS'] = None  # None runs the model on every frame
+app.config['MOTION_THRESHOLD'] = 0.005  # fraction of changed pixels
+# Region-of-interest mode: infer on crops around known people between full scans
+app.config['ROI_ENABLED'] = True
+app.config['ROI_IMGSZ'] = 320
+app.config['ROI_PADDING'] = 0.3
+app.config['ROI_FULL_SCAN_INTERVAL'] = 1.0  # seconds
+
+# IP cameras are polled for snapshots over keep-alive connections
+app.config['CAMERA_TARGET_FPS'] = 10.0
+app.config['CAMERA_TIMEOUT'] = 5.0  # seconds per snapshot request
+# Poll every IP camera from one asyncio loop instead of a thread per camera
+app.config['CAMERA_ASYNC_POLLING'] = True
+
+# JPEG settings viewers can pick with /video_feed/<id>?profile=<name>
+app.config['STREAM_PROFILES'] = {
+    'full': {'quality': 85},
+    'thumb': {'quality': 60, 'max_width': 320}  # camera grid on the home page
+}
+# ?profile=original forwards IP camera JPEGs untouched; detections are sent over
+# SocketIO ('overlay' events) and drawn in the browser
+app.config['STREAM_PASSTHROUGH'] = True
+app.config['PASSTHROUGH_DECODE_SCALE'] = 1  # 2, 4 or 8 decodes smaller frames for detection
+
+# Offline analysis of uploaded recordings (POST /analysis), run as fast as the model allows
+app.config['ANALYSIS_BATCH_SIZE'] = 8  # frames in flight per job
+app.config['ANALYSIS_STRIDE'] = 1  # analyse every Nth frame; 2-3 is usually enough to catch a fall
+app.config['ANALYSIS_MAX_JOBS'] = 1
+app.config['ANALYSIS_RESULTS_DIR'] = 'analysis_results'
+
+# Hot-path metrics on /metrics (Prometheus) and /metrics.json; switch stages off to skip their recording
+app.config['METRICS_STAGES'] = {
+    'capture': True,
+    'inference': True,
+    'pose': True,
+    'encode': True,
+    'db': True,
+    'alerts': True
+}
+app.config['METRICS_TOKEN'] = None  # lets scrapers in with "Authorization: Bearer <token>"; otherwise log in
+
+# On-demand stack sampling of camera threads (GET /admin/profile), for admins
+app.config['PROFILER_INTERVAL'] = 0.005  # seconds between samples
+app.config['PROFILER_MAX_SECONDS'] = 60
+app.config['PROFILER_MAX_OVERHEAD'] = 0.02  # sampling backs off above this share of wall time
 
 # Initialize extensions
 db.init_app(app)
+configure_sqlite(app)
+write_batcher = WriteBehindBatcher(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 alert_system = AlertSystem(app)
+alert_dispatcher = AlertDispatcher(alert_system, app,
+                                   rate_limiter=ChannelRateLimiter(app.config['ALERT_RATE_LIMITS']))
+incident_manager = IncidentManager(app)
+profiler = SamplingProfiler(app.config['PROFILER_INTERVAL'], app.config['PROFILER_MAX_SECONDS'],
+                            app.config['PROFILER_MAX_OVERHEAD'])
+event_bus = EventBus()
 # Initialize SocketIO
 socketio = SocketIO(app, cors_allowed_origins="*")
 
+# Newest first, with id breaking ties between equal timestamps
+detection_keyset = Keyset(FallDetection.timestamp, FallDetection.id)
+user_keyset = Keyset(User.id, descending=False)
+
 # Global variables
 frame_queues = {
     1: queue.Queue(maxsize=10),
@@ -52,17 +185,74 @@ frame_queues = {
 }
 ip_addresses = {}
 file_streams = {}
-model_path = "ok.pt"
+
+# Load the model once and batch frames from every camera through it
+model_backend = ModelBackend.from_config(app.config)
+if app.config['INFERENCE_WORKERS']:
+    inference_engine = ProcessInferenceEngine(
+        model_backend,
+        workers=app.config['INFERENCE_WORKERS'],
+        max_batch_size=app.config['INFERENCE_MAX_BATCH_SIZE'],
+        max_wait=app.config['INFERENCE_MAX_WAIT'],
+        ring_slots=app.config['INFERENCE_RING_SLOTS'],
+        slot_bytes=app.config['INFERENCE_SLOT_BYTES']
+    )
+else:
+    inference_engine = InferenceEngine(
+        model_backend,
+        max_batch_size=app.config['INFERENCE_MAX_BATCH_SIZE'],
+        max_wait=app.config['INFERENCE_MAX_WAIT']
+    )
+video_analyzer = VideoAnalyzer(inference_engine, app)
 
 # Initialize VideoProcessors for each camera
 video_processors = {
-    camera_id: VideoProcessor(model_path, frame_queues[camera_id])
+    camera_id: VideoProcessor(
+        inference_engine,
+        frame_queues[camera_id],
+        scheduler=InferenceScheduler(
+            min_fps=app.config['INFERENCE_MIN_FPS'],
+            max_fps=app.config['INFERENCE_MAX_FPS'],
+            motion_threshold=app.config['MOTION_THRESHOLD']
+        ),
+        region_planner=RegionPlanner(
+            padding=app.config['ROI_PADDING'],
+            imgsz=app.config['ROI_IMGSZ'],
+            full_scan_interval=app.config['ROI_FULL_SCAN_INTERVAL']
+        ) if app.config['ROI_ENABLED'] else None,
+        event_bus=event_bus,
+        user_id=app.config['CAMERA_USERS'].get(camera_id, app.config['CAMERA_DEFAULT_USER'])
+    )
     for camera_id in frame_queues
 }
 video_streamers_file = {
     camera_id: FileVideoStreamer(frame_queues[camera_id])
     for camera_id in frame_queues
 }
+# One shared pipeline per camera, fanned out to every viewer
+snapshot_poller = AsyncSnapshotPoller(
+    target_fps=app.config['CAMERA_TARGET_FPS'],
+    timeout=app.config['CAMERA_TIMEOUT']
+)
+
+def camera_source(camera_id, ip_address):
+    url = f"{ip_address.rstrip('/')}/"  # the firmware serves snapshots on /
+    if app.config['CAMERA_ASYNC_POLLING']:
+        return snapshot_poller.source(camera_id, url)
+    return ESP32CamStreamer(url, target_fps=app.config['CAMERA_TARGET_FPS'], timeout=app.config['CAMERA_TIMEOUT'])
+
+def emit_overlay(camera_id, overlay):
+    # Detections for passthrough viewers, who draw them over the camera's own JPEGs
+    socketio.emit('overlay', dict(overlay, camera_id=camera_id), room=f'camera_{camera_id}')
+
+metrics_registry.configure(app.config['METRICS_STAGES'])
+
+video_streamer = VideoStreamer(
+    {name: EncodeProfile(**options) for name, options in app.config['STREAM_PROFILES'].items()},
+    passthrough=app.config['STREAM_PASSTHROUGH'],
+    on_overlay=emit_overlay,
+    decode_scale=app.config['PASSTHROUGH_DECODE_SCALE']
+)
 
 @login_manager.user_loader
 def load_user(id):
@@ -141,14 +331,19 @@ def admin_dashboard():
         flash('You do not have permission to access the admin dashboard')
         return redirect(url_for('dashboard'))
     
-    # Get all users
-    users = User.query.all()
+    # One page of users at a time
+    try:
+        users = user_keyset.page(User.query, request.args.get('users_cursor'), app.config['PAGE_SIZE'])
+    except ValueError:
+        return redirect(url_for('admin_dashboard'))
     
-    # Get all fall detections
-    detections = FallDetection.query.order_by(FallDetection.timestamp.desc()).all()
+    # Latest fall detections; the full history is paged on /fall_detections
+    detections = (FallDetection.query.options(selectinload(FallDetection.user))
+                  .order_by(FallDetection.timestamp.desc(), FallDetection.id.desc())
+                  .limit(app.config['PAGE_SIZE']).all())
     
     return render_template('admin.html', title='Admin Dashboard', 
-                          users=users, detections=detections)
+                          users=users.items, users_page=users, detections=detections)
 
 @app.route('/contacts', methods=['GET', 'POST'])
 @login_required
@@ -187,25 +382,97 @@ def delete_contact(contact_id):
     flash('Contact deleted successfully')
     return redirect(url_for('manage_contacts'))
 
+def fall_detection_filters():
+    """Filtered FallDetection query from the request's user, start, end and severity.
+    
+    Returns (query, filters). Regular users only ever see their own falls.
+    Raises ValueError for malformed dates.
+    """
+    filters = {name: request.args.get(name, '').strip() for name in ('user', 'start', 'end', 'severity')}
+    query = FallDetection.query
+    if current_user.role != 'admin':
+        filters['user'] = ''
+        query = query.filter(FallDetection.user_id == current_user.id)
+    elif filters['user']:
+        user = User.query.filter_by(username=filters['user']).first()
+        query = query.filter(FallDetection.user_id == (user.id if user else None))
+    if filters['start']:
+        query = query.filter(FallDetection.timestamp >= datetime.strptime(filters['start'], '%Y-%m-%d'))
+    if filters['end']:
+        end = datetime.strptime(filters['end'], '%Y-%m-%d') + timedelta(days=1)
+        query = query.filter(FallDetection.timestamp < end)
+    if filters['severity']:
+        query = query.filter(FallDetection.severity == filters['severity'])
+    return query, {name: value for name, value in filters.items() if value}
+
+def serialize_detection(detection):
+    return {
+        'id': detection.id,
+        'user_id': detection.user_id,
+        'username': detection.user.username,
+        'timestamp': detection.timestamp.isoformat(),
+        'location': detection.location,
+        'severity': detection.severity
+    }
+
+def api_limit():
+    return max(1, min(request.args.get('limit', 100, type=int), app.config['API_MAX_LIMIT']))
+
 @app.route('/fall_detections')
 @login_required
 def fall_detections():
-    # Get user's fall detections with pagination
-    page = request.args.get('page', 1, type=int)
+    # Keyset pagination: ?cursor= continues after the last detection shown
+    try:
+        query, filters = fall_detection_filters()
+        page = detection_keyset.page(query.options(selectinload(FallDetection.user)),
+                                     request.args.get('cursor'), app.config['PAGE_SIZE'])
+    except ValueError:
+        flash('Invalid filter or page')
+        return redirect(url_for('fall_detections'))
     
-    if current_user.role == 'admin':
-        # Admins can see all detections
-        pagination = FallDetection.query.order_by(FallDetection.timestamp.desc()).paginate(
-            page=page, per_page=10, error_out=False)
-    else:
-        # Regular users only see their own detections
-        pagination = FallDetection.query.filter_by(user_id=current_user.id).order_by(
-            FallDetection.timestamp.desc()).paginate(page=page, per_page=10, error_out=False)
+    return render_template('fall_detections.html', title='Fall Detections', 
+                          detections=page.items, page=page, filters=filters)
+
+@app.route('/api/fall_detections')
+@login_required
+def api_fall_detections():
+    # Streams {"items": [...], "next_cursor": ...}; pass next_cursor back as ?cursor= for more
+    try:
+        query, _ = fall_detection_filters()
+        cursor = request.args.get('cursor')
+        if cursor:
+            detection_keyset.decode(cursor)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    detections = pagination.items
+    chunks = detection_keyset.stream_json(query.options(selectinload(FallDetection.user)),
+                                          serialize_detection, cursor, api_limit())
+    return Response(stream_with_context(chunks), mimetype='application/json')
+
+@app.route('/api/users')
+@login_required
+def api_users():
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Permission denied'}), 403
+    cursor = request.args.get('cursor')
+    try:
+        if cursor:
+            user_keyset.decode(cursor)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return render_template('fall_detections.html', title='Fall Detections', 
-                          detections=detections, pagination=pagination)
+    def serialize_user(user):
+        return {
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'role': user.role,
+            'last_login': user.last_login.isoformat() if user.last_login else None,
+            'is_active': user.is_active
+        }
+    
+    chunks = user_keyset.stream_json(User.query, serialize_user, cursor, api_limit())
+    return Response(stream_with_context(chunks), mimetype='application/json')
 
 @app.route('/update_role/<int:user_id>', methods=['POST'])
 @login_required
@@ -224,6 +491,17 @@ def update_role(user_id):
     
     return redirect(url_for('admin_dashboard'))
 
+def analytics_range():
+    # [start, end) from ?start=YYYY-MM-DD&end=YYYY-MM-DD (inclusive), defaulting to the last 30 days
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    end = today + timedelta(days=1)
+    if request.args.get('end'):
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d') + timedelta(days=1)
+    start = end - timedelta(days=30)
+    if request.args.get('start'):
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d')
+    return start, end
+
 @app.route('/analytics')
 @login_required
 def analytics():
@@ -231,96 +509,255 @@ def analytics():
         flash('You do not have permission to access analytics')
         return redirect(url_for('dashboard'))
     
-    # Get fall detection data for the past 30 days
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    
-    # Fall detections by day
-    detections = FallDetection.query.filter(FallDetection.timestamp >= thirty_days_ago).all()
-    
-    # Prepare data for charts
-    dates = [detection.timestamp.strftime('%Y-%m-%d') for detection in detections]
-    date_counts = {}
-    for date in dates:
-        date_counts[date] = date_counts.get(date, 0) + 1
-    
-    # Create a complete date range for the past 30 days
-    all_dates = [(datetime.utcnow() - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(30)]
-    all_dates.reverse()  # Sort chronologically
-    
-    # Fill in missing dates with zero counts
-    for date in all_dates:
-        if date not in date_counts:
-            date_counts[date] = 0
+    try:
+        start, end = analytics_range()
+    except ValueError:
+        flash('Dates must be given as YYYY-MM-DD')
+        return redirect(url_for('analytics'))
     
-    # Sort by date
-    sorted_dates = sorted(date_counts.items())
-    chart_dates = [item[0] for item in sorted_dates]
-    chart_counts = [item[1] for item in sorted_dates]
+    # Fall detections by day, read from the pre-aggregated rollups
+    chart_dates, chart_counts = rollups.daily_series(start, end)
     
     # User activity data
-    users = User.query.all()
-    active_users = [user for user in users if user.is_active]
-    inactive_users = [user for user in users if not user.is_active]
+    user_counts = dict(db.session.query(User.is_active, func.count(User.id)).group_by(User.is_active).all())
+    active_count = user_counts.get(True, 0)
+    inactive_count = sum(count for is_active, count in user_counts.items() if not is_active)
     
     # Create charts using Plotly
+    range_label = f"{start.strftime('%Y-%m-%d')} to {(end - timedelta(days=1)).strftime('%Y-%m-%d')}"
     fall_chart = {
         'x': chart_dates,
         'y': chart_counts,
         'type': 'bar',
-        'title': 'Fall Detections by Day (Last 30 Days)'
+        'title': f'Fall Detections by Day ({range_label})'
     }
     
     user_chart = {
         'labels': ['Active', 'Inactive'],
-        'values': [len(active_users), len(inactive_users)],
+        'values': [active_count, inactive_count],
         'type': 'pie',
         'title': 'User Account Status'
     }
     
     return render_template('analytics.html', title='Analytics',
                           fall_chart=json.dumps(fall_chart),
-                          user_chart=json.dumps(user_chart))
+                          user_chart=json.dumps(user_chart),
+                          range_label=range_label,
+                          total_users=active_count + inactive_count,
+                          active_count=active_count,
+                          inactive_count=inactive_count,
+                          total_detections=sum(chart_counts))
 
-@app.route('/send_alert/<int:user_id>', methods=['POST'])
-def send_alert(user_id):
-    # This endpoint would be called when a fall is detected
-    # It could be triggered by your existing fall detection system
-    
-    user = User.query.get_or_404(user_id)
+@app.route('/analytics/data')
+@login_required
+def analytics_data():
+    # e.g. /analytics/data?start=2024-01-01&end=2024-01-31&bucket=hour&group_by=camera,severity
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Permission denied'}), 403
     
-    # Create a new fall detection record
-    location = request.form.get('location', 'Unknown')
-    severity = request.form.get('severity', 'Unknown')
+    try:
+        start, end = analytics_range()
+    except ValueError:
+        return jsonify({'error': 'Dates must be given as YYYY-MM-DD'}), 400
+    bucket = request.args.get('bucket', 'day')
+    group_by = [name for name in request.args.get('group_by', '').split(',') if name]
+    if bucket not in rollups.BUCKETS or any(name not in rollups.GROUP_COLUMNS for name in group_by):
+        return jsonify({'error': 'Unknown bucket or group_by'}), 400
+    user_id = request.args.get('user_id', type=int)
     
+    counts = rollups.fall_counts(start, end, bucket, group_by, user_id)
+    for entry in counts:
+        entry['period'] = entry['period'].isoformat()
+    return jsonify(counts)
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the analytics rollups from the fall detection history."""
+    ensure_columns()
+    rows = rollups.rebuild()
+    print(f"Rebuilt {rows} rollup rows")
+
+def record_fall_detection(user, camera_id, location, severity):
+    """Store a fall and queue alerts to the user's contacts; the caller commits."""
     fall_detection = FallDetection(
         user_id=user.id,
+        camera_id=str(camera_id) if camera_id is not None else None,
         location=location,
         severity=severity
     )
     db.session.add(fall_detection)
-    db.session.commit()
     
     # Get user's emergency contacts
     contacts = EmergencyContact.query.filter_by(user_id=user.id).all()
     
-    # Send alerts to all contacts
-    results = alert_system.send_fall_alert(user, fall_detection, contacts)
+    # Queue alerts for all contacts in the same transaction; delivery happens in the background
+    queued = alert_dispatcher.enqueue_fall_alert(user, fall_detection, contacts, commit=False)
+    rollups.record_fall(fall_detection)
+    return fall_detection, queued
+
+def store_fall(user_id, camera_id, location, severity):
+    # Runs on the write batcher's thread, which commits; returns plain values
+    user = db.session.get(User, user_id)
+    if user is None:
+        print(f"Fall on camera {camera_id} for unknown user {user_id}")
+        return None
+    
+    incident = None
+    if camera_id is not None:
+        incident, is_new = incident_manager.record_fall(user.id, camera_id)
+        if not is_new:
+            # Repeat of an ongoing incident: contacts have already been alerted
+            return {
+                'user_id': user.id,
+                'incident_id': incident.id,
+                'fall_id': incident.fall_detection_id,
+                'alerts_queued': 0,
+                'deduplicated': True
+            }
     
+    fall_detection, queued = record_fall_detection(user, camera_id, location, severity)
+    db.session.flush()
+    if incident is not None:
+        incident_manager.attach_detection(incident, fall_detection)
+    return {
+        'user_id': user.id,
+        'incident_id': incident.id if incident is not None else None,
+        'fall_id': fall_detection.id,
+        'timestamp': fall_detection.timestamp,
+        'location': location,
+        'severity': severity,
+        'alerts_queued': len(queued),
+        'deduplicated': False
+    }
+
+def fall_stored(future):
+    # Called once the batch holding the fall has been committed
+    if future.exception() is not None:
+        print(f"Error recording fall: {future.exception()}")
+        return
+    stored = future.result()
+    if stored is None:
+        return
+    if stored['deduplicated']:
+        print(f"Fall for user {stored['user_id']} added to incident {stored['incident_id']}")
+        return
+    alert_dispatcher.wake(stored['alerts_queued'])
+    event_bus.publish('fall_recorded', stored)
+
+def submit_fall(user_id, camera_id, location, severity):
+    """Queue a fall for the write batcher; camera_id=None skips incident deduplication."""
+    future = write_batcher.submit(store_fall, user_id, camera_id, location, severity)
+    future.add_done_callback(fall_stored)
+    return future
+
+def handle_fall_detected(event):
+    # Detector events arrive on the bus thread; the write happens behind it
+    submit_fall(event['user_id'], event['camera_id'], event['location'], event['severity'])
+
+def escalate_incident(incident):
+    # Nobody has acknowledged the incident yet: alert the contacts again
+    user = db.session.get(User, incident.user_id)
+    if user is None or incident.fall_detection is None:
+        return
+    contacts = EmergencyContact.query.filter_by(user_id=user.id).all()
+    alert_dispatcher.enqueue_fall_alert(user, incident.fall_detection, contacts,
+                                        reminder=incident.escalation_level)
+
+def emit_fall_detection(event):
     # Emit WebSocket event to the user
     socketio.emit('fall_detection', {
         'type': 'fall_detection',
-        'fall_id': fall_detection.id,
-        'timestamp': fall_detection.timestamp.isoformat(),
-        'location': location,
-        'severity': severity
-    }, room=f'user_{user.id}')
+        'fall_id': event['fall_id'],
+        'timestamp': event['timestamp'].isoformat(),
+        'location': event['location'],
+        'severity': event['severity']
+    }, room=f"user_{event['user_id']}")
+
+if app.config['ALERT_BRIDGE_URL']:
+    # Detection is split from the web tier: forward falls over HTTP instead
+    event_bus.subscribe('fall_detected', HttpAlertBridge(app.config['ALERT_BRIDGE_URL']))
+else:
+    event_bus.subscribe('fall_detected', handle_fall_detected)
+event_bus.subscribe('fall_recorded', emit_fall_detection)
+
+@app.route('/send_alert/<int:user_id>', methods=['POST'])
+def send_alert(user_id):
+    # Entry point for detectors running outside this process (see HttpAlertBridge)
+    
+    # Create a new fall detection record
+    location = request.form.get('location', 'Unknown')
+    severity = request.form.get('severity', 'Unknown')
+    camera_id = request.form.get('camera_id', location)
+    
+    # Concurrent alerts are committed together by the write batcher. The user
+    # is looked up there too, so waiting here holds no database connection.
+    try:
+        stored = submit_fall(user_id, camera_id, location, severity).result(timeout=10)
+    except concurrent.futures.TimeoutError:
+        # Still queued: it is committed and alerted when the batcher gets to it
+        return jsonify({'message': 'Fall queued', 'status': 'queued'}), 202
+    except Exception as e:
+        return jsonify({'error': f'Could not record the fall: {e}'}), 503
+    if stored is None:
+        abort(404)
     
     return jsonify({
-        'message': 'Fall alert sent',
-        'fall_id': fall_detection.id,
-        'alert_results': results
+        'message': 'Fall added to open incident' if stored['deduplicated'] else 'Fall alert queued',
+        'fall_id': stored['fall_id'],
+        'incident_id': stored['incident_id'],
+        'deduplicated': stored['deduplicated'],
+        'alerts_queued': stored['alerts_queued']
     })
 
+@app.route('/incidents')
+@login_required
+def list_incidents():
+    query = Incident.query.filter(Incident.status != 'closed')
+    if current_user.role != 'admin':
+        query = query.filter_by(user_id=current_user.id)
+    incidents = query.order_by(Incident.opened_at.desc()).all()
+    return jsonify([{
+        'id': incident.id,
+        'user_id': incident.user_id,
+        'camera_id': incident.camera_id,
+        'fall_id': incident.fall_detection_id,
+        'status': incident.status,
+        'opened_at': incident.opened_at.isoformat(),
+        'last_event_at': incident.last_event_at.isoformat(),
+        'event_count': incident.event_count,
+        'escalation_level': incident.escalation_level
+    } for incident in incidents])
+
+@app.route('/incidents/<int:incident_id>/acknowledge', methods=['POST'])
+@login_required
+def acknowledge_incident(incident_id):
+    incident = Incident.query.get_or_404(incident_id)
+    if current_user.role != 'admin' and incident.user_id != current_user.id:
+        return jsonify({'error': 'Permission denied'}), 403
+    incident_manager.acknowledge(incident, current_user.id)
+    return jsonify({'message': 'Incident acknowledged', 'id': incident.id})
+
+@app.route('/fall_detections/<int:fall_id>/alerts')
+@login_required
+def fall_alert_status(fall_id):
+    fall_detection = FallDetection.query.get_or_404(fall_id)
+    if current_user.role != 'admin' and fall_detection.user_id != current_user.id:
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    alerts = AlertOutbox.query.filter_by(fall_detection_id=fall_id).order_by(AlertOutbox.id).all()
+    return jsonify([{
+        'id': alert.id,
+        'contact': alert.contact.name if alert.contact else None,
+        'channel': alert.channel,
+        'status': alert.status,
+        'attempts': [{
+            'attempted_at': attempt.attempted_at.isoformat(),
+            'success': attempt.success,
+            'details': attempt.details,
+            'duration_ms': attempt.duration_ms
+        } for attempt in alert.attempt_log]
+    } for alert in alerts])
+
 # Add WebSocket event handlers
 @socketio.on('connect')
 def handle_connect():
@@ -328,6 +765,31 @@ def handle_connect():
         join_room(f'user_{current_user.id}')
         print(f'User {current_user.username} connected to WebSocket')
 
+def watched_camera_id(data):
+    # Same cameras /video_feed serves; None for anonymous sockets or unknown ids
+    if not current_user.is_authenticated:
+        return None
+    try:
+        camera_id = int(data['camera_id'])
+    except (TypeError, KeyError, ValueError):
+        return None
+    if camera_id not in ip_addresses and camera_id not in file_streams:
+        return None
+    return camera_id
+
+@socketio.on('watch_camera')
+def handle_watch_camera(data):
+    # Passthrough viewers receive the camera's detections as 'overlay' events
+    camera_id = watched_camera_id(data)
+    if camera_id is not None:
+        join_room(f'camera_{camera_id}')
+
+@socketio.on('unwatch_camera')
+def handle_unwatch_camera(data):
+    camera_id = watched_camera_id(data)
+    if camera_id is not None:
+        leave_room(f'camera_{camera_id}')
+
 @socketio.on('disconnect')
 def handle_disconnect():
     if current_user.is_authenticated:
@@ -374,6 +836,8 @@ def set_ip():
         ip_address = "http://" + ip_address
     
     ip_addresses[camera_id] = ip_address
+    file_streams.pop(camera_id, None)
+    video_streamer.close(camera_id)  # viewers reconnect to the new source
     print(f"Received IP address: {ip_address} for camera ID: {camera_id}")  # Log for debugging
     return jsonify({'message': 'IP address set successfully'}), 200
 
@@ -397,6 +861,8 @@ def upload_file():
         print(f"File saved at: {file_path}")
         video_processors[camera_id].start_processing(file_path, camera_id)
         file_streams[camera_id] = file_path  # Store the file path for the camera ID
+        ip_addresses.pop(camera_id, None)
+        video_streamer.close(camera_id)
         return jsonify({
             'message': 'File uploaded successfully',
             'filename': filename,
@@ -408,29 +874,229 @@ def upload_file():
 
 @app.route('/video_feed/<int:camera_id>')
 def video_feed(camera_id):
+    profile = request.args.get('profile', 'full')
+    if profile != PASSTHROUGH_PROFILE and profile not in app.config['STREAM_PROFILES']:
+        return jsonify({'error': f'Unknown profile {profile}'}), 400
+    
     if camera_id in ip_addresses:
         ip_address = ip_addresses[camera_id]
         print(f"Streaming from IP address: {ip_address} for camera ID: {camera_id}")  # Log IP address
-        esp32_cam = ESP32CamStreamer(f"{ip_address}/")  # Ensure the complete URL is passed
-        video_processor = video_processors[camera_id]
-        streamer = VideoStreamer(esp32_cam, video_processor)
-        return Response(streamer.generate_frames(), 
-                       mimetype='multipart/x-mixed-replace; boundary=frame',
-                       headers={'Cache-Control': 'no-cache, no-store, must-revalidate',
-                                'Pragma': 'no-cache',
-                                'Expires': '0'})
+        frames = video_streamer.generate_frames(
+            camera_id,
+            lambda: camera_source(camera_id, ip_address),
+            video_processors[camera_id],
+            profile
+        )
     elif camera_id in file_streams:
         print(f"Streaming from file for camera ID: {camera_id}")
-        streamer = video_streamers_file[camera_id]
-        return Response(streamer.get_frame(), 
-                       mimetype='multipart/x-mixed-replace; boundary=frame',
-                       headers={'Cache-Control': 'no-cache, no-store, must-revalidate',
-                                'Pragma': 'no-cache',
-                                'Expires': '0'})
+        # Frames were already processed by the VideoProcessor, just encode and fan out
+        frames = video_streamer.generate_frames(camera_id, lambda: video_streamers_file[camera_id], profile=profile)
     else:
         print(f"Camera ID {camera_id} not found")
         return jsonify({'error': 'Camera ID not found'}), 404
 
+    return Response(frames,
+                   mimetype='multipart/x-mixed-replace; boundary=frame',
+                   headers={'Cache-Control': 'no-cache, no-store, must-revalidate',
+                            'Pragma': 'no-cache',
+                            'Expires': '0'})
+
+@app.route('/pipeline_stats')
+@login_required
+def pipeline_stats():
+    # Per-stage queue depth, drop counts and timings for each live camera
+    stats = video_streamer.get_stats()
+    for camera_id, processor in video_processors.items():
+        if processor.scheduler is not None:
+            stats.setdefault(camera_id, {})['scheduler'] = processor.scheduler.get_stats()
+        if processor.region_planner is not None:
+            stats.setdefault(camera_id, {})['roi'] = processor.region_planner.get_stats()
+    return jsonify(stats)
+
+@app.route('/inference_stats')
+@login_required
+def inference_stats():
+    # Queue depth, and per-process load and restarts when INFERENCE_WORKERS is set
+    return jsonify(inference_engine.get_stats())
+
+def pipeline_metrics():
+    # Read at scrape time from the counters the pipelines already keep
+    for camera_id, stats in video_streamer.get_stats().items():
+        for stage in CameraPipeline.STAGES:
+            labels = {'camera': camera_id, 'stage': stage}
+            yield 'stage_fps', 'gauge', 'Frames per second through each pipeline stage', labels, stats[stage]['fps']
+            yield 'queue_depth', 'gauge', 'Frames waiting after each pipeline stage', labels, stats[stage]['queue_depth']
+            yield ('dropped_frames_total', 'counter', 'Frames replaced before the next stage read them',
+                   labels, stats[stage]['dropped'])
+            yield 'stage_errors_total', 'counter', 'Frames that failed in each pipeline stage', labels, stats[stage]['errors']
+        yield 'viewers', 'gauge', 'Connected viewers per camera', {'camera': camera_id}, stats['subscribers']
+        yield ('encode_reused_total', 'counter', 'Encodes skipped because the frame had not changed',
+               {'camera': camera_id}, stats['encode']['reused'])
+        yield ('source_errors_total', 'counter', 'Failed reads and reconnects of the camera source',
+               {'camera': camera_id}, stats['source'].get('errors', 0))
+
+def inference_metrics():
+    stats = inference_engine.get_stats()
+    if 'queued' in stats:
+        yield 'inference_queue_depth', 'gauge', 'Frames waiting for the model', {}, stats['queued']
+    for index, worker in enumerate(stats.get('workers', [])):
+        labels = {'worker': index}
+        yield 'inference_worker_in_flight', 'gauge', 'Frames sent to each worker process', labels, worker['in_flight']
+        yield 'inference_worker_restarts_total', 'counter', 'Worker process restarts', labels, worker['restarts']
+        yield 'inference_worker_up', 'gauge', 'Whether the worker process is alive', labels, worker['alive']
+
+def db_metrics():
+    stats = write_batcher.get_stats()
+    yield 'db_write_queue_depth', 'gauge', 'Writes waiting for the next batch', {}, stats['pending']
+
+def alert_metrics():
+    yield 'alerts_in_flight', 'gauge', 'Alerts being sent right now', {}, alert_dispatcher.in_flight
+    yield 'alerts_pending', 'gauge', 'Alerts queued in the outbox', {}, alert_dispatcher.pending
+
+def startup_metrics():
+    for phase in startup.as_dict()['phases']:
+        yield 'startup_seconds', 'gauge', 'Time taken by each startup phase', {'phase': phase['name']}, phase['seconds']
+
+metrics_registry.add_collector(pipeline_metrics, stage='capture')
+metrics_registry.add_collector(inference_metrics, stage='inference')
+metrics_registry.add_collector(db_metrics, stage='db')
+metrics_registry.add_collector(alert_metrics, stage='alerts')
+metrics_registry.add_collector(startup_metrics)
+
+def metrics_authorized():
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') == f'Bearer {token}':
+        return True
+    return current_user.is_authenticated
+
+@app.route('/metrics')
+def metrics():
+    if not metrics_authorized():
+        abort(401)
+    return Response(metrics_registry.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/metrics.json')
+def metrics_json():
+    if not metrics_authorized():
+        abort(401)
+    return jsonify(metrics_registry.as_dict())
+
+@app.route('/metrics/stages', methods=['GET', 'POST'])
+@login_required
+def metrics_stages():
+    if request.method == 'POST':
+        if current_user.role != 'admin':
+            return jsonify({'error': 'Permission denied'}), 403
+        try:
+            # e.g. {"encode": false} stops recording encode metrics until switched back on
+            metrics_registry.configure({stage: bool(enabled) for stage, enabled in (request.get_json() or {}).items()})
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    return jsonify(metrics_registry.stages())
+
+@app.route('/admin/profile')
+@login_required
+def profile_cameras():
+    # e.g. /admin/profile?seconds=10 | flamegraph.pl > cameras.svg; ?all=1 includes every thread
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Permission denied'}), 403
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval = float(request.args['interval_ms']) / 1000 if 'interval_ms' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'seconds and interval_ms must be numbers'}), 400
+    if seconds <= 0 or (interval is not None and interval <= 0):
+        return jsonify({'error': 'seconds and interval_ms must be positive'}), 400
+    try:
+        lines, stats = profiler.profile(seconds, interval, all_threads=request.args.get('all') == '1')
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+
+    if request.args.get('format') == 'json':
+        return jsonify({'stats': stats, 'stacks': lines})
+    filename = f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.collapsed"
+    response = Response('\n'.join(lines) + '\n', content_type='text/plain; charset=utf-8')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    response.headers['X-Profile-Samples'] = str(stats['samples'])
+    response.headers['X-Profile-Overhead'] = str(stats['overhead'])
+    response.headers['X-Profile-Interval-Ms'] = str(stats['final_interval_ms'])
+    return response
+
+def analysis_status(analysis):
+    status = {
+        'id': analysis.id,
+        'filename': analysis.filename,
+        'status': analysis.status,
+        'stride': analysis.stride,
+        'frames_done': analysis.frames_done,
+        'frames_total': analysis.frames_total,
+        'fall_count': analysis.fall_count,
+        'speed': None,
+        'error': analysis.error,
+        'created_at': analysis.created_at.isoformat(),
+        'finished_at': analysis.finished_at.isoformat() if analysis.finished_at else None
+    }
+    # Running jobs report live progress; the row is only updated every few seconds
+    live = video_analyzer.progress(analysis.id)
+    if live is not None and analysis.status in ('queued', 'running'):
+        status.update(status=live['status'], frames_done=live['frames_done'],
+                      frames_total=live['frames_total'], fall_count=live['falls'], speed=live['speed'])
+    if analysis.status == 'done' and analysis.video_duration and analysis.started_at:
+        elapsed = (analysis.finished_at - analysis.started_at).total_seconds()
+        status['speed'] = round(analysis.video_duration / elapsed, 2) if elapsed else None
+    if status['frames_total']:
+        status['progress'] = round(min(1.0, status['frames_done'] / status['frames_total']), 3)
+    else:
+        status['progress'] = None
+    if analysis.status == 'done':
+        status['falls'] = [{'time': event.video_time, 'person_id': event.person_id} for event in analysis.events]
+        status['results_url'] = url_for('analysis_results', analysis_id=analysis.id)
+    return status
+
+def get_analysis_or_403(analysis_id):
+    analysis = db.session.get(VideoAnalysis, analysis_id)
+    if analysis is None:
+        abort(404)
+    if current_user.role != 'admin' and analysis.user_id != current_user.id:
+        abort(403)
+    return analysis
+
+@app.route('/analysis', methods=['POST'])
+@login_required
+def start_analysis():
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({'error': 'No selected file'}), 400
+    stride = request.form.get('stride', app.config['ANALYSIS_STRIDE'], type=int)
+    if stride is None or stride < 1:
+        return jsonify({'error': 'stride must be a positive integer'}), 400
+
+    file = request.files['file']
+    filename = f"{datetime.utcnow():%Y%m%d%H%M%S}_{secure_filename(file.filename)}"
+    file_path = os.path.join('uploads', filename)
+    os.makedirs('uploads', exist_ok=True)
+    file.save(file_path)
+
+    analysis = video_analyzer.submit(current_user.id, file_path, stride)
+    return jsonify({
+        'id': analysis.id,
+        'status': analysis.status,
+        'status_url': url_for('get_analysis', analysis_id=analysis.id)
+    }), 202
+
+@app.route('/analysis/<int:analysis_id>')
+@login_required
+def get_analysis(analysis_id):
+    return jsonify(analysis_status(get_analysis_or_403(analysis_id)))
+
+@app.route('/analysis/<int:analysis_id>/results')
+@login_required
+def analysis_results(analysis_id):
+    analysis = get_analysis_or_403(analysis_id)
+    if analysis.status != 'done' or not analysis.results_path or not os.path.exists(analysis.results_path):
+        return jsonify({'error': 'Results not available'}), 404
+    return send_file(os.path.abspath(analysis.results_path), mimetype='application/gzip',
+                     as_attachment=True, download_name=os.path.basename(analysis.results_path))
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
     try:
@@ -453,24 +1119,30 @@ def test_fall(user_id):
     
     user = User.query.get_or_404(user_id)
     
-    # Create a test fall detection
-    fall_detection = FallDetection(
-        user_id=user.id,
-        location='Test Location',
-        severity='Medium'
-    )
-    db.session.add(fall_detection)
-    db.session.commit()
-    
-    # Get user's emergency contacts
-    contacts = EmergencyContact.query.filter_by(user_id=user.id).all()
-    
-    # Send alerts to all contacts
-    results = alert_system.send_fall_alert(user, fall_detection, contacts)
+    # Create a test fall detection and queue alerts for all contacts
+    try:
+        submit_fall(user.id, None, 'Test Location', 'Medium').result(timeout=10)
+    except concurrent.futures.TimeoutError:
+        flash('Test fall detection queued; it will appear shortly')
+        return redirect(url_for('dashboard'))
+    except Exception as e:
+        flash(f'Error creating test fall detection: {e}')
+        return redirect(url_for('dashboard'))
     
-    flash('Test fall detection created and alerts sent')
+    flash('Test fall detection created and alerts queued')
     return redirect(url_for('dashboard'))
 
+def warm_up_models():
+    # Runs alongside the web tier; with INFERENCE_WORKERS every process loads its copy in parallel
+    try:
+        with startup.phase('model warm-up'):
+            inference_engine.warmup()
+    except Exception as e:
+        print(f"Error warming up the model: {e}")
+    print(startup.format())
+
+startup.checkpoint('app setup')
+
 # Replace the @app.before_first_request decorator with a different approach
 # Remove this code:
 # @app.before_first_request
@@ -490,6 +1162,8 @@ if __name__ == "__main__":
     os.makedirs('uploads', exist_ok=True)
     with app.app_context():
         db.create_all()
+        ensure_columns()
+        ensure_indexes()
         # Create admin user if it doesn't exist
         admin = User.query.filter_by(username='admin').first()
         if admin is None:
@@ -497,5 +1171,13 @@ if __name__ == "__main__":
             admin.set_password('admin123')  # Change this in production
             db.session.add(admin)
             db.session.commit()
+    startup.checkpoint('database')
+    # Resume delivering any alerts left in the outbox by a previous run
+    alert_dispatcher.start()
+    incident_manager.start(escalate_incident)
+    startup.checkpoint('background services')
+    if app.config['INFERENCE_WARMUP']:
+        Thread(target=warm_up_models, name='model-warmup', daemon=True).start()
+    print(startup.format())
     # Remove app.run and use only socketio.run
     socketio.run(app, debug=True, use_reloader=False)
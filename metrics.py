@@ -0,0 +1,264 @@
+import bisect
+import math
+from threading import Lock
+
+# Seconds; covers a 1 ms encode up to a multi-second alert delivery
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Bytes; from a thumbnail JPEG up to a large full-quality frame
+BYTE_BUCKETS = (1024, 4096, 16384, 65536, 131072, 262144, 524288, 1048576, 4194304)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+# Instrumented stages; each can be switched off, see MetricsRegistry.set_stage
+STAGES = ('capture', 'inference', 'pose', 'encode', 'db', 'alerts')
+
+class _Child:
+    def __init__(self, family):
+        self.family = family
+        self.lock = Lock()
+
+class _CounterChild(_Child):
+    def __init__(self, family):
+        super().__init__(family)
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        if not self.family.enabled:
+            return
+        with self.lock:
+            self.value += amount
+
+    def sample(self):
+        return self.value
+
+class _GaugeChild(_Child):
+    def __init__(self, family):
+        super().__init__(family)
+        self.value = 0.0
+
+    def set(self, value):
+        if self.family.enabled:
+            self.value = value
+
+    def sample(self):
+        return self.value
+
+class _HistogramChild(_Child):
+    def __init__(self, family):
+        super().__init__(family)
+        self.counts = [0] * (len(family.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        if not self.family.enabled:
+            return
+        index = bisect.bisect_left(self.family.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def sample(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+class MetricFamily:
+    """One named metric with its labelled children (one per camera, channel, ...)."""
+
+    child_types = {'counter': _CounterChild, 'gauge': _GaugeChild, 'histogram': _HistogramChild}
+
+    def __init__(self, name, kind, help, labels=(), stage=None, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.label_names = tuple(labels)
+        self.stage = stage
+        self.buckets = tuple(buckets)
+        self.enabled = True
+        self.lock = Lock()
+        self.children = {}
+
+    def labels(self, *values):
+        """The child for these label values, e.g. family.labels(camera_id)."""
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self.child_types[self.kind](self))
+        return child
+
+    # Unlabelled metrics are used directly
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+class MetricsRegistry:
+    """Counters, gauges and histograms for the hot paths, exported as Prometheus text or JSON.
+
+    Recording is a lock-protected add, and a no-op while the metric's stage
+    is switched off. Numbers the components already keep (queue depths,
+    drop counts, reconnects) are not recorded twice: collectors registered
+    with add_collector() read them at scrape time instead.
+    """
+
+    def __init__(self, prefix='falldetect_'):
+        self.prefix = prefix
+        self.lock = Lock()
+        self.families = {}
+        self.collectors = []
+        self.disabled_stages = set()
+
+    def counter(self, name, help, labels=(), stage=None):
+        return self._family(name, 'counter', help, labels, stage)
+
+    def gauge(self, name, help, labels=(), stage=None):
+        return self._family(name, 'gauge', help, labels, stage)
+
+    def histogram(self, name, help, labels=(), stage=None, buckets=DEFAULT_BUCKETS):
+        return self._family(name, 'histogram', help, labels, stage, buckets)
+
+    def _family(self, name, kind, help, labels, stage, buckets=DEFAULT_BUCKETS):
+        with self.lock:
+            family = self.families.get(name)
+            if family is None:
+                family = MetricFamily(self.prefix + name, kind, help, labels, stage, buckets)
+                family.enabled = stage not in self.disabled_stages
+                self.families[name] = family
+            return family
+
+    def add_collector(self, collect, stage=None):
+        """collect() returns (name, kind, help, {labels}, value) samples read at scrape time."""
+        with self.lock:
+            self.collectors.append((collect, stage))
+
+    def set_stage(self, stage, enabled):
+        if stage not in STAGES:
+            raise ValueError(f'Unknown metrics stage {stage}')
+        with self.lock:
+            if enabled:
+                self.disabled_stages.discard(stage)
+            else:
+                self.disabled_stages.add(stage)
+            for family in self.families.values():
+                if family.stage == stage:
+                    family.enabled = enabled
+
+    def configure(self, stages):
+        """Apply a {stage: enabled} mapping such as app.config['METRICS_STAGES']."""
+        for stage, enabled in stages.items():
+            self.set_stage(stage, enabled)
+
+    def stages(self):
+        with self.lock:
+            return {stage: stage not in self.disabled_stages for stage in STAGES}
+
+    def _collected(self):
+        with self.lock:
+            collectors = [collect for collect, stage in self.collectors if stage not in self.disabled_stages]
+        samples = []
+        for collect in collectors:
+            try:
+                samples.extend(collect())
+            except Exception as e:
+                print(f"Error collecting metrics from {getattr(collect, '__name__', collect)}: {e}")
+        return samples
+
+    def render_prometheus(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self.lock:
+            families = list(self.families.values())
+        for family in families:
+            if not family.enabled:
+                continue
+            lines.append(f'# HELP {family.name} {family.help}')
+            lines.append(f'# TYPE {family.name} {family.kind}')
+            for values, child in list(family.children.items()):
+                labels = dict(zip(family.label_names, values))
+                if family.kind == 'histogram':
+                    counts, total, count = child.sample()
+                    cumulative = 0
+                    for bound, bucket_count in zip(family.buckets + (math.inf,), counts):
+                        cumulative += bucket_count
+                        le = '+Inf' if bound == math.inf else repr(bound)
+                        lines.append(f'{family.name}_bucket{_labels(labels, le=le)} {cumulative}')
+                    lines.append(f'{family.name}_sum{_labels(labels)} {_number(total)}')
+                    lines.append(f'{family.name}_count{_labels(labels)} {count}')
+                else:
+                    lines.append(f'{family.name}{_labels(labels)} {_number(child.sample())}')
+
+        # Collectors yield per camera, but each metric's lines must form one group
+        grouped = {}
+        for name, kind, help, labels, value in self._collected():
+            grouped.setdefault(self.prefix + name, (kind, help, []))[2].append((labels, value))
+        for name, (kind, help, samples) in grouped.items():
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def as_dict(self):
+        """The same metrics as nested dicts, with histogram percentiles estimated from the buckets."""
+        metrics = {}
+        with self.lock:
+            families = list(self.families.values())
+        for family in families:
+            if not family.enabled:
+                continue
+            samples = []
+            for values, child in list(family.children.items()):
+                sample = {'labels': dict(zip(family.label_names, values))}
+                if family.kind == 'histogram':
+                    counts, total, count = child.sample()
+                    sample.update(count=count, sum=round(total, 6),
+                                  mean=round(total / count, 6) if count else None)
+                    for quantile in (0.5, 0.95, 0.99):
+                        sample[f'p{round(quantile * 100)}'] = _quantile(family.buckets, counts, quantile)
+                else:
+                    sample['value'] = child.sample()
+                samples.append(sample)
+            metrics[family.name] = {'type': family.kind, 'help': family.help, 'stage': family.stage,
+                                    'samples': samples}
+        for name, kind, help, labels, value in self._collected():
+            entry = metrics.setdefault(self.prefix + name, {'type': kind, 'help': help, 'stage': None,
+                                                            'samples': []})
+            entry['samples'].append({'labels': dict(labels), 'value': value})
+        return {'stages': self.stages(), 'metrics': metrics}
+
+def _labels(labels, **extra):
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in items)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(items, escaped)) + '}'
+
+def _number(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _quantile(buckets, counts, quantile):
+    # Linear interpolation inside the bucket holding the quantile, like histogram_quantile()
+    total = sum(counts)
+    if not total:
+        return None
+    rank = quantile * total
+    cumulative = 0
+    lower = 0.0
+    for bound, count in zip(buckets, counts):
+        if cumulative + count >= rank:
+            return round(lower + (bound - lower) * (rank - cumulative) / count, 6) if count else round(lower, 6)
+        cumulative += count
+        lower = bound
+    return buckets[-1]  # in the +Inf bucket: the largest finite bound
+
+# Shared by every module, like the root logger
+registry = MetricsRegistry()
@@ -41,9 +41,122 @@ class EmergencyContact(db.Model):
 class FallDetection(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    camera_id = db.Column(db.String(50), nullable=True)  # None for falls not seen by a camera
     location = db.Column(db.String(100), nullable=True)
     severity = db.Column(db.String(20), nullable=True)
     
+    # Per-user history is always read newest first
+    __table_args__ = (db.Index('ix_fall_detection_user_timestamp', 'user_id', 'timestamp'),)
+    
+    def __repr__(self):
+        return f'<FallDetection {self.id} for User {self.user_id}>'
+
+class AlertOutbox(db.Model):
+    # One queued message per contact and channel, delivered in the background
+    id = db.Column(db.Integer, primary_key=True)
+    fall_detection_id = db.Column(db.Integer, db.ForeignKey('fall_detection.id'), nullable=False)
+    contact_id = db.Column(db.Integer, db.ForeignKey('emergency_contact.id'), nullable=True)
+    channel = db.Column(db.String(20), nullable=False)  # 'sms', 'whatsapp', 'email'
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=True)
+    message = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), default='pending', index=True)  # 'pending', 'sending', 'sent', 'failed'
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    fall_detection = db.relationship('FallDetection', backref=db.backref('alerts', lazy=True))
+    contact = db.relationship('EmergencyContact', backref=db.backref('alerts', lazy=True))
+    attempt_log = db.relationship('AlertAttempt', backref='outbox', lazy=True, order_by='AlertAttempt.id')
+    
+    def __repr__(self):
+        return f'<AlertOutbox {self.id} {self.channel} {self.status}>'
+
+class AlertAttempt(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    outbox_id = db.Column(db.Integer, db.ForeignKey('alert_outbox.id'), nullable=False, index=True)
+    attempted_at = db.Column(db.DateTime, default=datetime.utcnow)
+    success = db.Column(db.Boolean, default=False)
+    details = db.Column(db.Text, nullable=True)
+    duration_ms = db.Column(db.Float, nullable=True)
+    
+    def __repr__(self):
+        return f'<AlertAttempt {self.id} for Outbox {self.outbox_id}>'
+
+class Incident(db.Model):
+    # Fall events for the same user and camera collapsed into one alerting incident
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    camera_id = db.Column(db.String(50), nullable=False)
+    fall_detection_id = db.Column(db.Integer, db.ForeignKey('fall_detection.id'), nullable=True)
+    status = db.Column(db.String(20), default='open', index=True)  # 'open', 'acknowledged', 'closed'
+    opened_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_event_at = db.Column(db.DateTime, default=datetime.utcnow)
+    event_count = db.Column(db.Integer, default=1)
+    escalation_level = db.Column(db.Integer, default=0)
+    next_escalation_at = db.Column(db.DateTime, nullable=True, index=True)
+    acknowledged_at = db.Column(db.DateTime, nullable=True)
+    acknowledged_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    
+    __table_args__ = (db.Index('ix_incident_user_camera_status', 'user_id', 'camera_id', 'status'),)
+    
+    fall_detection = db.relationship('FallDetection', backref=db.backref('incident', uselist=False))
+    
+    def __repr__(self):
+        return f'<Incident {self.id} for User {self.user_id} on {self.camera_id}>'
+
+class FallRollup(db.Model):
+    # Fall counts per day or hour, user, camera and severity, kept up to date as falls are stored
+    id = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.String(10), nullable=False)  # 'day' or 'hour'
+    period_start = db.Column(db.DateTime, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    camera_id = db.Column(db.String(50), nullable=False, default='')
+    location = db.Column(db.String(100), nullable=False, default='')  # the camera's latest location in the period
+    severity = db.Column(db.String(20), nullable=False, default='')
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('bucket', 'period_start', 'user_id', 'camera_id', 'severity',
+                            name='uq_fall_rollup_key'),
+        db.Index('ix_fall_rollup_bucket_period', 'bucket', 'period_start'),
+    )
+    
+    def __repr__(self):
+        return f'<FallRollup {self.bucket} {self.period_start} {self.count}>'
+
+class VideoAnalysis(db.Model):
+    # Offline analysis of a recorded video; the full timeline is in results_path
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(20), default='queued', index=True)  # 'queued', 'running', 'done', 'failed'
+    stride = db.Column(db.Integer, default=1)
+    frames_total = db.Column(db.Integer, nullable=True)
+    frames_done = db.Column(db.Integer, default=0)
+    video_duration = db.Column(db.Float, nullable=True)  # seconds
+    fall_count = db.Column(db.Integer, default=0)
+    results_path = db.Column(db.String(255), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    events = db.relationship('VideoFallEvent', backref='analysis', lazy=True,
+                             order_by='VideoFallEvent.video_time')
+    
+    def __repr__(self):
+        return f'<VideoAnalysis {self.id} {self.filename} {self.status}>'
+
+class VideoFallEvent(db.Model):
+    # A fall found in a recorded video, at video_time seconds from its start
+    id = db.Column(db.Integer, primary_key=True)
+    analysis_id = db.Column(db.Integer, db.ForeignKey('video_analysis.id'), nullable=False, index=True)
+    video_time = db.Column(db.Float, nullable=False)
+    person_id = db.Column(db.Integer, nullable=False)
+    
     def __repr__(self):
-        return f'<FallDetection {self.id} for User {self.user_id}>'
\ No newline at end of file
+        return f'<VideoFallEvent {self.analysis_id} at {self.video_time:.1f}s>'
@@ -0,0 +1,81 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import tuple_
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+class Keyset:
+    """Keyset (cursor) pagination over a fixed, unique ordering.
+
+    Pages continue from the last row seen (WHERE (a, b) < (:a, :b)) instead
+    of skipping rows with OFFSET, so every page is a single index range
+    scan no matter how deep it is. The last column must be unique, e.g. id.
+    Cursors are opaque URL-safe strings.
+    """
+
+    def __init__(self, *columns, descending=True):
+        self.columns = columns
+        self.descending = descending
+
+    def apply(self, query, cursor=None):
+        """Order query and, given a cursor, start after the row it points at."""
+        if cursor:
+            values = self.decode(cursor)
+            if self.descending:
+                query = query.filter(tuple_(*self.columns) < tuple_(*values))
+            else:
+                query = query.filter(tuple_(*self.columns) > tuple_(*values))
+        return query.order_by(*[column.desc() if self.descending else column.asc()
+                                 for column in self.columns])
+
+    def page(self, query, cursor=None, per_page=25):
+        # One extra row tells whether there is a next page
+        rows = self.apply(query, cursor).limit(per_page + 1).all()
+        next_cursor = self.cursor_for(rows[per_page - 1]) if len(rows) > per_page else None
+        return KeysetPage(rows[:per_page], next_cursor)
+
+    def stream_json(self, query, serialize, cursor=None, limit=1000, chunk_size=500):
+        """Yield a JSON document {"items": [...], "next_cursor": ...} piece by piece.
+
+        Rows are fetched chunk_size at a time, so memory use does not grow
+        with limit.
+        """
+        rows = self.apply(query, cursor).limit(limit + 1).yield_per(chunk_size)
+        yield '{"items": ['
+        last = None
+        next_cursor = None
+        for count, row in enumerate(rows):
+            if count == limit:
+                next_cursor = self.cursor_for(last)
+                break
+            yield (',' if count else '') + json.dumps(serialize(row))
+            last = row
+        yield '], "next_cursor": ' + json.dumps(next_cursor) + '}'
+
+    def cursor_for(self, row):
+        values = [getattr(row, column.key) for column in self.columns]
+        values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+    def decode(self, cursor):
+        """Column values from a cursor; raises ValueError if it is malformed."""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (TypeError, UnicodeDecodeError, json.JSONDecodeError, base64.binascii.Error) as e:
+            raise ValueError(f'Invalid cursor: {e}')
+        if not isinstance(values, list) or len(values) != len(self.columns):
+            raise ValueError('Invalid cursor')
+        try:
+            return [datetime.fromisoformat(value) if column.type.python_type is datetime else value
+                    for column, value in zip(self.columns, values)]
+        except TypeError as e:
+            raise ValueError(f'Invalid cursor: {e}')
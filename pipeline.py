@@ -0,0 +1,409 @@
+import cv2
+import numpy as np
+import time
+from threading import Thread, Condition, Lock
+from encoder import FrameEncoder, PASSTHROUGH_PROFILE, multipart_chunk
+from metrics import registry, BYTE_BUCKETS
+
+CAPTURE_FRAMES = registry.counter('capture_frames_total', 'Frames read from the camera source',
+                                  ['camera'], stage='capture')
+CAPTURE_SECONDS = registry.histogram('capture_seconds', 'Time to read one frame from the camera source',
+                                     ['camera'], stage='capture')
+INFER_STAGE_SECONDS = registry.histogram('infer_stage_seconds',
+                                         'Time per frame in the inference stage (decode, model, tracking, drawing)',
+                                         ['camera'], stage='inference')
+ENCODE_SECONDS = registry.histogram('encode_seconds', 'Time to JPEG-encode one frame for every active profile',
+                                    ['camera'], stage='encode')
+# Its count is the frames encoded per profile and its sum the bytes sent
+ENCODE_FRAME_BYTES = registry.histogram('encode_frame_bytes', 'Size of one multipart JPEG chunk',
+                                        ['camera', 'profile'], stage='encode', buckets=BYTE_BUCKETS)
+
+FPS_WINDOW = 5.0  # seconds over which StageStats measures fps
+
+class LatestSlot:
+    """Single-slot buffer between two stages; a new item replaces any unread one."""
+
+    def __init__(self):
+        self.condition = Condition()
+        self.item = None
+        self.has_item = False
+        self.closed = False
+        self.puts = 0
+        self.drops = 0
+
+    def put(self, item):
+        with self.condition:
+            if self.has_item:
+                self.drops += 1  # the consumer never saw the previous item
+            self.item = item
+            self.has_item = True
+            self.puts += 1
+            self.condition.notify_all()
+
+    def get(self, timeout=None):
+        """Take the newest item, or return None on timeout or close."""
+        with self.condition:
+            if not self.has_item and not self.closed:
+                self.condition.wait(timeout)
+            if not self.has_item:
+                return None
+            item = self.item
+            self.item = None
+            self.has_item = False
+            return item
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def depth(self):
+        return 1 if self.has_item else 0
+
+class Broadcast:
+    """Fans every item out to each subscriber's own LatestSlot.
+
+    A slow subscriber only skips items in its own slot and never holds up
+    the producer or the other subscribers.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.subscribers = []
+        self.latest = None
+        self.puts = 0
+        self.closed = False
+
+    def subscribe(self):
+        slot = LatestSlot()
+        with self.lock:
+            if self.latest is not None:
+                slot.put(self.latest)  # new viewers get a picture straight away
+            self.subscribers.append(slot)
+        return slot
+
+    def unsubscribe(self, slot):
+        """Remove a subscriber and return how many are left."""
+        with self.lock:
+            if slot in self.subscribers:
+                self.subscribers.remove(slot)
+            remaining = len(self.subscribers)
+        slot.close()
+        return remaining
+
+    def put(self, item):
+        with self.lock:
+            self.latest = item
+            self.puts += 1
+            subscribers = list(self.subscribers)
+        for slot in subscribers:
+            slot.put(item)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            subscribers = list(self.subscribers)
+        for slot in subscribers:
+            slot.close()
+
+    def subscriber_count(self):
+        with self.lock:
+            return len(self.subscribers)
+
+    def depth(self):
+        with self.lock:
+            return max((slot.depth() for slot in self.subscribers), default=0)
+
+    @property
+    def drops(self):
+        with self.lock:
+            return sum(slot.drops for slot in self.subscribers)
+
+class ProfileBroadcast:
+    """One Broadcast per encode profile, created when its first viewer subscribes."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.broadcasts = {}
+        self.closed = False
+
+    def subscribe(self, profile):
+        with self.lock:
+            broadcast = self.broadcasts.setdefault(profile, Broadcast())
+        return broadcast.subscribe()
+
+    def unsubscribe(self, slot):
+        """Remove a subscriber from whichever profile it watches; returns how many are left."""
+        with self.lock:
+            broadcasts = list(self.broadcasts.values())
+        for broadcast in broadcasts:
+            broadcast.unsubscribe(slot)
+        return self.subscriber_count()
+
+    def active_profiles(self):
+        with self.lock:
+            return [profile for profile, broadcast in self.broadcasts.items()
+                    if broadcast.subscriber_count()]
+
+    def put(self, profile, item):
+        with self.lock:
+            broadcast = self.broadcasts.get(profile)
+        if broadcast is not None:
+            broadcast.put(item)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            broadcasts = list(self.broadcasts.values())
+        for broadcast in broadcasts:
+            broadcast.close()
+
+    def subscriber_count(self):
+        with self.lock:
+            broadcasts = list(self.broadcasts.values())
+        return sum(broadcast.subscriber_count() for broadcast in broadcasts)
+
+    def depth(self):
+        with self.lock:
+            broadcasts = list(self.broadcasts.values())
+        return max((broadcast.depth() for broadcast in broadcasts), default=0)
+
+    @property
+    def drops(self):
+        with self.lock:
+            broadcasts = list(self.broadcasts.values())
+        return sum(broadcast.drops for broadcast in broadcasts)
+
+class StageStats:
+    def __init__(self):
+        self.processed = 0
+        self.errors = 0
+        self.skipped = 0
+        self.total_time = 0.0
+        self.last_time = 0.0
+        self.fps = 0.0
+        self.window_started = time.monotonic()
+        self.window_count = 0
+
+    def record(self, elapsed):
+        self.processed += 1
+        self.total_time += elapsed
+        self.last_time = elapsed
+        self.window_count += 1
+        now = time.monotonic()
+        if now - self.window_started >= FPS_WINDOW:
+            self.fps = self.window_count / (now - self.window_started)
+            self.window_started = now
+            self.window_count = 0
+
+    def current_fps(self):
+        # A stage that stopped producing would otherwise keep its last rate
+        if time.monotonic() - self.window_started >= 2 * FPS_WINDOW:
+            return 0.0
+        return self.fps
+
+    def as_dict(self):
+        avg = self.total_time / self.processed if self.processed else 0.0
+        return {
+            'processed': self.processed,
+            'errors': self.errors,
+            'skipped': self.skipped,
+            'fps': round(self.current_fps(), 2),
+            'avg_ms': round(avg * 1000, 2),
+            'last_ms': round(self.last_time * 1000, 2)
+        }
+
+class CameraPipeline:
+    """Capture, inference and JPEG encoding for one camera, each on its own thread.
+
+    Stages are joined by LatestSlot buffers, so a slow stage drops stale frames
+    instead of building up lag: detection always runs on the newest capture.
+    Each frame is encoded once per profile that has viewers (see encoder.py)
+    and broadcast to those viewers; unchanged frames are not re-encoded. Without a
+    video_processor the inference stage passes frames through untouched
+    (e.g. frames that were already processed from an uploaded file).
+
+    With passthrough=True and a source that has get_jpeg(), the camera's
+    own JPEGs go straight to PASSTHROUGH_PROFILE viewers. They are decoded
+    (at 1/decode_scale size) only for detection, or for viewers of other
+    profiles. Detections are then handed to on_overlay(camera_id, overlay)
+    whenever they change, so clients can draw them.
+    """
+
+    STAGES = ('capture', 'infer', 'encode')
+
+    DECODE_FLAGS = {
+        1: cv2.IMREAD_COLOR,
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8
+    }
+
+    def __init__(self, camera_id, source, video_processor=None, idle_sleep=0.01, profiles=None,
+                 passthrough=False, on_overlay=None, decode_scale=1):
+        self.camera_id = camera_id
+        self.source = source
+        self.video_processor = video_processor
+        self.idle_sleep = idle_sleep
+        self.encoder = FrameEncoder(profiles)
+        self.passthrough = passthrough and hasattr(source, 'get_jpeg')
+        self.on_overlay = on_overlay
+        self.decode_flags = self.DECODE_FLAGS[decode_scale]
+        self.last_overlay = None
+
+        # Each stage writes into its own slot: captured -> inferred -> encoded
+        self.slots = {
+            'capture': LatestSlot(),
+            'infer': LatestSlot(),
+            'encode': ProfileBroadcast()
+        }
+        self.stats = {stage: StageStats() for stage in self.STAGES}
+        label = str(camera_id)
+        self.capture_frames = CAPTURE_FRAMES.labels(label)
+        self.capture_seconds = CAPTURE_SECONDS.labels(label)
+        self.infer_seconds = INFER_STAGE_SECONDS.labels(label)
+        self.encode_seconds = ENCODE_SECONDS.labels(label)
+        self.threads = []
+        self.should_stop = False
+
+    def start(self):
+        if self.threads:
+            return
+        self.should_stop = False
+        self.source.start()
+        for stage, target in (('capture', self._capture_loop),
+                              ('infer', self._infer_loop),
+                              ('encode', self._encode_loop)):
+            thread = Thread(target=target, name=f'camera-{self.camera_id}-{stage}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.should_stop = True
+        for slot in self.slots.values():
+            slot.close()
+        for thread in self.threads:
+            thread.join(timeout=2)
+        self.threads = []
+        self.source.stop()
+
+    def subscribe(self, profile='full'):
+        if profile == PASSTHROUGH_PROFILE and not self.passthrough:
+            profile = 'full'  # no camera JPEGs to forward, send our own encode instead
+        if profile != PASSTHROUGH_PROFILE and profile not in self.encoder.profiles:
+            raise ValueError(f'Unknown stream profile {profile}')
+        return self.slots['encode'].subscribe(profile)
+
+    def unsubscribe(self, slot):
+        return self.slots['encode'].unsubscribe(slot)
+
+    def subscriber_count(self):
+        return self.slots['encode'].subscriber_count()
+
+    def frames(self, slot):
+        """Yield the newest multipart MJPEG chunk for one subscriber."""
+        while not self.should_stop and not slot.closed:
+            chunk = slot.get(timeout=1.0)
+            if chunk is None:
+                continue
+            yield chunk
+
+    def get_stats(self):
+        stats = {}
+        for stage in self.STAGES:
+            stage_stats = self.stats[stage].as_dict()
+            stage_stats['queue_depth'] = self.slots[stage].depth()
+            stage_stats['dropped'] = self.slots[stage].drops
+            stats[stage] = stage_stats
+        stats['encode'].update(self.encoder.get_stats())
+        stats['subscribers'] = self.subscriber_count()
+        stats['source'] = self.source.get_stats()
+        return stats
+
+    def encoded_profiles(self):
+        return [profile for profile in self.slots['encode'].active_profiles()
+                if profile != PASSTHROUGH_PROFILE]
+
+    def _capture_loop(self):
+        while not self.should_stop:
+            started = time.perf_counter()
+            frame = self.source.get_jpeg() if self.passthrough else self.source.get_frame()
+            if frame is None:
+                time.sleep(self.idle_sleep)
+                continue
+            elapsed = time.perf_counter() - started
+            self.stats['capture'].record(elapsed)
+            self.capture_frames.inc()
+            self.capture_seconds.observe(elapsed)
+            if self.passthrough:
+                self.slots['encode'].put(PASSTHROUGH_PROFILE, multipart_chunk(frame))
+            self.slots['capture'].put(frame)
+
+    def _infer_loop(self):
+        while not self.should_stop:
+            frame = self.slots['capture'].get(timeout=0.5)
+            if frame is None:
+                continue
+            if self.passthrough:
+                # Only decode when something needs pixels
+                if self.video_processor is None and not self.encoded_profiles():
+                    continue
+                frame = cv2.imdecode(np.frombuffer(frame, np.uint8), self.decode_flags)
+                if frame is None:
+                    self.stats['infer'].errors += 1
+                    continue
+            if self.video_processor is None:
+                self.slots['infer'].put(frame)
+                continue
+            started = time.perf_counter()
+            try:
+                if self.passthrough:
+                    self.video_processor.analyze(frame, self.camera_id)
+                    self._publish_overlay(frame.shape)
+                    processed_frame = self.video_processor.annotate(frame) if self.encoded_profiles() else None
+                else:
+                    processed_frame = self.video_processor.process_frame(frame, self.camera_id)
+            except Exception as e:
+                self.stats['infer'].errors += 1
+                print(f"Error processing frame for camera {self.camera_id}: {e}")
+                continue
+            elapsed = time.perf_counter() - started
+            self.stats['infer'].record(elapsed)
+            self.infer_seconds.observe(elapsed)
+            if processed_frame is not None:
+                self.slots['infer'].put(processed_frame)
+
+    def _publish_overlay(self, frame_shape):
+        overlay = self.video_processor.overlay(frame_shape)
+        if self.on_overlay is None or overlay == self.last_overlay:
+            return
+        self.last_overlay = overlay
+        try:
+            self.on_overlay(self.camera_id, overlay)
+        except Exception as e:
+            print(f"Error publishing overlay for camera {self.camera_id}: {e}")
+
+    def _encode_loop(self):
+        while not self.should_stop:
+            frame = self.slots['infer'].get(timeout=0.5)
+            if frame is None:
+                continue
+            profiles = self.encoded_profiles()
+            if not profiles:
+                continue
+            started = time.perf_counter()
+            try:
+                chunks = self.encoder.encode(frame, profiles)
+            except Exception as e:
+                self.stats['encode'].errors += 1
+                print(f"Error encoding frame for camera {self.camera_id}: {e}")
+                continue
+            if not chunks:
+                self.stats['encode'].skipped += 1  # frame unchanged since the last encode
+                continue
+            elapsed = time.perf_counter() - started
+            self.stats['encode'].record(elapsed)
+            self.encode_seconds.observe(elapsed)
+            for profile, chunk in chunks.items():
+                ENCODE_FRAME_BYTES.labels(self.camera_id, profile).observe(len(chunk))
+                self.slots['encode'].put(profile, chunk)
@@ -0,0 +1,121 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Labels for threads whose name says nothing, e.g. request threads streaming a camera
+thread_labels = {}
+
+@contextmanager
+def label_thread(label):
+    """Attribute the current thread's samples to label (e.g. 'camera-1-viewer') while inside."""
+    ident = threading.get_ident()
+    previous = thread_labels.get(ident)
+    thread_labels[ident] = label
+    try:
+        yield
+    finally:
+        if previous is None:
+            thread_labels.pop(ident, None)
+        else:
+            thread_labels[ident] = previous
+
+class SamplingProfiler:
+    """Samples the stacks of running threads and aggregates them as collapsed stacks.
+
+    Camera threads are named camera-<id>-<stage> (see CameraPipeline), so
+    every stack is rooted at its camera and stage, ready for flamegraph.pl
+    or speedscope. Sampling holds the GIL while it walks the stacks, so the
+    time it spends is the cost to the pipeline. That cost is measured, and
+    when it exceeds max_overhead the interval is doubled (up to 100 ms).
+    Only one profile runs at a time.
+    """
+
+    def __init__(self, interval=0.005, max_seconds=60.0, max_overhead=0.02, prefix='camera-'):
+        self.interval = interval  # seconds between samples
+        self.max_seconds = max_seconds
+        self.max_overhead = max_overhead  # fraction of wall time sampling may use
+        self.prefix = prefix  # only threads whose label starts with this, unless all_threads
+        self.lock = threading.Lock()
+
+    def profile(self, seconds, interval=None, all_threads=False):
+        """Sample for seconds and return (collapsed stack lines, stats).
+
+        Raises RuntimeError if another profile is running.
+        """
+        if not self.lock.acquire(blocking=False):
+            raise RuntimeError('A profile is already running')
+        try:
+            return self._sample(min(seconds, self.max_seconds), interval or self.interval, all_threads)
+        finally:
+            self.lock.release()
+
+    def _sample(self, seconds, interval, all_threads):
+        own = threading.get_ident()
+        stacks = Counter()
+        per_thread = Counter()
+        samples = 0
+        busy = 0.0
+        start_interval = interval
+        names = {}
+        names_refreshed = 0.0
+
+        started = time.perf_counter()
+        deadline = started + seconds
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if now - names_refreshed >= 1.0:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                names_refreshed = now
+
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                label = thread_labels.get(ident) or names.get(ident, f'thread-{ident}')
+                if not all_threads and not label.startswith(self.prefix):
+                    continue
+                stacks[';'.join(_root(label) + _stack(frame))] += 1
+                per_thread[label] += 1
+            samples += 1
+
+            finished = time.perf_counter()
+            busy += finished - now
+            elapsed = finished - started
+            # Judge the overhead over a quarter second at least, not the first sample alone
+            if elapsed >= 0.25 and busy > self.max_overhead * elapsed and interval < 0.1:
+                interval = min(0.1, interval * 2)  # back off instead of slowing the cameras down
+            time.sleep(max(0.0, interval - (finished - now)))
+
+        elapsed = time.perf_counter() - started
+        lines = [f'{stack} {count}' for stack, count in stacks.most_common()]
+        return lines, {
+            'seconds': round(elapsed, 3),
+            'samples': samples,
+            'interval_ms': round(start_interval * 1000, 3),
+            'final_interval_ms': round(interval * 1000, 3),
+            'sampling_ms': round(busy * 1000, 3),
+            'overhead': round(busy / elapsed, 4) if elapsed else 0.0,
+            'threads': dict(per_thread)
+        }
+
+def _root(label):
+    # camera-3-infer -> ['camera 3', 'infer'], so each camera is its own tower
+    parts = label.split('-', 2)
+    if len(parts) == 3 and parts[0] == 'camera':
+        return [f'camera {parts[1]}', parts[2]]
+    return [label]
+
+def _stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename)
+        if filename != 'threading.py':  # thread bootstrap frames only add noise
+            names.append(f"{getattr(code, 'co_qualname', code.co_name)} ({filename})")
+        frame = frame.f_back
+    names.reverse()
+    return names
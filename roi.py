@@ -0,0 +1,117 @@
+import time
+
+class RegionPlanner:
+    """Plans where to run the model based on where people were last seen.
+
+    Between full-frame scans, only padded crops around the previous boxes are
+    sent to the model at a reduced input size. A full scan happens every
+    full_scan_interval seconds, when nobody was being tracked, or when a
+    person seems lost (fewer people found than expected, or a box touching a
+    crop border).
+    """
+
+    def __init__(self, padding=0.3, imgsz=320, full_scan_interval=1.0, edge_margin=4):
+        self.padding = padding  # fraction of box size added on every side
+        self.imgsz = imgsz  # model input size for crops
+        self.full_scan_interval = full_scan_interval
+        self.edge_margin = edge_margin  # pixels from a crop border that count as touching it
+        self.boxes = []
+        self.last_full_scan = None
+        self.force_full_scan = True
+        self.full_scans = 0
+        self.crop_scans = 0
+
+    def plan(self, frame_shape, now=None):
+        """Return the crop regions (x1, y1, x2, y2) to infer on, or None for a full scan."""
+        now = time.monotonic() if now is None else now
+        if (self.force_full_scan or not self.boxes or self.last_full_scan is None or
+                now - self.last_full_scan >= self.full_scan_interval):
+            self.last_full_scan = now
+            self.full_scans += 1
+            return None
+
+        height, width = frame_shape[:2]
+        regions = []
+        for x1, y1, x2, y2 in self.boxes:
+            pad_x = (x2 - x1) * self.padding
+            pad_y = (y2 - y1) * self.padding
+            regions.append((
+                max(0, int(x1 - pad_x)), max(0, int(y1 - pad_y)),
+                min(width, int(x2 + pad_x) + 1), min(height, int(y2 + pad_y) + 1)
+            ))
+        self.crop_scans += 1
+        return self.merge_regions(regions)
+
+    @staticmethod
+    def merge_regions(regions):
+        # Overlapping crops are replaced by their union so nobody is detected twice
+        merged = []
+        for region in sorted(regions):
+            x1, y1, x2, y2 = region
+            for i, (mx1, my1, mx2, my2) in enumerate(merged):
+                if x1 < mx2 and mx1 < x2 and y1 < my2 and my1 < y2:
+                    merged[i] = (min(x1, mx1), min(y1, my1), max(x2, mx2), max(y2, my2))
+                    break
+            else:
+                merged.append(region)
+        if len(merged) < len(regions):
+            return RegionPlanner.merge_regions(merged)
+        return merged
+
+    def update(self, boxes, regions, frame_shape):
+        """Record the boxes found on this frame (full-frame coordinates)."""
+        boxes = [tuple(box) for box in boxes]
+        self.force_full_scan = False
+
+        if regions is not None:
+            height, width = frame_shape[:2]
+            if len(boxes) < len(self.boxes):
+                self.force_full_scan = True  # someone was lost
+            for x1, y1, x2, y2 in boxes:
+                if self.touches_border((x1, y1, x2, y2), regions, width, height):
+                    self.force_full_scan = True  # someone is walking out of their crop
+                    break
+
+        self.boxes = boxes
+
+    def touches_border(self, box, regions, width, height):
+        x1, y1, x2, y2 = box
+        m = self.edge_margin
+        for rx1, ry1, rx2, ry2 in regions:
+            if x1 >= rx1 - m and y1 >= ry1 - m and x2 <= rx2 + m and y2 <= ry2 + m:
+                # Only crop borders count, the frame border is a real edge
+                return ((rx1 > 0 and x1 - rx1 < m) or (ry1 > 0 and y1 - ry1 < m) or
+                        (rx2 < width and rx2 - x2 < m) or (ry2 < height and ry2 - y2 < m))
+        return True
+
+    def get_stats(self):
+        return {'full_scans': self.full_scans, 'crop_scans': self.crop_scans, 'tracked': len(self.boxes)}
+
+def merge_crop_results(frame, crop_results, regions):
+    """Combine per-crop results into one Results in full-frame coordinates."""
+    import torch  # deferred like the model itself, see InferenceEngine.load
+    from ultralytics.engine.results import Results
+
+    boxes = []
+    keypoints = []
+    for result, (x1, y1, _, _) in zip(crop_results, regions):
+        offset = torch.tensor([x1, y1], dtype=result.boxes.data.dtype, device=result.boxes.data.device)
+        data = result.boxes.data.clone()
+        data[:, 0:2] += offset
+        data[:, 2:4] += offset
+        boxes.append(data)
+        if result.keypoints is not None:
+            points = result.keypoints.data.clone()
+            # Missing keypoints stay at (0, 0) so pose checks still see them as missing
+            visible = (points[..., :2] != 0).any(dim=-1, keepdim=True)
+            points[..., :2] += offset * visible
+            keypoints.append(points)
+
+    first = crop_results[0]
+    return Results(
+        frame,
+        path=first.path,
+        names=first.names,
+        boxes=torch.cat(boxes),
+        keypoints=torch.cat(keypoints) if keypoints else None
+    )
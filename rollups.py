@@ -0,0 +1,109 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from models import db, FallDetection, FallRollup
+
+BUCKETS = ('day', 'hour')
+GROUP_COLUMNS = {
+    'user': FallRollup.user_id,
+    'camera': FallRollup.camera_id,
+    'location': FallRollup.location,
+    'severity': FallRollup.severity
+}
+
+def period_start(timestamp, bucket):
+    if bucket == 'day':
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+def _keys(timestamp, user_id, camera_id, severity):
+    # Rollups are per camera; location is carried along, so a renamed or
+    # shared location neither splits nor merges a camera's counts
+    for bucket in BUCKETS:
+        yield (bucket, period_start(timestamp, bucket), user_id,
+               str(camera_id) if camera_id is not None else '', severity or '')
+
+def record_fall(fall_detection):
+    """Count a newly stored fall in the rollups; the caller commits.
+
+    Runs in the same transaction as the fall itself (the write batcher's),
+    so rollups never disagree with FallDetection.
+    """
+    db.session.flush()  # fills in the timestamp default
+    for bucket, start, user_id, camera_id, severity in _keys(
+            fall_detection.timestamp, fall_detection.user_id,
+            fall_detection.camera_id, fall_detection.severity):
+        rollup = FallRollup.query.filter_by(
+            bucket=bucket, period_start=start, user_id=user_id,
+            camera_id=camera_id, severity=severity).first()
+        if rollup is None:
+            rollup = FallRollup(bucket=bucket, period_start=start, user_id=user_id,
+                                camera_id=camera_id, severity=severity, count=0)
+            db.session.add(rollup)
+        rollup.location = fall_detection.location or ''
+        rollup.count += 1
+
+def rebuild(chunk_size=10000):
+    """Recompute every rollup from FallDetection; returns the number of rows written.
+
+    Streams the history in chunks, so memory grows with the number of
+    rollup rows rather than the number of falls. The table is dropped and
+    created again, so this also brings an older rollup layout up to date.
+    """
+    counts = Counter()
+    locations = {}
+    rows = (db.session.query(FallDetection.timestamp, FallDetection.user_id, FallDetection.camera_id,
+                             FallDetection.location, FallDetection.severity)
+            .filter(FallDetection.timestamp.isnot(None))
+            .order_by(FallDetection.timestamp, FallDetection.id)
+            .execution_options(yield_per=chunk_size))
+    for timestamp, user_id, camera_id, location, severity in rows:
+        for key in _keys(timestamp, user_id, camera_id, severity):
+            counts[key] += 1
+            locations[key] = location or ''  # oldest first, so the latest location wins
+
+    db.session.commit()  # the streaming read holds a transaction open
+    FallRollup.__table__.drop(db.engine, checkfirst=True)
+    FallRollup.__table__.create(db.engine)
+    db.session.bulk_insert_mappings(FallRollup, [
+        {'bucket': bucket, 'period_start': start, 'user_id': user_id, 'camera_id': camera_id,
+         'location': locations[bucket, start, user_id, camera_id, severity],
+         'severity': severity, 'count': count}
+        for (bucket, start, user_id, camera_id, severity), count in counts.items()
+    ])
+    db.session.commit()
+    return len(counts)
+
+def fall_counts(start, end, bucket='day', group_by=(), user_id=None):
+    """Fall counts per period in [start, end), optionally split by group_by.
+
+    group_by holds names from GROUP_COLUMNS. Returns a list of dicts with
+    'period', 'count' and one key per group, ordered by period.
+    """
+    columns = [GROUP_COLUMNS[name] for name in group_by]
+    query = (db.session.query(FallRollup.period_start, *columns, func.sum(FallRollup.count))
+             .filter(FallRollup.bucket == bucket,
+                     FallRollup.period_start >= period_start(start, bucket),
+                     FallRollup.period_start < end))
+    if user_id is not None:
+        query = query.filter(FallRollup.user_id == user_id)
+    query = query.group_by(FallRollup.period_start, *columns).order_by(FallRollup.period_start)
+
+    counts = []
+    for row in query:
+        entry = {'period': row[0], 'count': int(row[-1])}
+        entry.update(zip(group_by, row[1:-1]))
+        counts.append(entry)
+    return counts
+
+def daily_series(start, end, user_id=None):
+    """Per-day totals for [start, end) with missing days filled with zero."""
+    totals = {entry['period'].date(): entry['count']
+              for entry in fall_counts(start, end, 'day', user_id=user_id)}
+    day = start.date()
+    dates, values = [], []
+    while datetime.combine(day, datetime.min.time()) < end:
+        dates.append(day.strftime('%Y-%m-%d'))
+        values.append(totals.get(day, 0))
+        day += timedelta(days=1)
+    return dates, values
@@ -0,0 +1,75 @@
+import cv2
+import time
+
+class InferenceScheduler:
+    """Decides per frame whether a camera needs a fresh model run.
+
+    A cheap frame-difference check on a small grayscale copy of each frame
+    tracks motion. While the room is static, inference drops to min_fps;
+    motion, or an urgent state such as a person lying down, restores the
+    full rate (max_fps, or every frame when max_fps is None).
+    """
+
+    def __init__(self, min_fps=1.0, max_fps=None, motion_threshold=0.005,
+                 pixel_threshold=25, static_after=2.0, downscale_width=64):
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.motion_threshold = motion_threshold  # fraction of changed pixels
+        self.pixel_threshold = pixel_threshold  # grey-level change that counts
+        self.static_after = static_after  # seconds without motion before slowing down
+        self.downscale_width = downscale_width
+
+        self.previous_small = None
+        self.last_motion_time = None
+        self.last_inference_time = None
+        self.motion_score = 0.0
+        self.inferred = 0
+        self.skipped = 0
+
+    def measure_motion(self, frame):
+        """Return the fraction of pixels that changed since the previous frame."""
+        height, width = frame.shape[:2]
+        small_height = max(1, int(height * self.downscale_width / width))
+        small = cv2.resize(frame, (self.downscale_width, small_height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+        previous, self.previous_small = self.previous_small, small
+        if previous is None or previous.shape != small.shape:
+            return 1.0
+
+        diff = cv2.absdiff(small, previous)
+        changed = cv2.countNonZero(cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)[1])
+        return changed / small.size
+
+    def is_active(self, now):
+        return (self.last_motion_time is not None and
+                now - self.last_motion_time < self.static_after)
+
+    def should_infer(self, frame, urgent=False, now=None):
+        now = time.monotonic() if now is None else now
+
+        self.motion_score = self.measure_motion(frame)
+        if self.motion_score >= self.motion_threshold:
+            self.last_motion_time = now
+
+        if urgent or self.is_active(now):
+            interval = 1.0 / self.max_fps if self.max_fps else 0.0
+        else:
+            interval = 1.0 / self.min_fps if self.min_fps else float('inf')
+
+        if self.last_inference_time is None or now - self.last_inference_time >= interval:
+            self.last_inference_time = now
+            self.inferred += 1
+            return True
+
+        self.skipped += 1
+        return False
+
+    def get_stats(self):
+        return {
+            'inferred': self.inferred,
+            'skipped': self.skipped,
+            'motion_score': round(self.motion_score, 4),
+            'active': self.is_active(time.monotonic())
+        }
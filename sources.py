@@ -0,0 +1,366 @@
+import asyncio
+import random
+import time
+from abc import ABC, abstractmethod
+import cv2
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from threading import Thread, Event, Lock
+from pipeline import LatestSlot
+
+class FrameSource(ABC):
+    """Interface every camera and file source offers the camera pipelines.
+
+    get_frame() returns the next BGR frame, or None when none is ready.
+    Sources whose camera already sends JPEGs also offer get_jpeg(), which
+    CameraPipeline uses for passthrough viewers.
+    """
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    @abstractmethod
+    def get_frame(self):
+        pass
+
+    def get_stats(self):
+        return {}
+
+def decode_jpeg(jpeg):
+    if jpeg is None:
+        return None
+    return cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+
+class Backoff:
+    """Exponential reconnect delay with jitter, reset after a success."""
+
+    def __init__(self, base=0.5, maximum=10.0):
+        self.base = base
+        self.maximum = maximum
+        self.failures = 0
+
+    def next_delay(self):
+        self.failures += 1
+        delay = min(self.maximum, self.base * (2 ** (self.failures - 1)))
+        return delay * random.uniform(0.5, 1.0)  # cameras that dropped together do not retry together
+
+    def reset(self):
+        self.failures = 0
+
+class Pacer:
+    """Spaces fetches to target_fps; None means as fast as possible."""
+
+    def __init__(self, target_fps=None):
+        self.interval = 1.0 / target_fps if target_fps else 0.0
+        self.next_due = 0.0
+
+    def delay(self):
+        """Seconds to wait before the next fetch, reserving that slot."""
+        now = time.monotonic()
+        wait = max(0.0, self.next_due - now)
+        # Never bank time while idle: a late fetch does not earn a burst
+        self.next_due = max(now, self.next_due) + self.interval
+        return wait
+
+class SnapshotSource(FrameSource):
+    """Polls a camera endpoint that serves one JPEG per request (e.g. the ESP32's jpg_handler).
+
+    Requests reuse a pooled keep-alive connection, are paced to target_fps
+    and time out after timeout seconds. After a failure the next attempt
+    waits for a jittered exponential backoff instead of retrying at once.
+    """
+
+    def __init__(self, url, target_fps=10.0, timeout=5.0, connect_timeout=2.0, backoff=None):
+        self.url = url
+        self.pacer = Pacer(target_fps)
+        self.timeout = (connect_timeout, timeout)
+        self.backoff = backoff or Backoff()
+        self.session = None
+        self.stopped = Event()
+        self.lock = Lock()
+        self.frames = 0
+        self.errors = 0
+        self.last_error = None
+
+    def start(self):
+        with self.lock:
+            self.stopped.clear()
+            if self.session is None:
+                self.session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+                self.session.mount('http://', adapter)
+                self.session.mount('https://', adapter)
+
+    def stop(self):
+        self.stopped.set()  # wakes a fetch waiting on the pacer or backoff
+        with self.lock:
+            if self.session is not None:
+                self.session.close()
+                self.session = None
+
+    def get_jpeg(self):
+        if self.session is None:
+            if self.stopped.is_set():
+                return None
+            self.start()
+        if self.stopped.wait(self.pacer.delay()):
+            return None
+        session = self.session
+        if session is None:
+            return None
+        try:
+            response = session.get(self.url, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            self._failed(e)
+            return None
+        self.backoff.reset()
+        self.frames += 1
+        return response.content
+
+    def get_frame(self):
+        return decode_jpeg(self.get_jpeg())
+
+    def _failed(self, error):
+        self.errors += 1
+        self.last_error = str(error)
+        delay = self.backoff.next_delay()
+        print(f"Error fetching snapshot from {self.url}, retrying in {delay:.1f}s: {error}")
+        self.stopped.wait(delay)
+
+    def get_stats(self):
+        return {'frames': self.frames, 'errors': self.errors, 'last_error': self.last_error}
+
+class StreamSource(FrameSource):
+    """Video files and continuous streams (RTSP, MJPEG over HTTP) read through OpenCV.
+
+    Live streams are reopened with backoff when they drop. Files end with
+    get_frame() returning None, unless loop=True; with realtime=True they
+    are paced to their own frame rate.
+    """
+
+    def __init__(self, url, target_fps=None, realtime=False, loop=False, live=None, backoff=None):
+        self.url = url
+        self.target_fps = target_fps
+        self.realtime = realtime
+        self.loop = loop
+        # Anything with a scheme (rtsp://, http://) is treated as a live stream
+        self.live = live if live is not None else '://' in str(url)
+        self.backoff = backoff or Backoff()
+        self.pacer = Pacer(target_fps)
+        self.cap = None
+        self.stopped = Event()
+        self.finished = False
+        self.frames = 0
+        self.errors = 0
+
+    def start(self):
+        self.stopped.clear()
+        if self.cap is None or not self.cap.isOpened():
+            self.cap = cv2.VideoCapture(self.url)
+            if self.realtime and not self.target_fps:
+                fps = self.cap.get(cv2.CAP_PROP_FPS)
+                self.pacer = Pacer(fps if fps and fps > 0 else None)
+
+    def stop(self):
+        self.stopped.set()
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def get_frame(self):
+        if self.finished or self.stopped.is_set():
+            return None
+        if self.cap is None or not self.cap.isOpened():
+            self.start()
+            if not self.cap.isOpened():
+                self._failed(f"could not open {self.url}")
+                return None
+        if self.stopped.wait(self.pacer.delay()):
+            return None
+
+        success, frame = self.cap.read()
+        if success:
+            self.backoff.reset()
+            self.frames += 1
+            return frame
+
+        if self.live:
+            self._failed("stream ended")
+        elif self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        else:
+            self.finished = True
+        return None
+
+    def _failed(self, reason):
+        self.errors += 1
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        delay = self.backoff.next_delay()
+        print(f"Error reading {self.url}, reconnecting in {delay:.1f}s: {reason}")
+        self.stopped.wait(delay)
+
+    def get_stats(self):
+        return {'frames': self.frames, 'errors': self.errors, 'finished': self.finished}
+
+class AsyncSnapshotPoller:
+    """Fetches snapshots from many cameras concurrently on one asyncio loop.
+
+    Every camera is a task on one shared aiohttp session with keep-alive
+    connections, paced and backed off like SnapshotSource. The newest JPEG
+    of each camera waits in a LatestSlot; source() wraps one camera as a
+    FrameSource for its pipeline.
+    """
+
+    def __init__(self, target_fps=10.0, timeout=5.0, connect_timeout=2.0, max_connections=32):
+        self.target_fps = target_fps
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.lock = Lock()
+        self.loop = None
+        self.session = None
+        self.loop_thread = None
+        self.tasks = {}  # camera_id -> asyncio task
+        self.slots = {}  # camera_id -> LatestSlot
+        self.stats = {}
+
+    def start(self):
+        with self.lock:
+            if self.loop_thread and self.loop_thread.is_alive():
+                return
+            self.loop = asyncio.new_event_loop()
+            self.loop_thread = Thread(target=self.loop.run_forever, name='snapshot-poller', daemon=True)
+            self.loop_thread.start()
+        asyncio.run_coroutine_threadsafe(self._open_session(), self.loop).result()
+
+    def stop(self):
+        with self.lock:
+            loop, self.loop = self.loop, None
+            thread, self.loop_thread = self.loop_thread, None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    def add(self, camera_id, url):
+        """Start polling a camera; returns the LatestSlot its snapshots arrive in."""
+        self.start()
+        with self.lock:
+            slot = LatestSlot()
+            self.slots[camera_id] = slot
+            self.stats[camera_id] = {'url': url, 'frames': 0, 'errors': 0, 'last_error': None}
+        asyncio.run_coroutine_threadsafe(self._restart(camera_id, url, slot), self.loop).result()
+        return slot
+
+    def remove(self, camera_id, slot):
+        """Stop polling a camera, unless it has been re-added with a new slot since."""
+        with self.lock:
+            if self.slots.get(camera_id) is not slot:
+                return
+            del self.slots[camera_id]
+            loop = self.loop
+        slot.close()
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self._cancel(camera_id), loop).result()
+
+    def source(self, camera_id, url):
+        return PolledSnapshotSource(self, camera_id, url)
+
+    def get_stats(self):
+        with self.lock:
+            return {camera_id: dict(stats) for camera_id, stats in self.stats.items()}
+
+    async def _open_session(self):
+        import aiohttp  # only needed once a camera is polled; keeps it off web startup
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=2)
+            self.session = aiohttp.ClientSession(connector=connector)
+
+    async def _shutdown(self):
+        for camera_id in list(self.tasks):
+            await self._cancel(camera_id)
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _restart(self, camera_id, url, slot):
+        await self._cancel(camera_id)
+        self.tasks[camera_id] = asyncio.get_running_loop().create_task(self._poll(camera_id, url, slot))
+
+    async def _cancel(self, camera_id):
+        task = self.tasks.pop(camera_id, None)
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _poll(self, camera_id, url, slot):
+        import aiohttp
+        pacer = Pacer(self.target_fps)
+        backoff = Backoff()
+        timeout = aiohttp.ClientTimeout(total=self.timeout, connect=self.connect_timeout)
+        stats = self.stats[camera_id]
+        while True:
+            await asyncio.sleep(pacer.delay())
+            try:
+                async with self.session.get(url, timeout=timeout) as response:
+                    response.raise_for_status()
+                    jpeg = await response.read()
+                slot.put(jpeg)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                stats['errors'] += 1
+                stats['last_error'] = str(e) or type(e).__name__
+                delay = backoff.next_delay()
+                print(f"Error fetching snapshot from {url}, retrying in {delay:.1f}s: {stats['last_error']}")
+                await asyncio.sleep(delay)
+                continue
+            except Exception as e:
+                # Anything else would end this camera's task silently
+                stats['errors'] += 1
+                stats['last_error'] = repr(e)
+                delay = backoff.next_delay()
+                print(f"Error polling camera {camera_id}, retrying in {delay:.1f}s: {e!r}")
+                await asyncio.sleep(delay)
+                continue
+            backoff.reset()
+            stats['frames'] += 1
+
+class PolledSnapshotSource(FrameSource):
+    """One camera of an AsyncSnapshotPoller, seen as a FrameSource."""
+
+    def __init__(self, poller, camera_id, url, wait=1.0):
+        self.poller = poller
+        self.camera_id = camera_id
+        self.url = url
+        self.wait = wait  # seconds get_jpeg() waits for a new snapshot
+        self.slot = None
+
+    def start(self):
+        if self.slot is None:
+            self.slot = self.poller.add(self.camera_id, self.url)
+
+    def stop(self):
+        if self.slot is not None:
+            self.poller.remove(self.camera_id, self.slot)
+            self.slot = None
+
+    def get_jpeg(self):
+        slot = self.slot
+        return slot.get(timeout=self.wait) if slot is not None else None
+
+    def get_frame(self):
+        return decode_jpeg(self.get_jpeg())
+
+    def get_stats(self):
+        return self.poller.get_stats().get(self.camera_id, {})
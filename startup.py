@@ -0,0 +1,49 @@
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+class StartupReport:
+    """How long each part of startup took, for the log and /metrics.
+
+    checkpoint() closes a phase of the main thread's sequential startup
+    (imports, app setup, database), measured from the previous checkpoint.
+    phase() times work running alongside it, such as model warm-up.
+    Create the report before the heavy imports so they are counted.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.last_checkpoint = self.started
+        self.lock = Lock()
+        self.phases = []  # (name, seconds, background)
+
+    def checkpoint(self, name):
+        now = time.perf_counter()
+        with self.lock:
+            self.phases.append((name, now - self.last_checkpoint, False))
+            self.last_checkpoint = now
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases.append((name, time.perf_counter() - started, True))
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'phases': [{'name': name, 'seconds': round(seconds, 3), 'background': background}
+                           for name, seconds, background in self.phases],
+                'ready_seconds': round(self.last_checkpoint - self.started, 3)
+            }
+
+    def format(self):
+        report = self.as_dict()
+        lines = [f"Startup took {report['ready_seconds']:.3f}s"]
+        for phase in report['phases']:
+            suffix = ' (background)' if phase['background'] else ''
+            lines.append(f"  {phase['name']}: {phase['seconds']:.3f}s{suffix}")
+        return '\n'.join(lines)
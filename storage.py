@@ -0,0 +1,172 @@
+import queue
+import time
+from concurrent.futures import Future
+from threading import Thread, Lock
+from sqlalchemy import event, inspect, text
+from models import db
+from metrics import registry, SIZE_BUCKETS
+
+DB_COMMIT_SECONDS = registry.histogram('db_write_batch_seconds', 'Time to run and commit one write batch',
+                                       stage='db')
+DB_BATCH_SIZE = registry.histogram('db_write_batch_size', 'Writes committed per batch', stage='db',
+                                   buckets=SIZE_BUCKETS)
+DB_WRITE_ERRORS = registry.counter('db_write_errors_total', 'Writes that failed and were rolled back', stage='db')
+
+# Applied to every new SQLite connection. WAL lets the web UI read while
+# the camera threads write; NORMAL sync is safe with WAL and far cheaper.
+DEFAULT_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # ms to wait for the write lock instead of failing
+    'temp_store': 'MEMORY',
+    'cache_size': -16000  # KiB
+}
+
+def configure_sqlite(app):
+    """Apply SQLITE_PRAGMAS on connect; does nothing for other databases."""
+    pragmas = app.config.get('SQLITE_PRAGMAS', DEFAULT_SQLITE_PRAGMAS)
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != 'sqlite':
+            return
+
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+        event.listen(engine, 'connect', set_pragmas)
+        engine.dispose()  # connections opened earlier reconnect with the pragmas
+
+def ensure_indexes():
+    """Create indexes missing from tables that predate them. Needs an app context.
+
+    db.create_all() only creates indexes together with new tables.
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+def ensure_columns():
+    """Add nullable columns missing from tables that predate them. Needs an app context.
+
+    db.create_all() leaves existing tables as they are. Columns that must
+    not be NULL need a real migration.
+    """
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                with db.engine.begin() as connection:
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+class WriteBehindBatcher:
+    """Commits database work from many threads in shared transactions.
+
+    submit(work, *args) queues a function that adds rows to db.session
+    without committing, and returns a Future for its return value. A single
+    writer thread runs queued work in batches of up to max_batch, waiting
+    at most max_delay seconds for a batch to fill, and commits each batch
+    once. If a batch fails, its work is retried one at a time so only the
+    failing caller sees the error. Return plain values rather than ORM
+    objects: they belong to the writer thread's session.
+    """
+
+    def __init__(self, app=None, max_batch=64, max_delay=0.05):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.requests = queue.Queue()
+        self.lock = Lock()
+        self.should_stop = False
+        self.writer_thread = None
+        self.batches = 0
+        self.writes = 0
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_batch = app.config.get('WRITE_BATCH_SIZE', self.max_batch)
+        self.max_delay = app.config.get('WRITE_BATCH_DELAY', self.max_delay)
+
+    def submit(self, work, *args):
+        self.start()
+        future = Future()
+        self.requests.put((work, args, future))
+        return future
+
+    def start(self):
+        if self.writer_thread and self.writer_thread.is_alive():
+            return
+        with self.lock:
+            if self.writer_thread and self.writer_thread.is_alive():
+                return
+            self.should_stop = False
+            self.writer_thread = Thread(target=self._run, name='db-writer', daemon=True)
+            self.writer_thread.start()
+
+    def stop(self):
+        self.should_stop = True
+        if self.writer_thread:
+            self.writer_thread.join()
+            self.writer_thread = None
+
+    def get_stats(self):
+        return {
+            'batches': self.batches,
+            'writes': self.writes,
+            'pending': self.requests.qsize()
+        }
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                try:
+                    first = self.requests.get(timeout=0.1)
+                except queue.Empty:
+                    if self.should_stop:
+                        break
+                    continue
+
+                batch = [first]
+                deadline = time.monotonic() + self.max_delay
+                while len(batch) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self.requests.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+
+                self._write_batch(batch)
+                db.session.remove()
+
+    def _write_batch(self, batch):
+        started = time.perf_counter()
+        try:
+            results = [work(*args) for work, args, _ in batch]
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if len(batch) > 1:
+                print(f"Error writing batch of {len(batch)}, retrying one by one: {e}")
+                for item in batch:
+                    self._write_batch([item])
+            else:
+                DB_WRITE_ERRORS.inc()
+                batch[0][2].set_exception(e)
+            return
+
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+        DB_BATCH_SIZE.observe(len(batch))
+        self.batches += 1
+        self.writes += len(batch)
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
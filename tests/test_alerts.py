@@ -0,0 +1,142 @@
+import os
+import smtplib
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import Lock
+from types import SimpleNamespace
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alerts import AlertSystem
+
+class FakeSMTP:
+    def __init__(self, error=None):
+        self.error = error
+        self.sent = 0
+        self.closed = False
+
+    def send_message(self, msg, to_addrs=None):
+        self.sent += 1
+        if self.error is not None:
+            raise self.error
+        return {}
+
+    def close(self):
+        self.closed = True
+
+class FakeTwilio:
+    """Records every message and how many calls ran at once; numbers in failing raise."""
+
+    def __init__(self, delay=0.05, failing=()):
+        self.delay = delay
+        self.failing = set(failing)
+        self.lock = Lock()
+        self.sent = []
+        self.running = 0
+        self.max_running = 0
+        self.messages = self
+
+    def create(self, body, from_, to):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.delay)
+            if to in self.failing:
+                raise RuntimeError(f'Unable to create record: {to} is not a valid phone number')
+            with self.lock:
+                self.sent.append((from_, to, body))
+                return SimpleNamespace(sid=f'SM{len(self.sent)}')
+        finally:
+            with self.lock:
+                self.running -= 1
+
+def make_alert_system(servers=(), twilio_client=None, twilio_workers=4):
+    app = Flask(__name__)
+    app.config['MAIL_DEFAULT_SENDER'] = 'alerts@example.com'
+    app.config['TWILIO_PHONE_NUMBER'] = '+15550000000'
+    app.config['TWILIO_WHATSAPP_NUMBER'] = '+15550000001'
+    app.config['TWILIO_MAX_WORKERS'] = twilio_workers
+    servers = list(servers)
+    opened = []
+
+    def smtp_factory():
+        server = servers.pop(0)
+        opened.append(server)
+        return server
+
+    alerts = AlertSystem(app, twilio_client=twilio_client or FakeTwilio(), smtp_factory=smtp_factory)
+    return alerts, opened
+
+def test_refused_recipients_are_not_resent():
+    refused = smtplib.SMTPRecipientsRefused({'a@example.com': (550, b'No such user')})
+    alerts, opened = make_alert_system([FakeSMTP(refused), FakeSMTP()])
+
+    results = alerts.send_email_batch(['a@example.com'], 'Subject', 'Body')
+
+    assert results['a@example.com'][0] is False
+    assert len(opened) == 1
+    assert opened[0].sent == 1
+    assert opened[0].closed
+
+def test_dropped_session_is_retried_once():
+    alerts, opened = make_alert_system([FakeSMTP(smtplib.SMTPServerDisconnected()), FakeSMTP()])
+
+    results = alerts.send_email_batch(['a@example.com'], 'Subject', 'Body')
+
+    assert results['a@example.com'] == (True, 'Email sent successfully')
+    assert len(opened) == 2
+    assert opened[0].closed and not opened[1].closed
+
+def test_failed_retry_closes_the_new_session():
+    alerts, opened = make_alert_system([FakeSMTP(smtplib.SMTPServerDisconnected()),
+                                        FakeSMTP(smtplib.SMTPDataError(554, b'Rejected'))])
+
+    results = alerts.send_email_batch(['a@example.com'], 'Subject', 'Body')
+
+    assert results['a@example.com'][0] is False
+    assert len(opened) == 2
+    assert opened[1].closed
+    assert alerts.smtp_pool.idle.empty()
+
+def test_twilio_calls_run_concurrently_up_to_the_pool_size():
+    twilio = FakeTwilio()
+    alerts, _ = make_alert_system(twilio_client=twilio, twilio_workers=3)
+    numbers = [f'+1555000{i:04d}' for i in range(9)]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(9) as callers:
+        results = list(callers.map(lambda number: alerts.send_sms(number, 'Fall'), numbers))
+    elapsed = time.perf_counter() - started
+
+    assert all(success for success, _ in results)
+    assert len({sid for _, sid in results}) == 9
+    assert twilio.max_running == 3
+    assert elapsed < 9 * twilio.delay  # not one call at a time
+    assert sorted(to for _, to, _ in twilio.sent) == numbers
+
+def test_twilio_errors_are_returned_not_raised():
+    twilio = FakeTwilio(delay=0, failing={'+15550009999', 'whatsapp:+15550009999'})
+    alerts, _ = make_alert_system(twilio_client=twilio)
+
+    assert alerts.send_sms('+15550009999', 'Fall') == (
+        False, 'Unable to create record: +15550009999 is not a valid phone number')
+    assert alerts.send_whatsapp('+15550009999', 'Fall')[0] is False
+    assert alerts.send_whatsapp('+15550001234', 'Fall')[0] is True
+    assert twilio.sent == [('whatsapp:+15550000001', 'whatsapp:+15550001234', 'Fall')]
+
+def test_fall_alert_reports_every_contact_when_one_number_fails():
+    twilio = FakeTwilio(failing={'+15550009999'})
+    alerts, _ = make_alert_system(twilio_client=twilio)
+    user = SimpleNamespace(username='resident')
+    fall = SimpleNamespace(timestamp=datetime(2026, 1, 1, 12, 0), location='Bedroom')
+    contacts = [SimpleNamespace(name='Good', phone_number='+15550001234', email=None, alert_channel='all'),
+                SimpleNamespace(name='Bad', phone_number='+15550009999', email=None, alert_channel='sms')]
+
+    results = alerts.send_fall_alert(user, fall, contacts)
+
+    outcomes = {(result['contact'], result['method']): result['success'] for result in results}
+    assert outcomes == {('Good', 'SMS'): True, ('Good', 'WhatsApp'): True, ('Bad', 'SMS'): False}
@@ -0,0 +1,55 @@
+import os
+import sys
+from types import SimpleNamespace
+import pytest
+import ultralytics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import ModelBackend, export
+
+class FakeYOLO:
+    """Stands in for ultralytics.YOLO: weights know their task, exports take it from the caller."""
+    weights_task = 'detect'
+    loaded = []
+
+    def __init__(self, path, task=None):
+        self.path = path
+        self.task = self.weights_task if path.endswith('.pt') else task
+        self.model = SimpleNamespace(model=[None, None, None])
+        self.loaded.append(self)
+
+    def export(self, format, imgsz, dynamic):
+        exported = os.path.splitext(self.path)[0] + '.onnx'
+        with open(exported, 'wb') as graph:
+            graph.write(b'graph')
+        return exported
+
+    def __call__(self, frame, **kwargs):
+        return []
+
+@pytest.fixture
+def fake_yolo(monkeypatch):
+    FakeYOLO.loaded = []
+    monkeypatch.setattr(ultralytics, 'YOLO', FakeYOLO)
+    return FakeYOLO
+
+@pytest.mark.parametrize('task', ['detect', 'pose'])
+def test_export_loads_with_the_task_of_the_weights(tmp_path, fake_yolo, monkeypatch, task):
+    monkeypatch.setattr(fake_yolo, 'weights_task', task)
+    weights = str(tmp_path / 'ok.pt')
+    backend = ModelBackend('onnx', weights)
+
+    assert export(backend) == str(tmp_path / 'ok.onnx')
+    fake_yolo.loaded = []
+    model = backend.load()
+
+    assert [loaded.path for loaded in fake_yolo.loaded] == [backend.path]
+    assert model.task == task
+
+def test_export_without_a_recorded_task_asks_the_weights(tmp_path, fake_yolo):
+    backend = ModelBackend('onnx', str(tmp_path / 'ok.pt'))
+    export(backend)
+    os.remove(backend.info_path)
+
+    assert backend.load().task == 'detect'
@@ -0,0 +1,51 @@
+import os
+import sys
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from encoder import EncodeProfile, FrameEncoder, MULTIPART_HEADER
+
+def room(seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (240, 320, 3), dtype=np.uint8)
+
+def jpeg_of(chunk):
+    header_end = chunk.index(b'\r\n\r\n') + 4
+    return cv2.imdecode(np.frombuffer(chunk[header_end:-2], np.uint8), cv2.IMREAD_COLOR)
+
+def test_unchanged_frame_is_not_encoded_again():
+    encoder = FrameEncoder()
+    first = encoder.encode(room(), ['full', 'thumb'])
+
+    assert set(first) == {'full', 'thumb'}
+    assert encoder.encode(room(), ['full', 'thumb']) == {}  # a new array with the same pixels
+    assert encoder.get_stats() == {'encoded': 2, 'reused': 2}
+
+def test_one_pixel_change_is_encoded():
+    encoder = FrameEncoder()
+    encoder.encode(room(), ['full'])
+
+    for y, x in [(0, 0), (5, 7), (239, 319)]:  # on and off the sampled grid
+        frame = room()
+        frame[y, x] ^= 0xFF
+        assert set(encoder.encode(frame, ['full'])) == {'full'}
+        assert encoder.encode(frame.copy(), ['full']) == {}
+    assert encoder.get_stats() == {'encoded': 4, 'reused': 3}
+
+def test_a_profile_joining_later_gets_the_current_frame():
+    encoder = FrameEncoder()
+    encoder.encode(room(), ['full'])
+
+    assert set(encoder.encode(room(), ['full', 'thumb'])) == {'thumb'}
+
+def test_chunks_are_multipart_parts_at_the_profile_size():
+    encoder = FrameEncoder()
+    chunks = encoder.encode(room(), ['full', 'thumb'])
+
+    assert chunks['full'].startswith(MULTIPART_HEADER.split(b'%d')[0])
+    assert chunks['full'].endswith(b'\r\n')
+    assert jpeg_of(chunks['full']).shape == (240, 320, 3)
+
+    small = FrameEncoder({'thumb': EncodeProfile(quality=60, max_width=160)})
+    assert jpeg_of(small.encode(room(), ['thumb'])['thumb']).shape == (120, 160, 3)
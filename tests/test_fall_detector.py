@@ -0,0 +1,134 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fall_detector import FallDetector
+
+def scalar_pose(detector, keypoints):
+    """The original per-person classification, kept here as the reference."""
+    left_shoulder, right_shoulder = np.array(keypoints[5]), np.array(keypoints[6])
+    left_hip, right_hip = np.array(keypoints[11]), np.array(keypoints[12])
+    left_knee, right_knee = np.array(keypoints[13]), np.array(keypoints[14])
+    left_ankle, right_ankle = np.array(keypoints[15]), np.array(keypoints[16])
+    for point in [left_shoulder, right_shoulder, left_hip, right_hip, left_ankle, right_ankle]:
+        if np.all(point == 0):
+            return "UNKNOWN"
+
+    shoulder_mid = (left_shoulder + right_shoulder) / 2
+    hip_mid = (left_hip + right_hip) / 2
+    knee_mid = (left_knee + right_knee) / 2
+    ankle_mid = (left_ankle + right_ankle) / 2
+    torso_angle = detector.calculate_angle(shoulder_mid - hip_mid, np.array([0, -1]))
+    knee_angle = detector.calculate_angle(knee_mid - hip_mid, ankle_mid - knee_mid)
+    total_height = np.linalg.norm(shoulder_mid - ankle_mid)
+    hip_height = np.linalg.norm(hip_mid - ankle_mid)
+    hip_height_ratio = hip_height / total_height if total_height != 0 else 0
+    shoulder_to_ankle_vec = shoulder_mid - ankle_mid
+    horizontal_ratio = abs(shoulder_to_ankle_vec[0]) / np.linalg.norm(shoulder_to_ankle_vec)
+    ankle_hip_dist = np.linalg.norm(ankle_mid - hip_mid)
+
+    if torso_angle >= detector.fall_threshold and horizontal_ratio > 0.5:
+        if ankle_hip_dist < 0.2 * total_height:
+            return "LYING"
+    elif torso_angle >= detector.sit_threshold:
+        if hip_height_ratio <= detector.chair_height_ratio:
+            return "SITTING_CHAIR"
+        else:
+            return "SITTING_FLOOR"
+    elif knee_angle < 100:
+        return "SQUATTING"
+    return "STANDING"
+
+def person(shoulder, hip, knee, ankle, width=10.0):
+    # Left and right joints either side of the given midpoints
+    keypoints = np.zeros((17, 2))
+    for (left, right), (x, y) in zip([(5, 6), (11, 12), (13, 14), (15, 16)], [shoulder, hip, knee, ankle]):
+        keypoints[left] = (x - width / 2, y)
+        keypoints[right] = (x + width / 2, y)
+    return keypoints
+
+POSES = np.array([
+    person((100, 100), (100, 200), (100, 280), (100, 360)),  # upright
+    person((100, 300), (200, 300), (280, 300), (360, 300), width=0),  # flat on the floor
+    person((100, 100), (170, 140), (170, 220), (170, 300)),  # leaning far forward
+    person((100, 180), (100, 220), (160, 200), (100, 240)),  # knees bent
+    person((0, 0), (100, 200), (100, 280), (100, 360), width=0),  # shoulders missing
+    person((100, 200), (100, 200), (100, 200), (100, 200), width=0),  # every joint in one place
+])
+
+@pytest.fixture
+def keypoints():
+    rng = np.random.default_rng(7)
+    random = rng.uniform(0, 640, (500, 17, 2))
+    random[::25, 15] = 0  # a missing ankle now and then
+    return np.concatenate([POSES, random])
+
+def test_batch_labels_match_the_per_person_classification(keypoints):
+    detector = FallDetector()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected = [scalar_pose(detector, person) for person in keypoints]
+        labels, _ = detector.determine_pose_batch(keypoints)
+
+    assert labels.tolist() == expected
+    assert {'UNKNOWN', 'LYING', 'STANDING', 'SITTING_CHAIR', 'SITTING_FLOOR', 'SQUATTING'} <= set(expected)
+    assert [detector.determine_pose(person) for person in keypoints[:len(POSES)]] == expected[:len(POSES)]
+
+def test_batch_ignores_confidence_and_reports_features(keypoints):
+    detector = FallDetector()
+    with_confidence = np.concatenate([keypoints, np.ones(keypoints.shape[:2] + (1,))], axis=2)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        labels, features = detector.determine_pose_batch(keypoints)
+        labels_3d, _ = detector.determine_pose_batch(with_confidence)
+
+    assert labels_3d.tolist() == labels.tolist()
+    assert features['torso_angle'][0] == pytest.approx(0.0)
+    assert features['torso_angle'][1] == pytest.approx(90.0)
+    assert np.isnan(features['knee_angle'][4])  # UNKNOWN rows have no features
+    assert set(features) == {'torso_angle', 'knee_angle', 'hip_height_ratio', 'horizontal_ratio'}
+
+def test_batch_rejects_other_shapes():
+    with pytest.raises(ValueError):
+        FallDetector().determine_pose_batch(np.zeros((2, 16, 2)))
+
+def feed(detector, person_id, poses, start=0.0, fps=10):
+    return [detector.update(person_id, pose, start + i / fps) for i, pose in enumerate(poses)]
+
+def test_fall_is_confirmed_after_fall_duration_and_recovers():
+    detector = FallDetector(fall_duration=2.0, recovery_duration=2.0)
+
+    states = feed(detector, 1, ['STANDING'] * 10 + ['LYING'] * 30 + ['STANDING'] * 30)
+
+    assert states[9] == 'STANDING'
+    assert states[10] == 'FALLING'
+    assert 'LYING' in states[29:31] and states[28] == 'FALLING'  # two seconds after the first lying frame
+    assert states[-1] == 'RECOVERED'
+    assert states.index('RECOVERED') > 40
+
+def test_a_brief_stumble_is_not_a_fall():
+    detector = FallDetector(fall_duration=2.0)
+
+    states = feed(detector, 1, ['STANDING'] * 10 + ['LYING'] * 3 + ['STANDING'] * 30)
+
+    assert 'FALLING' in states
+    assert 'LYING' not in states
+    assert states[-1] == 'STANDING'
+
+def test_unknown_poses_hold_the_state():
+    detector = FallDetector(fall_duration=1.0)
+    feed(detector, 1, ['LYING'] * 15)
+    assert detector.get_state(1) == 'LYING'
+
+    assert feed(detector, 1, ['UNKNOWN'] * 30, start=1.5) == ['LYING'] * 30
+
+def test_idle_people_expire_and_tracks_stay_bounded():
+    detector = FallDetector(track_ttl=5.0, max_tracks=4)
+    for person_id in range(10):
+        detector.update(person_id, 'STANDING', timestamp=person_id * 0.1)
+
+    assert sorted(detector.person_trackers) == [6, 7, 8, 9]  # the oldest made room
+    detector.update(42, 'STANDING', timestamp=100.0)
+    assert list(detector.person_trackers) == [42]
@@ -0,0 +1,67 @@
+import os
+import sys
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from incidents import IncidentManager
+from models import db, Incident, User
+
+@pytest.fixture
+def manager():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        user = User(username='resident', email='resident@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        yield IncidentManager(app, window=300, escalation_intervals=(120,))
+
+def test_detector_and_form_camera_ids_share_an_incident(manager):
+    now = datetime.utcnow()
+    first, is_new = manager.record_fall(1, 3, now)
+    db.session.commit()
+    manager.cache.clear()  # as after a restart, so the database lookup is used too
+    second, again = manager.record_fall(1, '3', now + timedelta(seconds=10))
+
+    assert is_new and not again
+    assert second.id == first.id
+    assert second.event_count == 2
+
+def test_fall_after_acknowledgement_joins_the_incident(manager):
+    now = datetime.utcnow()
+    incident, _ = manager.record_fall(1, 3, now)
+    db.session.commit()
+    manager.acknowledge(incident, 1)
+
+    repeat, is_new = manager.record_fall(1, 3, now + timedelta(seconds=5))
+
+    assert not is_new
+    assert repeat.id == incident.id
+    assert repeat.status == 'acknowledged'
+
+def test_acknowledged_incidents_close_after_the_window(manager):
+    now = datetime.utcnow()
+    incident, _ = manager.record_fall(1, 3, now)
+    db.session.commit()
+    manager.acknowledge(incident, 1)
+
+    assert manager.close_expired(now + timedelta(seconds=200)) == 0
+    assert manager.close_expired(now + timedelta(seconds=301)) == 1
+    assert db.session.get(Incident, incident.id).status == 'closed'
+
+    _, is_new = manager.record_fall(1, 3, now + timedelta(seconds=302))
+    assert is_new
+
+def test_unacknowledged_incidents_wait_for_their_last_reminder(manager):
+    now = datetime.utcnow()
+    incident, _ = manager.record_fall(1, 3, now)
+    db.session.commit()
+
+    assert manager.close_expired(now + timedelta(seconds=301)) == 0
+    manager.escalate_due(now + timedelta(seconds=301))
+    assert manager.close_expired(now + timedelta(seconds=302)) == 1
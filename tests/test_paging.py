@@ -0,0 +1,85 @@
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask
+from flask_login import UserMixin
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, FallDetection, User
+from paging import Keyset
+
+@pytest.fixture
+def detections():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username='resident', email='resident@example.com', password_hash='x'))
+        # 23 falls on only 5 distinct timestamps, so most pages split a tie
+        start = datetime(2026, 1, 1, 12, 0)
+        for i in range(23):
+            db.session.add(FallDetection(user_id=1, timestamp=start + timedelta(minutes=i % 5)))
+        db.session.commit()
+        yield FallDetection.query
+
+def expected_order(query):
+    rows = query.all()
+    return [row.id for row in sorted(rows, key=lambda row: (row.timestamp, row.id), reverse=True)]
+
+def test_pages_neither_overlap_nor_skip_rows_on_tied_timestamps(detections):
+    keyset = Keyset(FallDetection.timestamp, FallDetection.id)
+    seen = []
+    cursor = None
+    while True:
+        page = keyset.page(detections, cursor, per_page=4)
+        seen.extend(row.id for row in page.items)
+        if not page.has_next:
+            break
+        cursor = page.next_cursor
+
+    assert seen == expected_order(detections)
+    assert len(seen) == 23
+
+def test_streamed_pages_continue_from_their_cursor(detections):
+    keyset = Keyset(FallDetection.timestamp, FallDetection.id)
+    seen = []
+    cursor = None
+    while True:
+        document = json.loads(''.join(keyset.stream_json(detections, lambda row: row.id, cursor,
+                                                         limit=6, chunk_size=2)))
+        seen.extend(document['items'])
+        cursor = document['next_cursor']
+        if cursor is None:
+            break
+
+    assert seen == expected_order(detections)
+
+@pytest.mark.parametrize('cursor', ['not a cursor', 'WzFd', 'eyJhIjogMX0', 'WyJub3QgYSBkYXRlIiwgMV0'])
+def test_bad_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        Keyset(FallDetection.timestamp, FallDetection.id).decode(cursor)
+
+class Admin(UserMixin):
+    id = 1
+    username = 'admin'
+    role = 'admin'
+
+@pytest.fixture
+def client():
+    import main
+    main.login_manager.user_loader(lambda id: Admin())  # no database needed to be logged in
+    client = main.app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+    return client
+
+@pytest.mark.parametrize('path', ['/api/fall_detections', '/api/users'])
+def test_bad_cursor_returns_400(client, path):
+    response = client.get(path, query_string={'cursor': 'not a cursor'})
+
+    assert response.status_code == 400
+    assert 'Invalid cursor' in response.get_json()['error']
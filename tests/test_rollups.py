@@ -0,0 +1,76 @@
+import os
+import sys
+from datetime import datetime
+import pytest
+from flask import Flask
+from sqlalchemy import inspect, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rollups
+from models import db, FallDetection, FallRollup, User
+from storage import ensure_columns
+
+START = datetime(2026, 1, 1)
+END = datetime(2026, 1, 2)
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username='resident', email='resident@example.com', password_hash='x'))
+        db.session.commit()
+        yield app
+
+def fall(camera_id, location, hour, severity='High'):
+    fall_detection = FallDetection(user_id=1, camera_id=camera_id, location=location, severity=severity,
+                                   timestamp=datetime(2026, 1, 1, hour))
+    db.session.add(fall_detection)
+    rollups.record_fall(fall_detection)
+    db.session.commit()
+
+def by_camera():
+    return {entry['camera']: (entry['location'], entry['count'])
+            for entry in rollups.fall_counts(START, END, 'day', ['camera', 'location'])}
+
+def test_cameras_sharing_a_location_are_counted_apart(app):
+    fall('1', 'Bedroom', 8)
+    fall('2', 'Bedroom', 9)
+    fall('2', 'Bedroom', 10)
+
+    assert by_camera() == {'1': ('Bedroom', 1), '2': ('Bedroom', 2)}
+    assert rollups.fall_counts(START, END, 'day', ['location'])[0]['count'] == 3
+
+def test_renaming_a_location_keeps_the_cameras_history(app):
+    fall('1', 'Bedroom', 8)
+    fall('1', 'Guest room', 9)
+
+    assert by_camera() == {'1': ('Guest room', 2)}
+    assert len(rollups.fall_counts(START, END, 'hour', ['camera'])) == 2
+
+def test_rebuild_matches_the_incremental_rollups(app):
+    fall('1', 'Bedroom', 8)
+    fall('1', 'Guest room', 9, severity='Low')
+    fall('2', 'Bedroom', 9)
+    fall(None, 'Test Location', 11)
+    incremental = {(row.bucket, row.period_start, row.camera_id, row.location, row.severity, row.count)
+                   for row in FallRollup.query}
+
+    assert rollups.rebuild() == len(incremental)
+    assert {(row.bucket, row.period_start, row.camera_id, row.location, row.severity, row.count)
+            for row in FallRollup.query} == incremental
+
+def test_missing_camera_column_is_added_to_an_older_table(app):
+    with db.engine.begin() as connection:
+        connection.execute(text('DROP TABLE fall_detection'))
+        connection.execute(text('CREATE TABLE fall_detection (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, '
+                                'timestamp DATETIME, location VARCHAR(100), severity VARCHAR(20))'))
+
+    ensure_columns()
+
+    assert 'camera_id' in {column['name'] for column in inspect(db.engine).get_columns('fall_detection')}
+    fall('1', 'Bedroom', 8)
+    assert FallDetection.query.one().camera_id == '1'
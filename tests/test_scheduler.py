@@ -0,0 +1,55 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import InferenceScheduler
+
+FPS = 8  # camera frame rate in these tests; 1/8 s adds up exactly
+
+def frames(count, moving):
+    # A flat room, with a bright square walking across it when moving
+    for i in range(count):
+        frame = np.full((240, 320, 3), 90, dtype=np.uint8)
+        if moving:
+            x = (i * 12) % 280
+            frame[80:160, x:x + 40] = 230
+        yield frame
+
+def run(scheduler, count, moving, start=0.0, urgent=False):
+    ran = [scheduler.should_infer(frame, urgent=urgent, now=start + i / FPS)
+           for i, frame in enumerate(frames(count, moving))]
+    return ran, start + count / FPS
+
+def test_static_scene_drops_to_min_fps():
+    scheduler = InferenceScheduler(min_fps=1.0, static_after=2.0)
+    ran, _ = run(scheduler, 12 * FPS, moving=False)
+
+    assert all(ran[:2 * FPS])  # the first frame counts as motion, so it starts at full rate
+    assert sum(ran[3 * FPS:]) == 9  # then once a second
+    assert scheduler.get_stats()['skipped'] == len(ran) - sum(ran)
+
+def test_motion_restores_the_full_rate_until_the_room_settles():
+    scheduler = InferenceScheduler(min_fps=1.0, static_after=2.0)
+    _, now = run(scheduler, 5 * FPS, moving=False)
+
+    moving, now = run(scheduler, 3 * FPS, moving=True, start=now)
+    assert all(moving[1:])  # every frame once motion is seen
+
+    settled, _ = run(scheduler, 6 * FPS, moving=False, start=now)
+    assert all(settled[:2 * FPS - 1])  # still active for static_after seconds
+    assert sum(settled[2 * FPS:]) == 4  # then back to the floor rate
+
+def test_urgent_frames_run_in_a_static_room():
+    scheduler = InferenceScheduler(min_fps=1.0)
+    _, now = run(scheduler, 5 * FPS, moving=False)
+
+    urgent, _ = run(scheduler, 2 * FPS, moving=False, start=now, urgent=True)
+    assert all(urgent)
+
+def test_max_fps_caps_a_busy_room():
+    scheduler = InferenceScheduler(min_fps=1.0, max_fps=FPS / 2)
+    ran, _ = run(scheduler, 10 * FPS, moving=True)
+
+    assert ran == [True, False] * 5 * FPS
@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sources import AsyncSnapshotPoller, Backoff, FrameSource, SnapshotSource
+
+class FakeCamera(BaseHTTPRequestHandler):
+    """Serves one JPEG per GET, like the ESP32's jpg_handler, until told to fail."""
+    protocol_version = 'HTTP/1.1'  # keep-alive, as the camera does
+    jpeg = cv2.imencode('.jpg', np.full((48, 64, 3), 128, dtype=np.uint8))[1].tobytes()
+    failing = False
+    requests = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        if self.failing:
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(self.jpeg)))
+        self.end_headers()
+        self.wfile.write(self.jpeg)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def camera():
+    FakeCamera.failing = False
+    FakeCamera.requests = 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeCamera)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/'
+    server.shutdown()
+    server.server_close()
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def test_frame_source_needs_get_frame():
+    with pytest.raises(TypeError):
+        FrameSource()
+
+def test_backoff_grows_to_its_maximum_and_resets():
+    backoff = Backoff(base=1.0, maximum=4.0)
+    delays = [backoff.next_delay() for _ in range(5)]
+
+    for delay, full in zip(delays, [1, 2, 4, 4, 4]):
+        assert full / 2 <= delay <= full  # jittered down by at most half
+    backoff.reset()
+    assert backoff.next_delay() <= 1.0
+
+def test_snapshot_source_backs_off_and_reconnects(camera):
+    source = SnapshotSource(camera, target_fps=None, timeout=1.0, backoff=Backoff(base=0.01, maximum=0.05))
+    source.start()
+    try:
+        frame = source.get_frame()
+        assert frame.shape == (48, 64, 3)
+
+        FakeCamera.failing = True
+        assert source.get_jpeg() is None
+        assert source.get_jpeg() is None
+        assert source.errors == 2
+        assert source.backoff.failures == 2
+
+        FakeCamera.failing = False
+        assert source.get_jpeg() == FakeCamera.jpeg
+        assert source.backoff.failures == 0
+        assert source.get_stats()['frames'] == 2
+    finally:
+        source.stop()
+
+def test_poller_keeps_polling_through_failures(camera):
+    poller = AsyncSnapshotPoller(target_fps=50.0, timeout=1.0)
+    source = poller.source(1, camera)
+    source.start()
+    try:
+        assert source.get_jpeg() == FakeCamera.jpeg
+
+        FakeCamera.failing = True
+        assert wait_for(lambda: source.get_stats()['errors'] >= 1)
+        FakeCamera.failing = False
+        frames = source.get_stats()['frames']
+        assert wait_for(lambda: source.get_stats()['frames'] > frames)
+        assert source.get_jpeg() == FakeCamera.jpeg
+    finally:
+        source.stop()
+        poller.stop()
+
+def test_poller_survives_an_unexpected_error(camera):
+    poller = AsyncSnapshotPoller(target_fps=50.0, timeout=1.0)
+    source = poller.source(1, camera)
+    source.start()
+    try:
+        assert source.get_jpeg() == FakeCamera.jpeg
+
+        put = source.slot.put
+        def put_once_broken(item):
+            source.slot.put = put
+            raise RuntimeError('consumer went away')
+        source.slot.put = put_once_broken
+
+        assert wait_for(lambda: 'consumer went away' in (source.get_stats()['last_error'] or ''))
+        frames = source.get_stats()['frames']
+        assert wait_for(lambda: source.get_stats()['frames'] > frames)
+        assert source.get_jpeg() == FakeCamera.jpeg
+    finally:
+        source.stop()
+        poller.stop()
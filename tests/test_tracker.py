@@ -0,0 +1,55 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracker import PersonTracker
+
+def boxes_at(xs, shift=0.0):
+    # One 50x120 person box per x position, all moved right by shift
+    return np.array([[x + shift, 100, x + shift + 50, 220] for x in xs], dtype=np.float64)
+
+def test_ids_survive_growth_of_the_slot_table():
+    tracker = PersonTracker(capacity=2)
+    first, _ = tracker.update(boxes_at([0, 100]), now=0.0)
+
+    grown, _ = tracker.update(boxes_at([0, 100, 200, 300, 400], shift=3), now=0.1)
+    assert len(tracker.ids) == 8  # doubled twice
+    assert grown[:2].tolist() == first.tolist()
+    assert len(set(grown.tolist())) == 5
+
+    # Listed in another order, everyone keeps their ID
+    order = [4, 2, 0, 3, 1]
+    moved, _ = tracker.update(boxes_at([0, 100, 200, 300, 400], shift=6)[order], now=0.2)
+    assert moved.tolist() == grown[order].tolist()
+
+def test_keypoints_tell_overlapping_people_apart():
+    tracker = PersonTracker()
+    boxes = np.array([[0, 0, 100, 200], [0, 0, 100, 200]], dtype=np.float64)  # one behind the other
+    keypoints = np.zeros((2, 17, 2))
+    keypoints[0, :, 0], keypoints[1, :, 0] = 20, 80
+    keypoints[:, :, 1] = np.linspace(10, 190, 17)
+    ids, _ = tracker.update(boxes, keypoints, now=0.0)
+
+    # Same boxes, detected in the other order: only the keypoints say who is who
+    swapped, _ = tracker.update(boxes, keypoints[::-1] + 2, now=0.1)
+    assert swapped.tolist() == ids[::-1].tolist()
+
+def test_stale_tracks_are_evicted_and_their_slots_reused():
+    tracker = PersonTracker(max_age=1.0, capacity=2)
+    ids, _ = tracker.update(boxes_at([0, 100]), now=0.0)
+
+    kept, evicted = tracker.update(boxes_at([0]), now=0.8)
+    assert kept.tolist() == [ids[0]] and evicted == []
+
+    later, evicted = tracker.update(boxes_at([0, 300]), now=1.5)
+    assert evicted == [ids[1]]
+    assert later[0] == ids[0]
+    assert later[1] not in ids  # a newcomer never inherits an old ID
+    assert len(tracker.ids) == 2  # the freed slot was reused
+    assert sorted(tracker.active_ids()) == sorted(later.tolist())
+
+    _, evicted = tracker.update(np.zeros((0, 4)), now=10.0)
+    assert sorted(evicted) == sorted(later.tolist())
+    assert tracker.active_ids() == []
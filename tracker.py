@@ -0,0 +1,132 @@
+import numpy as np
+import time
+
+class PersonTracker:
+    """Assigns persistent person IDs across frames for one camera.
+
+    Tracks live in fixed-size numpy arrays (a slot with id -1 is free).
+    Detections are matched to tracks greedily on a cost that mixes box IoU
+    with the mean distance between matching keypoints, and tracks not seen
+    for max_age seconds are evicted.
+    """
+
+    def __init__(self, iou_weight=0.7, keypoint_weight=0.3, max_cost=0.8, max_age=2.0, capacity=16):
+        self.iou_weight = iou_weight
+        self.keypoint_weight = keypoint_weight
+        self.max_cost = max_cost
+        self.max_age = max_age  # seconds a track survives without a match
+        self.next_id = 1
+
+        self.ids = np.full(capacity, -1, dtype=np.int64)
+        self.boxes = np.zeros((capacity, 4))
+        self.keypoints = np.zeros((capacity, 17, 2))
+        self.last_seen = np.zeros(capacity)
+        self.hits = np.zeros(capacity, dtype=np.int64)
+
+    def update(self, boxes, keypoints=None, now=None):
+        """Match this frame's detections to tracks.
+
+        boxes is an (N, 4) xyxy array and keypoints an optional (N, 17, 2)
+        array. Returns (ids, evicted): the track ID of each detection and the
+        IDs of tracks that just expired.
+        """
+        now = time.monotonic() if now is None else now
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        if keypoints is not None:
+            keypoints = np.asarray(keypoints, dtype=np.float64)[:, :, :2]
+
+        evicted = self.evict(now)
+        detection_ids = np.full(len(boxes), -1, dtype=np.int64)
+        if len(boxes) == 0:
+            return detection_ids, evicted
+
+        slots = np.flatnonzero(self.ids >= 0)
+        if len(slots):
+            cost = self.match_cost(boxes, keypoints, slots)
+            # Greedy assignment, cheapest pairs first
+            order = np.argsort(cost, axis=None)
+            used_slots = set()
+            for flat in order:
+                det, col = divmod(int(flat), len(slots))
+                if cost[det, col] > self.max_cost:
+                    break
+                if detection_ids[det] >= 0 or col in used_slots:
+                    continue
+                used_slots.add(col)
+                slot = slots[col]
+                detection_ids[det] = self.ids[slot]
+                self.store(slot, boxes[det], keypoints[det] if keypoints is not None else None, now)
+
+        for det in np.flatnonzero(detection_ids < 0):
+            slot = self.free_slot()
+            self.ids[slot] = self.next_id
+            self.hits[slot] = 0
+            self.keypoints[slot] = 0
+            self.next_id += 1
+            detection_ids[det] = self.ids[slot]
+            self.store(slot, boxes[det], keypoints[det] if keypoints is not None else None, now)
+
+        return detection_ids, evicted
+
+    def match_cost(self, boxes, keypoints, slots):
+        iou = self.iou(boxes, self.boxes[slots])
+        if keypoints is None:
+            return 1.0 - iou
+
+        # Mean distance between keypoints visible in both, relative to the box diagonal
+        tracked = self.keypoints[slots]
+        visible = (keypoints != 0).any(axis=2)[:, None, :] & (tracked != 0).any(axis=2)[None, :, :]
+        distance = np.linalg.norm(keypoints[:, None] - tracked[None], axis=3)
+        counts = visible.sum(axis=2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_distance = (distance * visible).sum(axis=2) / counts
+            diagonal = np.hypot(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])[:, None]
+            keypoint_cost = np.nan_to_num(np.clip(mean_distance / diagonal, 0.0, 1.0), nan=1.0)
+
+        cost = self.iou_weight * (1.0 - iou) + self.keypoint_weight * keypoint_cost
+        # Without shared keypoints fall back to IoU alone
+        return np.where(counts > 0, cost, 1.0 - iou)
+
+    @staticmethod
+    def iou(boxes_a, boxes_b):
+        x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+        y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+        x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+        y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+        intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+        area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+        union = area_a[:, None] + area_b[None, :] - intersection
+        return np.where(union > 0, intersection / np.where(union > 0, union, 1), 0.0)
+
+    def store(self, slot, box, keypoints, now):
+        self.boxes[slot] = box
+        if keypoints is not None:
+            # Keep the last known position of keypoints that dropped out this frame
+            visible = (keypoints != 0).any(axis=1)
+            self.keypoints[slot][visible] = keypoints[visible]
+        self.last_seen[slot] = now
+        self.hits[slot] += 1
+
+    def evict(self, now):
+        stale = (self.ids >= 0) & (now - self.last_seen > self.max_age)
+        evicted = self.ids[stale].tolist()
+        self.ids[stale] = -1
+        return evicted
+
+    def free_slot(self):
+        free = np.flatnonzero(self.ids < 0)
+        if len(free):
+            return free[0]
+
+        # Table is full: double it
+        capacity = len(self.ids)
+        self.ids = np.concatenate([self.ids, np.full(capacity, -1, dtype=np.int64)])
+        self.boxes = np.concatenate([self.boxes, np.zeros((capacity, 4))])
+        self.keypoints = np.concatenate([self.keypoints, np.zeros((capacity, 17, 2))])
+        self.last_seen = np.concatenate([self.last_seen, np.zeros(capacity)])
+        self.hits = np.concatenate([self.hits, np.zeros(capacity, dtype=np.int64)])
+        return capacity
+
+    def active_ids(self):
+        return self.ids[self.ids >= 0].tolist()
@@ -1,89 +1,73 @@
 import cv2
+import queue
 import time
-from threading import Thread
-from ultralytics import YOLO
+from threading import Thread, Lock
+from pipeline import CameraPipeline
+from roi import merge_crop_results
+from tracker import PersonTracker
+from fall_detector import FallDetector
+from sources import FrameSource
+from metrics import registry
+from profiler import label_thread
+
+INFERENCE_SECONDS = registry.histogram('inference_seconds', 'Time from submitting a frame to having its detections',
+                                       ['camera'], stage='inference')
+POSE_SECONDS = registry.histogram('pose_seconds', 'Time to track people and classify their poses in one frame',
+                                  ['camera'], stage='pose')
+PEOPLE = registry.gauge('people_in_view', 'People detected in the latest analysed frame', ['camera'], stage='pose')
+FALLS = registry.counter('falls_detected_total', 'People newly confirmed fallen', ['camera'], stage='pose')
 
-# Add this import at the top of the file
-import requests
 from datetime import datetime
 
 class VideoProcessor:
-    def __init__(self, model_path, frame_queue, confidence_threshold=0.5):
-        self.model = YOLO(model_path)
+    def __init__(self, engine, frame_queue, confidence_threshold=0.5, scheduler=None, region_planner=None,
+                 tracker=None, fall_detector=None, event_bus=None, user_id=1):
+        self.engine = engine  # shared InferenceEngine, one model for all cameras
+        self.scheduler = scheduler  # optional InferenceScheduler for motion gating
+        self.region_planner = region_planner  # optional RegionPlanner for crop-only inference
+        self.last_results = None
+        self.fall_in_view = False
         self.frame_queue = frame_queue
         self.confidence_threshold = confidence_threshold
         self.should_stop = False
         self.processing_thread = None
-        self.total_fall_time = 0
-        self.fall_detected_duration = 2  # seconds
-        self.monitoring_duration = 10  # seconds
-        self.start_time = time.time()
-        self.last_detection_time = None
-
-    def process_frame(self, frame):
-        results = self.model(frame)
-        falling_detected = False
-
-        for result in results:
-            for box in result.boxes:
-                if box.conf < self.confidence_threshold:
-                    continue  # Skip detections with low confidence
-
-                class_id = box.cls
-                class_name = self.model.names[int(class_id)]
-                x1, y1, x2, y2 = map(int, box.xyxy[0])  # Get bounding box coordinates
-
-                # Draw bounding box
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                # Put class label text
-                cv2.putText(frame, class_name, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-
-                if class_name == 'fall':
-                    falling_detected = True
-                    if self.last_detection_time is None:
-                        self.last_detection_time = time.time()
-                    else:
-                        self.total_fall_time += time.time() - self.last_detection_time
-                        self.last_detection_time = time.time()
-                    break
-
-        if not falling_detected:
-            self.last_detection_time = None
-
-        # Check if total fall time exceeds the threshold within the monitoring duration
-        if self.total_fall_time >= self.fall_detected_duration:
-            cv2.putText(frame, "FALL DETECTED", (50, 50), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-
-        # Reset total fall time and start time if monitoring duration has passed
-        if time.time() - self.start_time >= self.monitoring_duration:
-            self.total_fall_time = 0
-            self.start_time = time.time()
-
-        return frame
+        # Stable IDs per person so fall timing is kept per person, not per frame
+        self.tracker = tracker if tracker is not None else PersonTracker()
+        self.fall_detector = fall_detector if fall_detector is not None else FallDetector(fall_duration=2.0)
+        self.people = []
+        self.alerted_people = set()
+        # Fall events go straight to in-process subscribers (DB, SocketIO, alerts)
+        self.event_bus = event_bus
+        self.user_id = user_id  # resident monitored by this camera
 
     def process_video(self, video_path, camera_id):
         self.should_stop = False
         cap = cv2.VideoCapture(video_path)
+        # Pace playback to the file's own frame rate rather than a fixed sleep,
+        # since skipped frames return much faster than inferred ones
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_interval = 1.0 / fps if fps and fps > 0 else 0.01
         
         while cap.isOpened() and not self.should_stop:
+            started = time.monotonic()
             success, frame = cap.read()
             if not success:
                 break
 
-            processed_frame = self.process_frame(frame)
+            processed_frame = self.process_frame(frame, camera_id)
 
             if self.frame_queue.full():
                 self.frame_queue.get()
             self.frame_queue.put(processed_frame)
-            time.sleep(0.01)
+            time.sleep(max(0.0, frame_interval - (time.monotonic() - started)))
 
         cap.release()
 
     def start_processing(self, video_path, camera_id):
         if self.processing_thread and self.processing_thread.is_alive():
             self.stop_processing()
-        self.processing_thread = Thread(target=self.process_video, args=(video_path, camera_id))
+        self.processing_thread = Thread(target=self.process_video, args=(video_path, camera_id),
+                                        name=f'camera-{camera_id}-file')
         self.processing_thread.start()
 
     def stop_processing(self):
@@ -92,94 +76,206 @@ class VideoProcessor:
             self.processing_thread.join()
 
     def process_frame(self, frame, camera_id):
+        self.analyze(frame, camera_id)
+        return self.annotate(frame)
+
+    def analyze(self, frame, camera_id):
+        """Run detection, tracking and fall alerts on a frame without drawing on it.
+
+        Returns False when the scheduler skipped the model for this frame.
+        """
+        # On a static scene, keep the previous detections instead of running the model
+        if (self.scheduler is not None and self.last_results is not None and
+                not self.scheduler.should_infer(frame, urgent=self.fall_in_view)):
+            return False
+
         # Process the frame with YOLO
-        results = self.model(frame)
-        
-        # Draw bounding boxes on the frame
-        annotated_frame = results[0].plot()
+        started = time.perf_counter()
+        results = self.infer(frame)
+        inferred = time.perf_counter()
+        INFERENCE_SECONDS.labels(camera_id).observe(inferred - started)
+        self.last_results = results
         
-        # Check if fall is detected
-        fall_detected = False
-        for r in results:
-            for c in r.boxes.cls:
-                class_name = r.names[int(c)]
-                if class_name == 'fall':
-                    fall_detected = True
-                    break
+        # Follow each person and time their fall separately
+        self.people = self.track_people(results[0])
+        POSE_SECONDS.labels(camera_id).observe(time.perf_counter() - inferred)
+        PEOPLE.labels(camera_id).set(len(self.people))
+
+        # A person on the floor keeps the scheduler at full rate
+        self.fall_in_view = any(person['pose'] == "LYING" for person in self.people)
         
-        # Send alert if fall is detected and cooldown period has passed
-        current_time = datetime.now()
-        if fall_detected and (not self.fall_detected or 
-                             (self.last_alert_time and 
-                              (current_time - self.last_alert_time).total_seconds() > self.alert_cooldown)):
-            self.fall_detected = True
-            self.last_alert_time = current_time
+        # Publish once when someone is newly confirmed fallen; repeats and
+        # flapping are collapsed into incidents by the alerting side
+        fallen_ids = {person['id'] for person in self.people if person['fallen']}
+        if fallen_ids - self.alerted_people:
+            FALLS.labels(camera_id).inc(len(fallen_ids - self.alerted_people))
             self.send_fall_alert(camera_id)
-        elif not fall_detected:
-            self.fall_detected = False
-        
+        self.alerted_people = fallen_ids
+        return True
+
+    def annotate(self, frame):
+        """Draw the latest detections, person IDs and fall banner onto frame."""
+        if self.last_results is None:
+            return frame
+        annotated_frame = self.last_results[0].plot(img=frame)
+        for person in self.people:
+            x1, y1 = person['box'][:2]
+            cv2.putText(annotated_frame, f"ID {person['id']}", (x1, y1 + 15),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+        if any(person['fallen'] for person in self.people):
+            cv2.putText(annotated_frame, "FALL DETECTED", (50, 50),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
         return annotated_frame
 
+    def overlay(self, frame_shape):
+        """Latest detections for drawing client-side, with boxes as fractions of the frame."""
+        height, width = frame_shape[:2]
+        return {
+            'people': [{
+                'id': person['id'],
+                'box': [round(person['box'][0] / width, 4), round(person['box'][1] / height, 4),
+                        round(person['box'][2] / width, 4), round(person['box'][3] / height, 4)],
+                'class': person['class'],
+                'pose': person['pose'],
+                'fallen': person['fallen']
+            } for person in self.people],
+            'fall': any(person['fallen'] for person in self.people)
+        }
+
+    def track_people(self, result, now=None):
+        # now overrides the clock, e.g. with the video time of a recorded frame
+        boxes = result.boxes
+        keep = (boxes.conf >= self.confidence_threshold).cpu().numpy()
+        xyxy = boxes.xyxy.cpu().numpy()[keep]
+        classes = [result.names[int(c)] for c in boxes.cls.cpu().numpy()[keep]]
+        keypoints = None
+        if result.keypoints is not None:
+            keypoints = result.keypoints.xy.cpu().numpy()[keep]
+
+        track_ids, evicted = self.tracker.update(xyxy, keypoints, now)
+        for person_id in evicted:
+            self.fall_detector.forget(person_id)
+
+        if keypoints is not None and len(keypoints):
+            poses, _ = self.fall_detector.determine_pose_batch(keypoints)
+        else:
+            poses = ["UNKNOWN"] * len(xyxy)
+
+        people = []
+        for person_id, box, class_name, pose in zip(track_ids.tolist(), xyxy, classes, poses):
+            # The model's own 'fall' class counts as lying on the floor
+            pose = "LYING" if class_name == 'fall' else str(pose)
+            people.append({
+                'id': person_id,
+                'box': [int(v) for v in box],
+                'class': class_name,
+                'pose': pose,
+                'fallen': self.fall_detector.detect_fall(person_id, pose, now)
+            })
+        return people
+
+    def infer(self, frame):
+        if self.region_planner is None:
+            return self.engine.infer(frame)
+
+        # Between full scans, only look at padded crops around known people
+        regions = self.region_planner.plan(frame.shape)
+        if regions is None:
+            results = self.engine.infer(frame)
+        else:
+            futures = [
+                self.engine.submit(frame[y1:y2, x1:x2], imgsz=self.region_planner.imgsz)
+                for x1, y1, x2, y2 in regions
+            ]
+            crop_results = [future.result()[0] for future in futures]
+            results = [merge_crop_results(frame, crop_results, regions)]
+
+        boxes = results[0].boxes
+        confident = boxes.xyxy[boxes.conf >= self.confidence_threshold]
+        self.region_planner.update(confident.tolist(), regions, frame.shape)
+        return results
+
     def send_fall_alert(self, camera_id):
-        """Send an alert to the server when a fall is detected"""
-        try:
-            # Get the first user ID (in a real app, you'd determine which user to alert)
-            # For testing, we'll use user ID 1
-            user_id = 1
-            
-            # Send alert to the server
-            response = requests.post(
-                f'http://127.0.0.1:5000/send_alert/{user_id}',
-                data={
-                    'location': f'Camera {camera_id}',
-                    'severity': 'High'
-                }
-            )
-            
-            if response.status_code == 200:
-                print(f"Alert sent successfully for camera {camera_id}")
-            else:
-                print(f"Failed to send alert: {response.status_code}")
-                
-        except Exception as e:
-            print(f"Error sending fall alert: {e}")
+        """Publish a fall event; subscribers store it, notify viewers and alert contacts"""
+        if self.event_bus is None:
+            print(f"Fall detected on camera {camera_id} but no event bus is attached")
+            return
+        
+        self.event_bus.publish('fall_detected', {
+            'camera_id': camera_id,
+            'user_id': self.user_id,
+            'location': f'Camera {camera_id}',
+            'severity': 'High',
+            'timestamp': datetime.utcnow(),
+            'person_ids': [person['id'] for person in self.people if person['fallen']]
+        })
 
 class VideoStreamer:
-    def __init__(self, esp32_cam, video_processor):
-        self.esp32_cam = esp32_cam
-        self.video_processor = video_processor
+    """Shares one capture/inference/encode pipeline per camera between all its viewers.
 
-    def start(self):
-        self.esp32_cam.start()
+    The first viewer of a camera starts its pipeline, every later viewer
+    subscribes to the same encoded frames, and the pipeline shuts down once
+    the last viewer leaves.
+    """
 
-    def stop(self):
-        self.esp32_cam.stop()
+    def __init__(self, profiles=None, passthrough=False, on_overlay=None, decode_scale=1):
+        self.lock = Lock()
+        self.pipelines = {}
+        self.profiles = profiles  # encode profiles by name, see encoder.DEFAULT_PROFILES
+        # Forward camera JPEGs as-is and send detections to on_overlay (see CameraPipeline)
+        self.passthrough = passthrough
+        self.on_overlay = on_overlay
+        self.decode_scale = decode_scale
 
-    def generate_frames(self):
-        self.start()
+    def subscribe(self, camera_id, source_factory, video_processor=None, profile='full'):
+        with self.lock:
+            pipeline = self.pipelines.get(camera_id)
+            if pipeline is None:
+                pipeline = CameraPipeline(camera_id, source_factory(), video_processor,
+                                          profiles=self.profiles, passthrough=self.passthrough,
+                                          on_overlay=self.on_overlay, decode_scale=self.decode_scale)
+                pipeline.start()
+                self.pipelines[camera_id] = pipeline
+            return pipeline, pipeline.subscribe(profile)
+
+    def unsubscribe(self, camera_id, pipeline, slot):
+        with self.lock:
+            remaining = pipeline.unsubscribe(slot)
+            if remaining > 0:
+                return
+            if self.pipelines.get(camera_id) is pipeline:
+                del self.pipelines[camera_id]
+        # Last viewer left: release the camera outside the lock
+        pipeline.stop()
+
+    def close(self, camera_id):
+        """Stop a camera's pipeline, e.g. because its source changed."""
+        with self.lock:
+            pipeline = self.pipelines.pop(camera_id, None)
+        if pipeline:
+            pipeline.stop()
+
+    def get_stats(self):
+        with self.lock:
+            pipelines = dict(self.pipelines)
+        return {camera_id: pipeline.get_stats() for camera_id, pipeline in pipelines.items()}
+
+    def generate_frames(self, camera_id, source_factory, video_processor=None, profile='full'):
+        pipeline, slot = self.subscribe(camera_id, source_factory, video_processor, profile)
         try:
-            while True:
-                frame = self.esp32_cam.get_frame()
-                if frame is not None:
-                    processed_frame = self.video_processor.process_frame(frame)
-                    _, buffer = cv2.imencode('.jpg', processed_frame)
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-                else:
-                    time.sleep(0.01)
+            with label_thread(f'camera-{camera_id}-viewer'):
+                yield from pipeline.frames(slot)
         finally:
-            self.stop()
-            
-class FileVideoStreamer:
+            self.unsubscribe(camera_id, pipeline, slot)
+
+class FileVideoStreamer(FrameSource):
+    """Frame source over the already-processed frames of an uploaded video."""
+
     def __init__(self, frame_queue):
         self.frame_queue = frame_queue
 
     def get_frame(self):
-        while True:
-            if not self.frame_queue.empty():
-                frame = self.frame_queue.get()
-                _, buffer = cv2.imencode('.jpg', frame)
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-            else:
-                time.sleep(0.01)
+        try:
+            return self.frame_queue.get_nowait()
+        except queue.Empty:
+            return None
@@ -0,0 +1,375 @@
+import itertools
+import multiprocessing
+import queue
+import sys
+import time
+import types
+import numpy as np
+from concurrent.futures import Future
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+from threading import Thread, Event, Lock
+from sources import Backoff
+
+# Room for one 1080p BGR frame per slot; larger frames are sent inline
+DEFAULT_SLOT_BYTES = 1920 * 1080 * 3
+
+spawn_lock = Lock()
+
+@contextmanager
+def bare_main():
+    """Start spawned processes without re-running the parent's main script.
+
+    A spawned child first imports the parent's __main__ (main.py, with the
+    whole app setup) as __mp_main__. Workers only need this module, so
+    while they are started __main__ is an empty module and they skip it.
+    """
+    with spawn_lock:
+        main = sys.modules['__main__']
+        sys.modules['__main__'] = types.ModuleType('__main__')
+        try:
+            yield
+        finally:
+            sys.modules['__main__'] = main
+
+class SharedFrameRing:
+    """Fixed-size frame slots in one shared memory block.
+
+    The process that creates the ring writes frames into free slots; worker
+    processes attach by name and read them in place, so frames cross the
+    process boundary without being pickled.
+    """
+
+    def __init__(self, slots, slot_bytes, name=None):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner,
+                                              size=slots * slot_bytes if self.owner else 0)
+        self.name = self.shm.name
+
+    def fits(self, frame):
+        return frame.nbytes <= self.slot_bytes
+
+    def write(self, slot, frame):
+        # One copy, which also packs non-contiguous crops
+        np.copyto(self.view(slot, frame.shape, frame.dtype), frame)
+
+    def view(self, slot, shape, dtype):
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+def _worker_main(index, model, max_batch_size, max_wait, ring_name, slots, slot_bytes, requests, conn):
+    # Runs in the worker process: an InferenceEngine fed from the shared ring
+    from inference import InferenceEngine
+
+    ring = SharedFrameRing(slots, slot_bytes, name=ring_name)
+    engine = InferenceEngine(model, max_batch_size=max_batch_size, max_wait=max_wait)
+    send_lock = Lock()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    def reply(request_id, future):
+        try:
+            result = future.result()[0]
+        except Exception as e:
+            send(('result', request_id, None, None, repr(e)))
+            return
+        # Only the detections travel back; the parent already has the frame
+        keypoints = result.keypoints.data.cpu().numpy() if result.keypoints is not None else None
+        send(('result', request_id, result.boxes.data.cpu().numpy(), keypoints, None))
+
+    engine.warmup()
+    send(('ready', index, engine.names))
+    try:
+        while True:
+            message = requests.get()
+            if message is None:
+                break
+            request_id, slot, shape, dtype, frame, imgsz = message
+            if frame is None:
+                frame = ring.view(slot, shape, dtype)
+            future = engine.submit(frame, imgsz)
+            future.add_done_callback(lambda future, request_id=request_id: reply(request_id, future))
+    finally:
+        engine.stop()
+        ring.close()
+        conn.close()
+
+class WorkerHandle:
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.requests = None
+        self.conn = None
+        self.in_flight = set()  # request ids sent to this process
+        self.ready = False
+        self.restarts = 0
+        self.restart_at = None
+        self.backoff = Backoff(base=1.0, maximum=30.0)
+
+class ProcessInferenceEngine:
+    """Drop-in InferenceEngine that runs the model in a pool of worker processes.
+
+    Each worker process loads its own model and micro-batches like
+    InferenceEngine, so pre/post-processing runs outside the web process
+    and its GIL. Frames are written once into a SharedFrameRing and only
+    their slot number is queued; detections come back over a pipe per
+    worker and are rebuilt into Results here. Requests go to the worker
+    with the fewest in flight. A supervisor thread restarts workers that
+    exit, with backoff, and fails their in-flight requests.
+    """
+
+    def __init__(self, model, workers=2, max_batch_size=4, max_wait=0.02,
+                 ring_slots=32, slot_bytes=DEFAULT_SLOT_BYTES, names_timeout=120.0):
+        self.model = model  # a ModelBackend or weights path, passed on to each worker's InferenceEngine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.ring_slots = ring_slots
+        self.slot_bytes = slot_bytes
+        self.names_timeout = names_timeout  # seconds to wait for the first worker to load the model
+        # Forking a process that runs camera threads is unsafe; start clean interpreters
+        self.context = multiprocessing.get_context('spawn')
+        self.workers = [WorkerHandle(index) for index in range(workers)]
+        self.lock = Lock()
+        self.pending = {}  # request id -> (future, frame, slot, worker)
+        self.request_ids = itertools.count()
+        self.ring = None
+        self.free_slots = queue.Queue()
+        self.names_ready = Event()
+        self._names = None
+        self.should_stop = False
+        self.supervisor_thread = None
+        self.inline = 0  # frames pickled because the ring was full or the frame too big
+        self.failed = 0
+
+    @property
+    def names(self):
+        self.start()
+        if not self.names_ready.wait(self.names_timeout):
+            raise RuntimeError('No inference worker became ready')
+        return self._names
+
+    def warmup(self):
+        """Start every worker and wait until they have all loaded the model; they load in parallel."""
+        self.start()
+        deadline = time.monotonic() + self.names_timeout
+        while not all(worker.ready for worker in self.workers):
+            if time.monotonic() >= deadline:
+                raise RuntimeError('Inference workers did not become ready')
+            time.sleep(0.1)
+
+    def start(self):
+        with self.lock:
+            if self.ring is not None:
+                return  # running, or stop() has not finished yet
+            self.should_stop = False
+            self.ring = SharedFrameRing(self.ring_slots, self.slot_bytes)
+            for slot in range(self.ring_slots):
+                self.free_slots.put(slot)
+            for worker in self.workers:
+                self._spawn(worker)
+            self.supervisor_thread = Thread(target=self._supervise, name='inference-supervisor', daemon=True)
+            self.supervisor_thread.start()
+
+    def stop(self):
+        with self.lock:
+            if self.supervisor_thread is None:
+                return
+            self.should_stop = True  # submit() fails new requests from here on
+            thread, self.supervisor_thread = self.supervisor_thread, None
+        thread.join()
+
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.requests.put(None)
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.join(timeout=5)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+                    worker.process.join()
+
+        # Every worker has exited, so none can still be reading the slots being freed
+        with self.lock:
+            left = []
+            for worker in self.workers:
+                left.extend(self._take_in_flight(worker))
+                if worker.conn is not None:
+                    worker.conn.close()
+                worker.process = worker.conn = worker.requests = None
+                worker.ready = False
+                worker.restart_at = None
+        self._fail(left, 'Inference engine stopped')
+
+        with self.lock:
+            self.ring.close()
+            self.ring = None
+            self.free_slots = queue.Queue()
+
+    def submit(self, frame, imgsz=None):
+        """Queue a frame for inference and return a Future for its results."""
+        self.start()
+        future = Future()
+        slot = None
+        with self.lock:
+            if self.should_stop:
+                workers = []
+                reason = 'Inference engine stopped'
+            else:
+                # A dead worker's queue is never read again, so only live ones take requests
+                workers = [worker for worker in self.workers if worker.conn is not None]
+                reason = 'No inference worker is running'
+            if workers:
+                if self.ring.fits(frame):
+                    try:
+                        slot = self.free_slots.get_nowait()
+                    except queue.Empty:
+                        pass
+                if slot is not None:
+                    # Under the lock, so stop() cannot close the ring mid-copy
+                    self.ring.write(slot, frame)
+                else:
+                    self.inline += 1
+                request_id = next(self.request_ids)
+                # Least loaded worker, preferring ones whose model has loaded
+                worker = min(workers, key=lambda w: (not w.ready, len(w.in_flight)))
+                worker.in_flight.add(request_id)
+                self.pending[request_id] = (future, frame, slot, worker)
+                requests = worker.requests
+        if not workers:
+            self._fail([(future, frame, None, None)], reason)
+            return future
+        requests.put((request_id, slot, frame.shape, frame.dtype.str,
+                      frame if slot is None else None, imgsz))
+        return future
+
+    def infer(self, frame, imgsz=None, timeout=None):
+        return self.submit(frame, imgsz).result(timeout=timeout)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'workers': [{
+                    'pid': worker.process.pid if worker.process is not None else None,
+                    'alive': worker.process is not None and worker.process.is_alive(),
+                    'ready': worker.ready,
+                    'in_flight': len(worker.in_flight),
+                    'restarts': worker.restarts
+                } for worker in self.workers],
+                'free_slots': self.free_slots.qsize(),
+                'inline': self.inline,
+                'failed': self.failed
+            }
+
+    def _spawn(self, worker):
+        # Called with self.lock held. Returns the requests still in flight on the old process,
+        # for the caller to fail once the lock is released.
+        left = self._take_in_flight(worker)
+        worker.requests = self.context.Queue()
+        receiver, sender = self.context.Pipe(duplex=False)
+        worker.process = self.context.Process(
+            target=_worker_main,
+            args=(worker.index, self.model, self.max_batch_size, self.max_wait,
+                  self.ring.name, self.ring_slots, self.slot_bytes, worker.requests, sender),
+            name=f'inference-worker-{worker.index}',
+            daemon=True
+        )
+        with bare_main():
+            worker.process.start()
+        sender.close()  # the worker holds the only write end, so its exit reads as EOF
+        worker.conn = receiver
+        worker.ready = False
+        worker.restart_at = None
+        return left
+
+    def _supervise(self):
+        while not self.should_stop:
+            with self.lock:
+                connections = {worker.conn: worker for worker in self.workers if worker.conn is not None}
+            for conn in wait(list(connections), timeout=0.2):
+                worker = connections[conn]
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    self._worker_exited(worker)
+                    continue
+                if message[0] == 'ready':
+                    self._names = message[2]
+                    self.names_ready.set()
+                    worker.ready = True
+                    worker.backoff.reset()
+                else:
+                    self._complete(*message[1:])
+
+            now = time.monotonic()
+            left = []
+            with self.lock:
+                for worker in self.workers:
+                    if worker.restart_at is not None and now >= worker.restart_at and not self.should_stop:
+                        print(f"Restarting inference worker {worker.index}")
+                        worker.restarts += 1
+                        left.extend(self._spawn(worker))
+            self._fail(left, 'Inference worker restarted')
+
+    def _complete(self, request_id, boxes, keypoints, error):
+        import torch  # only the workers load the model, but results are rebuilt here
+        from ultralytics.engine.results import Results
+
+        with self.lock:
+            entry = self.pending.pop(request_id, None)
+            if entry is None:
+                return  # already failed when its worker exited
+            future, frame, slot, worker = entry
+            worker.in_flight.discard(request_id)
+        if slot is not None:
+            self.free_slots.put(slot)
+        if error is not None:
+            self.failed += 1
+            future.set_exception(RuntimeError(f'Inference failed in worker {worker.index}: {error}'))
+            return
+        future.set_result([Results(
+            frame,
+            path='',
+            names=self._names,
+            boxes=torch.from_numpy(boxes),
+            keypoints=torch.from_numpy(keypoints) if keypoints is not None else None
+        )])
+
+    def _worker_exited(self, worker):
+        worker.process.join()
+        exitcode = worker.process.exitcode
+        delay = worker.backoff.next_delay()
+        print(f"Inference worker {worker.index} exited with code {exitcode}, restarting in {delay:.1f}s")
+        worker.conn.close()
+        with self.lock:
+            worker.conn = None
+            worker.ready = False
+            worker.restart_at = time.monotonic() + delay
+        self._fail_in_flight(worker, f'Inference worker {worker.index} exited with code {exitcode}')
+
+    def _fail_in_flight(self, worker, reason):
+        with self.lock:
+            entries = self._take_in_flight(worker)
+        self._fail(entries, reason)
+
+    def _take_in_flight(self, worker):
+        # Called with self.lock held
+        entries = [self.pending.pop(request_id) for request_id in worker.in_flight
+                   if request_id in self.pending]
+        worker.in_flight.clear()
+        return entries
+
+    def _fail(self, entries, reason):
+        for future, _, slot, _ in entries:
+            if slot is not None:
+                self.free_slots.put(slot)
+            self.failed += 1
+            future.set_exception(RuntimeError(reason))